@@ -1,7 +1,14 @@
-from fastapi import FastAPI, HTTPException
+import time
+IMPORT_START = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from datetime import date
+from typing import List, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
 import os
 import sys
 
@@ -9,19 +16,100 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from src.cash_service import CashService
+from src.metrics import METRICS, PROFILER
+from src.push_feed import HEARTBEAT_SECONDS, UpdateFeed
+from src.sessions import SessionLimitError, SessionManager
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
+STARTUP_TARGET_SECONDS = 2.0 # Time-to-first-request budget (imports + service init)
+EVICTION_INTERVAL_SECONDS = 60
 
 class ConfigRequest(BaseModel):
-    risk_tolerance: str
+    risk_tolerance: Optional[str] = None
+    optimizer_mode: Optional[Literal['greedy', 'min_cost']] = None
 
 # Global
-SERVICE = None
+SERVICE = None  # The main simulation (requests without a session)
+FEED = None
+SESSIONS = None
+SESSION_FEEDS = {} # session service -> UpdateFeed, started by the session's first /stream
+
+def service_for(request):
+    """
+    The service a request works on: its session's (X-Session-ID header, or
+    ?session= for EventSource clients, which cannot set headers), else the main one.
+    """
+    if SERVICE is None: raise HTTPException(status_code=503)
+    session_id = request.headers.get('x-session-id') or request.query_params.get('session')
+    if not session_id:
+        return SERVICE
+    try:
+        return SESSIONS.get(session_id).service
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found (expired or deleted)")
+
+def feed_for(service):
+    if service is SERVICE:
+        return FEED
+    if service not in SESSION_FEEDS:
+        SESSION_FEEDS[service] = UpdateFeed(service)
+        SESSION_FEEDS[service].start()
+    return SESSION_FEEDS[service]
+
+async def stop_session_feeds(sessions):
+    for session in sessions:
+        feed = SESSION_FEEDS.pop(session.service, None)
+        if feed is not None:
+            await feed.stop()
+
+async def evict_idle_sessions():
+    while True:
+        await asyncio.sleep(EVICTION_INTERVAL_SECONDS)
+        await stop_session_feeds(await asyncio.to_thread(SESSIONS.evict_idle))
+
+async def run_write(service, write_method, *args):
+    """Runs a service write on its single writer thread without blocking the event loop."""
+    return await asyncio.wrap_future(service.submit(write_method, *args))
+
+def cached_read(service, request, response, read_method, *args):
+    """
+    Serves a read from the service's versioned cache with an ETag.
+    Answers 304 Not Modified when the client's If-None-Match still matches.
+    """
+    etag = service.etag()
+    client_tags = [t.strip().removeprefix('W/') for t in request.headers.get('if-none-match', '').split(',')]
+    if etag in client_tags or '*' in client_tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    etag, result = service.cached(read_method, *args)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache" # Clients must revalidate (cheap 304s)
+    return result
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global SERVICE
+    global SERVICE, FEED, SESSIONS
     print("Initializing CashCycle Service...")
+    start = time.perf_counter()
     SERVICE = CashService()
+    FEED = UpdateFeed(SERVICE)
+    FEED.start()
+    SESSIONS = SessionManager(SERVICE)
+    eviction = asyncio.create_task(evict_idle_sessions())
+    SERVICE.timings.update(
+        imports=IMPORT_SECONDS,
+        service_init=time.perf_counter() - start,
+        time_to_ready=time.perf_counter() - IMPORT_START
+    )
+    phases = ", ".join(f"{k}={v:.3f}s" for k, v in SERVICE.timings.items() if isinstance(v, float))
+    print(f"Startup timings: {phases}")
+    if SERVICE.timings['time_to_ready'] > STARTUP_TARGET_SECONDS:
+        print(f"WARNING: startup took longer than the {STARTUP_TARGET_SECONDS}s target")
     yield
+    eviction.cancel()
+    await stop_session_feeds(list(SESSIONS.sessions.values()))
+    SESSIONS.close_all()
+    await FEED.stop()
+    SERVICE.close()
 
 app = FastAPI(title="CashCycle Ops API", version="3.0", lifespan=lifespan)
 
@@ -34,59 +122,302 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Times every request into a per-route latency histogram (and feeds the slow-request profiler)."""
+    profiler = PROFILER.begin()
+    start = time.perf_counter()
+    status = 500 # Unless the handler returns a response
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Also on errors: a profiler left running would block every later capture
+        elapsed = time.perf_counter() - start
+        route = request.scope.get('route')
+        path = route.path if route is not None else 'unmatched'
+        METRICS.observe('atm_http_request_duration_seconds', elapsed,
+                        method=request.method, route=path, status=str(status))
+        if profiler is not None:
+            PROFILER.end(profiler, f"{request.method} {path}", elapsed * 1000)
+
 @app.get("/")
 def read_root():
     return {"status": "System Operational", "service": "CashCycle Ops Command Center"}
 
+# Reads are lock-free snapshot reads, cached per state version and served with ETags.
+# The cheap ones run directly on the event loop; /predict is CPU-heavy, so it stays
+# a sync handler (FastAPI's threadpool).
+
+# Sessions: each analyst gets a private simulation forked from the main one.
+# Send X-Session-ID on any simulation, checkpoint or read endpoint to use it.
+
+@app.post("/sessions")
+async def create_session():
+    """Starts a private simulation (forked from the main one's current state)."""
+    if SERVICE is None: raise HTTPException(status_code=503)
+    try:
+        session, evicted = await asyncio.to_thread(SESSIONS.create)
+    except SessionLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    await stop_session_feeds(evicted)
+    return session.stats()
+
+@app.get("/sessions")
+def list_sessions():
+    """Live sessions with per-session stats (activity, rows and memory of their own)."""
+    if SERVICE is None: raise HTTPException(status_code=503)
+    return SESSIONS.stats()
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str):
+    if SERVICE is None: raise HTTPException(status_code=503)
+    session = SESSIONS.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    return session.stats()
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if SERVICE is None: raise HTTPException(status_code=503)
+    try:
+        session = await asyncio.to_thread(SESSIONS.close, session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found")
+    await stop_session_feeds([session])
+    return {"message": f"Session '{session_id}' closed"}
+
 @app.get("/network-status")
-def get_network_status():
+async def get_network_status(request: Request, response: Response):
     """Returns high-level stats AND chart history."""
-    if SERVICE is None: return {"error": "System initializing"}
-    return SERVICE.get_status()
+    service = service_for(request)
+    return cached_read(service, request, response, service.get_status)
 
 @app.post("/predict")
-def predict_forecast():
-    """Generates forecast based on CURRENT config."""
-    if SERVICE is None: raise HTTPException(status_code=503)
-    return SERVICE.get_forecast()
+def predict_forecast(request: Request, response: Response, horizon: int = Query(1, ge=1, le=30)):
+    """Generates forecast based on CURRENT config (?horizon=N forecasts N days ahead)."""
+    service = service_for(request)
+    result = cached_read(service, request, response, service.get_forecast, horizon)
+    if isinstance(result, dict) and "error" in result:
+        raise HTTPException(status_code=503, detail=result["error"])
+    return result
+
+@app.get("/stream")
+async def stream_updates(request: Request):
+    """
+    Server-Sent Events: a snapshot of the dashboard (status + forecast), then a
+    compact delta after every change (advance, event, config, reset, model swap).
+    Replaces polling /network-status and /predict.
+    """
+    feed = feed_for(service_for(request))
+    queue = feed.subscribe(request.headers.get('last-event-id'))
+
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if message is None: # Feed stopped (session closed or shutdown)
+                    break
+                yield message
+        finally:
+            feed.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class CalendarEvent(BaseModel):
+    date: date
+    type: str
+    atm_ids: Optional[List[int]] = None # None = the whole fleet
+
+class AdvanceRequest(BaseModel):
+    events: List[CalendarEvent] = []
+
+def event_calendar(events):
+    """Request events -> the engine's {date: {atm_id or None: event type}} calendar."""
+    calendar = {}
+    for e in events:
+        day = calendar.setdefault(str(e.date), {})
+        for atm_id in e.atm_ids if e.atm_ids is not None else [None]:
+            day[atm_id] = e.type
+    return calendar
 
 @app.post("/simulate/advance")
-def advance_simulation():
-    if SERVICE is None: raise HTTPException(status_code=503)
-    new_date = SERVICE.advance_simulation()
-    return {"message": "Simulation Advanced", "new_date": str(new_date.date())}
+async def advance_simulation(request: Request, days: int = Query(1, ge=1, le=3650), body: Optional[AdvanceRequest] = None):
+    """Advances one day, or fast-forwards ?days=N in one step (optional event calendar in the body)."""
+    service = service_for(request)
+    calendar = event_calendar(body.events) if body else None
+    try:
+        new_date = await run_write(service, service.advance_simulation, days, calendar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Simulation Advanced", "new_date": str(new_date.date()), "days": days}
 
 @app.post("/simulate/reset")
-def reset_simulation():
-    if SERVICE is None: raise HTTPException(status_code=503)
-    SERVICE.reset_simulation()
+async def reset_simulation(request: Request):
+    service = service_for(request)
+    await run_write(service, service.reset_simulation)
     return {"message": "Simulation Reset"}
 
 class EventRequest(BaseModel):
     type: str
 
 @app.post("/simulate/event")
-def inject_event(event: EventRequest):
+async def inject_event(request: Request, event: EventRequest):
     """Schedules a shock event (FESTIVAL, STORM) for the next day."""
-    if SERVICE is None: raise HTTPException(status_code=503)
-    return SERVICE.inject_event(event.type)
+    service = service_for(request)
+    return await run_write(service, service.inject_event, event.type)
+
+class CheckpointRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+
+class BranchRequest(BaseModel):
+    save_current_as: Optional[str] = Field(None, min_length=1, max_length=64)
+
+@app.post("/checkpoints")
+async def create_checkpoint(request: Request, checkpoint: CheckpointRequest):
+    """Names the current simulation state (instant; shares history with the live state)."""
+    service = service_for(request)
+    try:
+        return await run_write(service, service.create_checkpoint, checkpoint.name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/checkpoints")
+def list_checkpoints(request: Request):
+    service = service_for(request)
+    return {"checkpoints": service.list_checkpoints()}
+
+@app.post("/checkpoints/{name}/restore")
+async def restore_checkpoint(request: Request, name: str):
+    """Rolls the simulation back to a checkpoint (the current state is dropped)."""
+    service = service_for(request)
+    try:
+        return await run_write(service, service.restore_checkpoint, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint '{name}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/checkpoints/{name}/branch")
+async def branch_checkpoint(request: Request, name: str, branch: Optional[BranchRequest] = None):
+    """Checkpoints the current state (as save_current_as), then switches to checkpoint `name`."""
+    service = service_for(request)
+    try:
+        return await run_write(service, service.branch_checkpoint, name, branch.save_current_as if branch else None)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint '{name}' not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/checkpoints/{name}")
+async def delete_checkpoint(request: Request, name: str):
+    service = service_for(request)
+    try:
+        return await run_write(service, service.delete_checkpoint, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Checkpoint '{name}' not found")
+
+class ScenarioEvent(BaseModel):
+    day: int = Field(..., ge=1) # 1 = the next simulated day
+    type: str
+
+class ScenarioRequest(BaseModel):
+    horizon_days: int = Field(14, ge=1, le=90)
+    runs: int = Field(1000, ge=1, le=20000)
+    events: List[ScenarioEvent] = []
+    seed: Optional[int] = None
+    opening_cash: Optional[float] = Field(None, ge=0)
+
+@app.post("/simulate/scenario")
+def run_scenario(request: Request, scenario: ScenarioRequest):
+    """Monte Carlo what-if: stockout probability and percentiles per ATM under an event calendar."""
+    service = service_for(request)
+    events = {e.day: e.type for e in scenario.events}
+    try:
+        return service.run_scenario(scenario.horizon_days, scenario.runs, events, scenario.seed, scenario.opening_cash)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/config")
-def update_config(config: ConfigRequest):
+async def update_config(request: Request, config: ConfigRequest):
     """Updates operational thresholds."""
-    if SERVICE is None: raise HTTPException(status_code=503)
-    new_settings = SERVICE.update_config(config.dict())
+    service = service_for(request)
+    new_settings = await run_write(service, service.update_config, config.dict(exclude_none=True))
     return {"message": "Config Updated", "config": new_settings}
 
 @app.get("/atm/{atm_id}")
-def get_atm_detail(atm_id: int):
-    """Returns detailed data for a specific ATM."""
-    if SERVICE is None: raise HTTPException(status_code=503)
-    result = SERVICE.get_atm_detail(atm_id)
-    if "error" in result:
+async def get_atm_detail(
+    request: Request,
+    response: Response,
+    atm_id: int,
+    start: Optional[date] = Query(None, alias="from"),
+    end: Optional[date] = Query(None, alias="to"),
+):
+    """Returns detailed data for a specific ATM (history window: ?from=YYYY-MM-DD&to=YYYY-MM-DD, default last 30 days)."""
+    service = service_for(request)
+    result = cached_read(service, request, response, service.get_atm_detail, atm_id, start, end)
+    if isinstance(result, dict) and "error" in result:
         raise HTTPException(status_code=404, detail=result["error"])
     return result
 
+@app.get("/model/status")
+def get_model_status(request: Request):
+    """Background retraining status, trigger policy and timings (of the request's session, if any)."""
+    return service_for(request).get_model_status()
+
+@app.post("/model/retrain")
+async def retrain_model(request: Request):
+    """Starts a background retrain on the days the model has not seen yet (not from a session)."""
+    service = service_for(request)
+    try:
+        return await run_write(service, service.retrain_model)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/startup")
+def get_startup_timings():
+    """Per-phase startup timings (seconds) against the time-to-first-request target."""
+    if SERVICE is None: raise HTTPException(status_code=503)
+    timings = dict(SERVICE.timings)
+    return {
+        "timings": timings,
+        "target_seconds": STARTUP_TARGET_SECONDS,
+        "within_target": timings['time_to_ready'] <= STARTUP_TARGET_SECONDS
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus text format: stage/route latency histograms, row counters, memory and cache stats."""
+    gauges = SERVICE.metric_gauges() + FEED.metric_gauges() + SESSIONS.metric_gauges() if SERVICE is not None else []
+    return PlainTextResponse(METRICS.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profile")
+def arm_profiler(min_ms: float = Query(500, ge=0), interval_ms: float = Query(5, gt=0)):
+    """Opt-in: profiles the next request slower than `min_ms` with a sampling profiler."""
+    PROFILER.arm(min_ms, interval_ms)
+    return PROFILER.status()
+
+@app.get("/debug/profile")
+def get_profile():
+    """The captured slow-request profile in folded-stack format (for flamegraph tools)."""
+    if PROFILER.capture is None:
+        raise HTTPException(status_code=404, detail="No profile captured yet")
+    capture = PROFILER.capture
+    header = f"# {capture['route']} {capture['duration_ms']} ms at {capture['captured_at']}\n"
+    return PlainTextResponse(header + capture['folded'])
+
+@app.get("/cache/stats")
+def get_cache_stats(request: Request):
+    """Response cache hit/miss counters."""
+    service = service_for(request)
+    return {**service.cache.stats(), "version": service.view.version}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,64 @@
+"""
+Compact schema check: memory of the history before/after the compact dtypes
+(schema.COMPACT_DTYPES) and forecast parity between the two.
+
+The same generated fleet is built twice, with the wide dtypes (object strings,
+int64, float64) and with the compact ones. A model is trained on each and
+both forecast the next days from their own feature tails; the run exits with
+status 1 if any forecast differs by more than --tolerance rupees.
+
+Usage (from the repository root):
+    python backend/benchmarks/check_compact_schema.py
+    python backend/benchmarks/check_compact_schema.py --atms 5000 --days 1095
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from src.data_generator import generate_fleet_data
+from src.features import add_advanced_features, build_feature_tail
+from src.model_trainer import train_model
+from src.optimizer import forecast_horizon
+from src.schema import memory_report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--atms', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--horizon', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=1.0, help='max forecast difference (Rs)')
+    args = parser.parse_args()
+
+    # 1. Same data, wide and compact dtypes
+    wide = add_advanced_features(generate_fleet_data(args.days, args.atms, compact=False), compact=False)
+    compact = add_advanced_features(generate_fleet_data(args.days, args.atms))
+
+    # 2. Memory
+    before, after = memory_report(wide), memory_report(compact)
+    print(f"History memory ({args.atms} ATMs x {args.days} days, {len(wide)} rows):")
+    print(f"  {'column':<20} {'before':>12} {'after':>12}  dtype")
+    for col in wide.columns:
+        print(f"  {col:<20} {before['columns'][col] / 1e6:>10.2f}MB {after['columns'][col] / 1e6:>10.2f}MB"
+              f"  {wide[col].dtype} -> {compact[col].dtype}")
+    print(f"  {'TOTAL':<20} {before['total_bytes'] / 1e6:>10.2f}MB {after['total_bytes'] / 1e6:>10.2f}MB"
+          f"  ({1 - after['total_bytes'] / before['total_bytes']:.0%} smaller)")
+
+    # 3. Forecast parity
+    forecasts = []
+    for df in (wide, compact):
+        model, _ = train_model(df)
+        forecasts.append(forecast_horizon(model, build_feature_tail(df), args.horizon)[2])
+    diff = float(np.abs(forecasts[0] - forecasts[1]).max())
+    print(f"Forecast parity ({args.horizon} days): max difference Rs {diff:.4f} (tolerance Rs {args.tolerance})")
+    if diff > args.tolerance:
+        print("!!! FORECASTS CHANGED WITH THE COMPACT SCHEMA !!!")
+        return 1
+    print("Forecasts unchanged.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Push vs polling load test: backend CPU per connected dashboard.
+
+Starts the API (uvicorn) on a throwaway copy of the history store and model,
+then runs three phases of --seconds each while one operator advances the
+simulation every --interval seconds (the dashboard's autoplay):
+
+    baseline  no dashboards (the cost of the writes themselves)
+    polling   --clients dashboards fetching /network-status and /predict
+              every --interval seconds (the previous frontend)
+    push      --clients dashboards subscribed to /stream (Server-Sent Events)
+
+The API process's CPU time is read from /proc (Linux) around each phase; the
+baseline is subtracted to get the CPU each dashboard adds.
+
+Usage (from the repository root):
+    python backend/benchmarks/load_test_push.py
+    python backend/benchmarks/load_test_push.py --clients 200 --seconds 30
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def process_cpu_seconds(pid):
+    """User + system CPU time of process `pid` (Linux /proc)."""
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+async def operator(client, interval, stop):
+    """Advances the simulation every `interval` seconds, like the dashboard's autoplay."""
+    steps = 0
+    while not stop.is_set():
+        await client.post('/simulate/advance')
+        steps += 1
+        await asyncio.sleep(interval)
+    return steps
+
+async def polling_dashboard(client, interval, stop, counts):
+    while not stop.is_set():
+        for method, path in (('GET', '/network-status'), ('POST', '/predict')):
+            response = await client.request(method, path)
+            counts['requests'] += 1
+            counts['bytes'] += len(response.content)
+        await asyncio.sleep(interval)
+
+async def push_dashboard(client, stop, counts):
+    async with client.stream('GET', '/stream', timeout=None) as response:
+        async for chunk in response.aiter_bytes():
+            counts['bytes'] += len(chunk)
+            counts['messages'] += chunk.count(b'\n\n')
+            if stop.is_set():
+                break
+
+async def run_phase(base_url, pid, mode, clients, seconds, interval):
+    counts = {'requests': 0, 'messages': 0, 'bytes': 0}
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=clients + 10, max_keepalive_connections=clients + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        tasks = []
+        if mode == 'polling':
+            tasks = [asyncio.create_task(polling_dashboard(client, interval, stop, counts)) for _ in range(clients)]
+        elif mode == 'push':
+            tasks = [asyncio.create_task(push_dashboard(client, stop, counts)) for _ in range(clients)]
+        await asyncio.sleep(1.0) # Let the dashboards connect
+        counts.update(requests=0, messages=0, bytes=0)
+
+        cpu_start, start = process_cpu_seconds(pid), time.perf_counter()
+        driver = asyncio.create_task(operator(client, interval, stop))
+        await asyncio.sleep(seconds)
+        stop.set()
+        steps = await driver
+        cpu = process_cpu_seconds(pid) - cpu_start
+        elapsed = time.perf_counter() - start
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return {'mode': mode, 'clients': clients if mode != 'baseline' else 0, 'cpu_seconds': cpu,
+            'elapsed': elapsed, 'steps': steps, **counts}
+
+def wait_until_ready(base_url, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(f'{base_url}/model/status').json().get('model_loaded'):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("API did not become ready")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=50, help='connected dashboards')
+    parser.add_argument('--seconds', type=float, default=20, help='length of each phase')
+    parser.add_argument('--interval', type=float, default=1.5, help='autoplay / polling interval (s)')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+    if not os.path.exists('/proc/self/stat'):
+        print("This load test reads process CPU time from /proc (Linux only).")
+        return 1
+
+    # 1. API on a throwaway store and model (the writes must not touch the real ones)
+    workdir = tempfile.mkdtemp(prefix='atm_push_load_')
+    model_path = os.path.join(workdir, 'xgb_model.json')
+    shutil.copy(os.path.join(BACKEND_DIR, 'models', 'xgb_model.json'), model_path)
+    env = {**os.environ, 'ATM_HISTORY_STORE': os.path.join(workdir, 'history'), 'ATM_MODEL_PATH': model_path}
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'api:app', '--app-dir', os.path.join(BACKEND_DIR, 'app'),
+         '--port', str(args.port), '--log-level', 'warning'],
+        env=env, cwd=os.path.join(BACKEND_DIR, '..'))
+    base_url = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_until_ready(base_url)
+
+        # 2. Phases
+        results = []
+        for mode in ('baseline', 'polling', 'push'):
+            print(f"Running {mode} ({args.clients if mode != 'baseline' else 0} dashboards, {args.seconds:.0f}s)...")
+            results.append(asyncio.run(run_phase(base_url, server.pid, mode, args.clients, args.seconds, args.interval)))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 3. Report
+    baseline = results[0]['cpu_seconds'] / results[0]['elapsed']
+    print(f"\nAPI CPU with one operator advancing every {args.interval}s:")
+    print(f"  {'mode':<9} {'dashboards':>10} {'steps':>6} {'requests':>9} {'messages':>9} {'MB sent':>8}"
+          f" {'CPU %':>7} {'CPU ms/s per dashboard':>23}")
+    per_dashboard = {}
+    for r in results:
+        cpu_rate = r['cpu_seconds'] / r['elapsed']
+        per = (cpu_rate - baseline) * 1000 / r['clients'] if r['clients'] else None
+        per_dashboard[r['mode']] = per
+        print(f"  {r['mode']:<9} {r['clients']:>10} {r['steps']:>6} {r['requests']:>9} {r['messages']:>9}"
+              f" {r['bytes'] / 1e6:>8.2f} {cpu_rate * 100:>6.1f}% {'-' if per is None else f'{per:.2f}':>23}")
+    if per_dashboard['push'] and per_dashboard['push'] > 0:
+        print(f"\nPush costs {per_dashboard['polling'] / per_dashboard['push']:.1f}x less CPU per dashboard than polling.")
+    else:
+        print("\nPush adds no measurable CPU per dashboard.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Benchmark suite for the generate -> feature -> train -> forecast -> optimize
+pipeline, the simulation engine and the main API endpoints.
+
+Every stage is timed (best of N runs) and memory-profiled (peak traced
+Python/NumPy allocations of one extra run; xgboost's native memory is not
+traced) for each fleet size x history length of the chosen profile.
+Results are written as JSON and compared against a stored baseline: any stage
+slower than baseline x (1 + tolerance) is reported and the run exits with
+status 1.
+
+Usage (from the repository root):
+    python backend/benchmarks/run_benchmarks.py                    # 'ci' profile
+    python backend/benchmarks/run_benchmarks.py --profile full     # adds 5,000 ATMs
+    python backend/benchmarks/run_benchmarks.py --update-baseline  # accept current numbers
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Add backend to path (so we can import src and app)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(BACKEND_DIR)
+sys.path.append(os.path.join(BACKEND_DIR, 'app'))
+
+import numpy as np
+import scipy.optimize, scipy.spatial, sklearn.model_selection, xgboost # noqa: F401 (imported up front so
+                                                                      # no stage is timed with a lazy import)
+
+from src.data_generator import generate_atm_data, generate_fleet_data
+from src.features import add_advanced_features, build_feature_tail
+from src.history_store import ColumnLogStore
+from src.model_trainer import save_model, train_model
+from src.optimizer import forecast_horizon, predict_next_day, run_optimization_logic
+from src.simulation_engine import SimulationEngine
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fleet sizes x history lengths (days) per profile
+PROFILES = {
+    'ci': {'n_atms': [5, 500], 'n_days': [365, 1095]},
+    'full': {'n_atms': [5, 500, 5000], 'n_days': [365, 1095]},
+}
+LEGACY_GENERATOR_MAX_ROWS = 200000 # generate_atm_data loops per row; skipped above this
+NOISE_FLOOR_SECONDS = 0.02         # Slowdowns smaller than this (timer noise) never fail the run
+
+def measure(fn, repeat=3, trace_memory=True):
+    """Returns (result, best wall time of `repeat` runs, peak traced MB of one extra run)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    peak_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, min(times), peak_mb
+
+def run_scenario(n_atms, n_days, repeat, trace_memory, workdir):
+    """Runs every stage for one fleet size / history length. Returns result records."""
+    records = []
+
+    def stage(name, fn, runs=repeat):
+        result, seconds, peak_mb = measure(fn, runs, trace_memory)
+        records.append({
+            "stage": name, "n_atms": n_atms, "n_days": n_days,
+            "seconds": round(seconds, 6),
+            "peak_mb": None if peak_mb is None else round(peak_mb, 3)
+        })
+        print(f"  {name:<28} {seconds * 1000:>10.1f} ms" + ("" if peak_mb is None else f" {peak_mb:>9.1f} MB"))
+        return result
+
+    print(f"\n[{n_atms} ATMs x {n_days} days]")
+
+    # 1. Data generation
+    if n_atms * n_days <= LEGACY_GENERATOR_MAX_ROWS:
+        stage('generate_atm_data', lambda: generate_atm_data(n_days=n_days, n_atms=n_atms), runs=1)
+    raw = stage('generate_fleet_data', lambda: generate_fleet_data(n_days=n_days, n_atms=n_atms), runs=1)
+
+    # 2. Features and training
+    df = stage('add_advanced_features', lambda: add_advanced_features(raw))
+    model, _ = stage('train_model', lambda: train_model(df), runs=1)
+
+    # 3. Forecast and optimization
+    tail = build_feature_tail(df)
+    stage('predict_next_day', lambda: predict_next_day(model, tail))
+    stage('forecast_horizon_7', lambda: forecast_horizon(model, tail, horizon=7))
+    atm_ids, _, predictions = forecast_horizon(model, tail)
+    ids = atm_ids.tolist()
+    stage('run_optimization_greedy', lambda: run_optimization_logic(predictions[:, 0], ids, 100000, 500000))
+    stage('run_optimization_min_cost',
+          lambda: run_optimization_logic(predictions[:, 0], ids, 100000, 500000, mode='min_cost'))
+
+    # 4. Simulation engine (on its own store)
+    store_dir = os.path.join(workdir, f'store_{n_atms}_{n_days}')
+    ColumnLogStore(store_dir).write(df)
+    engine = SimulationEngine(store_dir=store_dir, seed=0)
+    stage('engine_advance_day', engine.advance_day)
+    stage('engine_save_data', engine.save_data, runs=1)
+
+    # 5. API endpoints (cache cleared before every request, so each one is computed)
+    model_path = os.path.join(workdir, f'model_{n_atms}_{n_days}.json')
+    save_model(model, model_path)
+    run_endpoints(store_dir, model_path, stage)
+    return records
+
+def run_endpoints(store_dir, model_path, stage):
+    """Times the main endpoints in-process (TestClient) against a service on `store_dir`."""
+    from fastapi.testclient import TestClient
+    import api
+    from src.cash_service import CashService
+
+    service = CashService(store_dir=store_dir, model_path=model_path)
+    service.submit(lambda: None).result() # Wait for the background model load
+    api.SERVICE = service
+    client = TestClient(api.app) # No lifespan: uses the service above
+
+    def request(method, url):
+        def call():
+            service.cache.clear()
+            response = client.request(method, url)
+            assert response.status_code == 200, f"{method} {url} -> {response.status_code}"
+            return response
+        return call
+
+    atm_id = int(service.engine.last_state.index[0])
+    stage('GET /network-status', request('GET', '/network-status'))
+    stage('GET /network-status cached', lambda: client.get('/network-status'))
+    stage('GET /atm/{id}', request('GET', f'/atm/{atm_id}'))
+    stage('POST /predict', request('POST', '/predict'))
+    stage('POST /simulate/advance', request('POST', '/simulate/advance'))
+    service.close()
+    api.SERVICE = None
+
+def compare(results, baseline, tolerance):
+    """Returns the stages slower than baseline x (1 + tolerance)."""
+    key = lambda r: (r['stage'], r['n_atms'], r['n_days'])
+    base = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        limit = b['seconds'] * (1 + tolerance)
+        if r['seconds'] > limit and r['seconds'] - b['seconds'] > NOISE_FLOOR_SECONDS:
+            regressions.append({**r, "baseline_seconds": b['seconds'], "ratio": round(r['seconds'] / b['seconds'], 2)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='ci')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per stage (best is kept)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced memory run')
+    parser.add_argument('--output', default=os.path.join(BENCH_DIR, 'results.json'))
+    parser.add_argument('--baseline', default=None, help='default: benchmarks/baseline_<profile>.json')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed slowdown (0.5 = +50%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='write results as the new baseline')
+    args = parser.parse_args()
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, f'baseline_{args.profile}.json')
+    profile = PROFILES[args.profile]
+    print(f">>> BENCHMARK ({args.profile}) <<<")
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix='atm_bench_')
+    try:
+        for n_days in profile['n_days']:
+            for n_atms in profile['n_atms']:
+                results += run_scenario(n_atms, n_days, args.repeat, not args.no_memory, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "profile": args.profile,
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "numpy": np.__version__
+        },
+        "results": results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.update_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline updated: {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one.")
+        return 0
+    with open(baseline_path) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print(f"\n!!! {len(regressions)} PERFORMANCE REGRESSION(S) (tolerance +{args.tolerance:.0%}) !!!")
+        for r in regressions:
+            print(f"    {r['stage']} [{r['n_atms']} ATMs x {r['n_days']} days]: "
+                  f"{r['seconds'] * 1000:.1f} ms vs {r['baseline_seconds'] * 1000:.1f} ms ({r['ratio']}x)")
+        return 1
+    print("No regressions against baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
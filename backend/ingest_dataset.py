@@ -0,0 +1,28 @@
+import argparse
+import sys
+import os
+
+# Add backend to path (so we can import src)
+sys.path.append(os.path.dirname(__file__))
+
+from src.ingest import DEFAULT_CHUNKSIZE, ingest_csv
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'atm_cash_management_dataset.csv')
+STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'history_ingested')
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a transaction CSV into a history store the engine can load.")
+    parser.add_argument('csv', nargs='?', default=DATASET, help='default: atm_cash_management_dataset.csv')
+    parser.add_argument('--store', default=STORE, help='history store directory (default: backend/data/history_ingested)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='CSV rows read at a time')
+    parser.add_argument('--append', action='store_true', help='append newer days instead of replacing the store')
+    args = parser.parse_args()
+
+    print(">>> INGESTING TRANSACTION DATA <<<")
+    report = ingest_csv(args.csv, args.store, args.chunksize, replace=not args.append)
+    for key, value in report.items():
+        print(f"    {key}: {value}")
+    print(f"\nServe it with: ATM_HISTORY_STORE={os.path.abspath(args.store)} python backend/app/api.py")
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import os
 
@@ -7,10 +8,17 @@ sys.path.append(os.path.dirname(__file__))
 
 from src.data_generator import generate_atm_data
 from src.features import add_advanced_features
-from src.model_trainer import train_model, save_model
+from src.model_trainer import save_model, search_hyperparameters, train_model, train_segment_models
 from src.optimizer import predict_next_day
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate data, train the forecasting model and run the optimizer.")
+    parser.add_argument('--search', action='store_true', help='pick hyperparameters by time-series CV grid search')
+    parser.add_argument('--segment-by', choices=['Location_Type', 'cluster'], default=None,
+                        help='train one model per segment instead of a single model')
+    parser.add_argument('--cpu-budget', type=int, default=None, help='cores shared by parallel fits (default: all)')
+    args = parser.parse_args()
+
     print(">>> STARTING ATM FORECASTING PIPELINE <<<")
     
     # 1. Data Generation
@@ -21,7 +29,17 @@ def main():
     
     # 2. Model Training
     print("\n[2] Training Model...")
-    model, mae = train_model(df)
+    params = None
+    if args.search:
+        params, report = search_hyperparameters(df, cpu_budget=args.cpu_budget)
+        for r in report:
+            print(f"    {r['params']}: MAE {r['mae']:.2f} ({r['fit_seconds']:.2f}s)")
+    if args.segment_by:
+        model, mae, report = train_segment_models(df, args.segment_by, params, cpu_budget=args.cpu_budget)
+        for r in report:
+            print(f"    {r['segment']} ({r['atms']} ATMs): MAE {r['mae']:.2f} ({r['fit_seconds']:.2f}s)")
+    else:
+        model, mae = train_model(df, params)
     save_model(model, 'backend/models/xgb_model.json')
     print(f"    Model MAE: {mae:.2f}")
     
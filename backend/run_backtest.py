@@ -0,0 +1,68 @@
+import argparse
+import json
+import sys
+import os
+import pandas as pd
+
+# Add backend to path (so we can import src)
+sys.path.append(os.path.dirname(__file__))
+
+from src.backtester import DEFAULT_OPENING_CASH, DEFAULT_POLICY, DEFAULT_WINDOW_DAYS, risk_profile_configs, run_backtest
+from src.data_generator import generate_fleet_data
+from src.features import add_advanced_features
+from src.history_store import ColumnLogStore
+from src.model_trainer import load_model
+from src.optimizer import OPTIMIZER_MODES, RISK_PROFILES
+from src.schema import compact_frame
+from src.simulation_engine import HISTORY_FILE, HISTORY_STORE_DIR
+
+def load_history(args):
+    """The history to replay: a synthetic fleet, the history store, or the legacy CSV."""
+    if args.atms:
+        return add_advanced_features(generate_fleet_data(n_days=args.days, n_atms=args.atms))
+    store = ColumnLogStore(args.store)
+    if store.exists():
+        return store.load()
+    print(f"No history store at {args.store}; using {HISTORY_FILE}")
+    return compact_frame(pd.read_csv(HISTORY_FILE, parse_dates=['Date']))
+
+def main():
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of the forecast + rebalancing policy per risk profile.")
+    parser.add_argument('--store', default=HISTORY_STORE_DIR, help='history store to replay (default: the engine\'s)')
+    parser.add_argument('--atms', type=int, default=None, help='replay a synthetic fleet of this many ATMs instead')
+    parser.add_argument('--days', type=int, default=365, help='days of synthetic history (with --atms)')
+    parser.add_argument('--model', default=None, help='reuse this model file instead of training one per window')
+    parser.add_argument('--window-days', type=int, default=DEFAULT_WINDOW_DAYS, help='days per test window')
+    parser.add_argument('--windows', type=int, default=None, help='only the newest N windows (default: all)')
+    parser.add_argument('--retrain-every', type=int, default=7, help='warm-start retrain every N days (0: never)')
+    parser.add_argument('--profiles', nargs='+', choices=list(RISK_PROFILES), default=None, help='default: all')
+    parser.add_argument('--optimizer-mode', choices=OPTIMIZER_MODES, default=DEFAULT_POLICY['optimizer_mode'])
+    parser.add_argument('--opening-cash', type=float, default=DEFAULT_OPENING_CASH, help='cash per ATM at each window start')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--output', default=None, help='write the full report as JSON')
+    args = parser.parse_args()
+
+    print(">>> WALK-FORWARD BACKTEST <<<")
+    df = load_history(args)
+    model = load_model(args.model) if args.model else None
+    configs = risk_profile_configs({'optimizer_mode': args.optimizer_mode}, args.profiles)
+    report = run_backtest(df, model, configs, args.window_days, args.windows, args.retrain_every,
+                          args.opening_cash, max_workers=args.workers)
+
+    print(f"\n    {'window':<24} {'forecast MAE':>12} {'retrains':>8}")
+    for w in report['windows']:
+        mae = '-' if w['forecast_mae'] is None else f"{w['forecast_mae']:,.0f}" # No scorable forecast rows
+        print(f"    {w['start'] + ' .. ' + w['end']:<24} {mae:>12} {w['retrains']:>8}")
+    print(f"\n    {'profile':<13} {'trips':>7} {'stockouts':>9} {'unmet cash':>13} {'trip cost':>12}"
+          f" {'idle interest':>13} {'total cost':>12}")
+    for s in report['summary']:
+        print(f"    {s['config']:<13} {s['trips']:>7.0f} {s['stockouts']:>9.0f} {s['unmet_withdrawals']:>13,.0f}"
+              f" {s['rebalancing_cost']:>12,.0f} {s['idle_cash_interest']:>13,.0f} {s['total_cost']:>12,.0f}")
+    print(f"\n    {report['atms']} ATMs, {len(report['windows'])} windows, {report['workers']} workers, {report['seconds']:.1f}s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"    Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
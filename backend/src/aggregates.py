@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from .history import GrowableBuffer, extend_buffer
+
+TOTAL_COLUMNS = ['Net_Cash_Flow', 'Withdrawals', 'Deposits', 'Revenue', 'Cost']
+
+class DailyTotals:
+    """
+    Materialized network-wide totals per day (sum over all ATMs of TOTAL_COLUMNS).
+    Built once from the history, then extended by each simulated day, so reading
+    the latest N days costs O(N) whatever the history length or fleet size.
+    """
+
+    def __init__(self, dates, values, n_days):
+        self._dates = dates    # GrowableBuffer of datetime64 (sorted)
+        self._values = values  # GrowableBuffer of int64 [day, TOTAL_COLUMNS]
+        self.n_days = n_days
+
+    @classmethod
+    def build(cls, df):
+        daily = df.groupby('Date')[TOTAL_COLUMNS].sum()
+        dates = daily.index.to_numpy()
+        values = daily.to_numpy().astype(np.int64)
+        return cls(GrowableBuffer(dates), GrowableBuffer(values), len(dates))
+
+    def to_arrays(self):
+        """Arrays for persisting the totals (see from_arrays)."""
+        return {'dates': self.dates, 'values': self.values}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(GrowableBuffer(arrays['dates']), GrowableBuffer(arrays['values']), len(arrays['dates']))
+
+    @property
+    def dates(self):
+        return self._dates.array[:self.n_days]
+
+    @property
+    def values(self):
+        return self._values.array[:self.n_days]
+
+    def append(self, new_rows):
+        """Returns new totals that include `new_rows` (dates must not precede the last day)."""
+        daily = new_rows.groupby('Date')[TOTAL_COLUMNS].sum()
+        new_dates = daily.index.to_numpy().astype(self.dates.dtype)
+        new_values = daily.to_numpy().astype(np.int64)
+        dates_buf, values_buf, n_days = self._dates, self._values, self.n_days
+
+        # Rows for the last materialized day are folded into it (copy, older versions keep theirs)
+        if n_days and new_dates[0] == self.dates[-1]:
+            values_buf = GrowableBuffer(self.values.copy())
+            values_buf.array[-1] += new_values[0]
+            new_dates, new_values = new_dates[1:], new_values[1:]
+
+        if len(new_dates):
+            dates_buf = extend_buffer(dates_buf, n_days, new_dates)
+            values_buf = extend_buffer(values_buf, n_days, new_values)
+            n_days += len(new_dates)
+        return DailyTotals(dates_buf, values_buf, n_days)
+
+    def latest_date(self):
+        return pd.Timestamp(self.dates[-1])
+
+    def latest(self):
+        """Totals of the latest day as {column: int}."""
+        return dict(zip(TOTAL_COLUMNS, self.values[-1].tolist()))
+
+    def window(self, days):
+        """(dates, values) of the last `days` calendar days, up to the latest day."""
+        dates = self.dates
+        cutoff = dates[-1] - np.timedelta64(days, 'D')
+        lo = np.searchsorted(dates, cutoff, side='right')
+        return dates[lo:], self.values[lo:]
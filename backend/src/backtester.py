@@ -0,0 +1,275 @@
+import multiprocessing
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from .data_generator import calendar_flags
+from .features import LAG_DAYS, MODEL_FEATURES, ROLLING_WINDOW, add_advanced_features
+from .flow_optimizer import DEFAULT_COSTS, VAULT_ID, coordinate_lookup, schedule_cost
+from .model_trainer import continue_training, model_from_bytes, model_to_bytes, split_cpu_budget, fit_model
+from .optimizer import RISK_PROFILES, run_optimization_logic
+from .retrainer import TRAIN_COLUMNS
+from .metrics import METRICS
+
+DEFAULT_WINDOW_DAYS = 28         # Days per test window
+MIN_TRAIN_DAYS = 90              # History before the first window (what the first model is trained on)
+DEFAULT_OPENING_CASH = 2000000   # Cash per ATM at the start of every window
+# Policy settings not given in a backtest config (CashService's defaults)
+DEFAULT_POLICY = {'optimizer_mode': 'greedy', 'interest_rate_daily': 0.0002, **DEFAULT_COSTS}
+
+# Everything the windows need from the history, computed once per backtest.
+# [day x ATM] grids are indexed by position in `dates` and `atm_ids`; lag/rolling
+# are the forecast inputs as known the evening before each day; `train` holds
+# the history rows in date order and train[:day_rows[d]] are the rows before day d.
+FeatureCache = namedtuple('FeatureCache', [
+    'dates', 'atm_ids', 'flows', 'withdrawals', 'deposits', 'is_weekend', 'is_payday', 'is_festival',
+    'lag', 'rolling', 'train', 'day_rows'
+])
+
+@METRICS.timed('backtest_features')
+def build_feature_cache(df):
+    """
+    Builds the FeatureCache of a history frame (engine schema; the lag/rolling
+    columns are added when missing). Forecast inputs match
+    optimizer.next_day_features: 0 for an ATM without a full week of history.
+    """
+    if 'Net_Flow_Lag_7' not in df.columns:
+        df = add_advanced_features(df)
+    df = df.sort_values('Date', kind='stable')
+    dates = np.unique(df['Date'].to_numpy())
+    atm_ids = np.unique(df['ATM_ID'].to_numpy())
+    day = np.searchsorted(dates, df['Date'].to_numpy())
+    slot = np.searchsorted(atm_ids, df['ATM_ID'].to_numpy())
+
+    def grid(column, fill, dtype):
+        values = np.full((len(dates), len(atm_ids)), fill, dtype=dtype)
+        values[day, slot] = df[column].to_numpy()
+        return values
+
+    # 1. Daily grids (missing ATM-days: no flow, no withdrawals or deposits)
+    flows = grid('Net_Cash_Flow', np.nan, np.float64)
+    is_weekend, is_payday = calendar_flags(dates)
+
+    # 2. Forecast inputs of day d from days d-7..d-1, for every day at once
+    lag = np.zeros(flows.shape, dtype=np.float32)
+    rolling = np.zeros(flows.shape, dtype=np.float32)
+    if len(dates) > LAG_DAYS:
+        past = sliding_window_view(flows, LAG_DAYS, axis=0)[:-1] # [day - 7, ATM, 7 days]
+        has_week = ~np.isnan(past).any(axis=2)
+        lag[LAG_DAYS:] = np.where(has_week, past[:, :, 0], 0)
+        rolling[LAG_DAYS:] = np.where(has_week, past[:, :, -ROLLING_WINDOW:].mean(axis=2), 0)
+
+    train = df[TRAIN_COLUMNS].reset_index(drop=True)
+    return FeatureCache(
+        dates=dates, atm_ids=atm_ids, flows=flows,
+        withdrawals=grid('Withdrawals', 0, np.int64), deposits=grid('Deposits', 0, np.int64),
+        is_weekend=is_weekend, is_payday=is_payday, is_festival=grid('Is_Festival', 0, np.int8),
+        lag=lag, rolling=rolling,
+        train=train, day_rows=np.append(np.searchsorted(train['Date'].to_numpy(), dates), len(train))
+    )
+
+def forecast_inputs(cache, lo, hi):
+    """Model inputs (MODEL_FEATURES) of every ATM for days lo..hi-1, day by day."""
+    n_days, n_atms = hi - lo, len(cache.atm_ids)
+    return pd.DataFrame({
+        'ATM_ID': np.tile(cache.atm_ids, n_days),
+        'Is_Weekend': np.repeat(cache.is_weekend[lo:hi], n_atms),
+        'Is_Payday': np.repeat(cache.is_payday[lo:hi], n_atms),
+        'Is_Festival': cache.is_festival[lo:hi].ravel(),
+        'Net_Flow_Lag_7': cache.lag[lo:hi].ravel(),
+        'Net_Flow_Rolling_3': cache.rolling[lo:hi].ravel(),
+    })[MODEL_FEATURES]
+
+def walk_forward_windows(dates, window_days=DEFAULT_WINDOW_DAYS, n_windows=None, min_train_days=MIN_TRAIN_DAYS):
+    """
+    Consecutive test windows as (first day, end day) positions in `dates`,
+    starting after `min_train_days` of history. n_windows keeps the newest ones.
+    """
+    windows = [(lo, min(lo + window_days, len(dates))) for lo in range(min_train_days, len(dates), window_days)]
+    if n_windows:
+        windows = windows[-n_windows:]
+    if not windows:
+        raise ValueError(f"History too short: {len(dates)} days, {min_train_days} needed before the first window")
+    return windows
+
+def risk_profile_configs(base=None, profiles=None):
+    """One backtest config per risk profile (update_config's thresholds over `base`)."""
+    return [{**(base or {}), 'risk_tolerance': name, **RISK_PROFILES[name]} for name in profiles or RISK_PROFILES]
+
+# --- WORKER PROCESS JOBS (module-level so they can be pickled) ---
+
+_CACHE = None # FeatureCache of the running backtest, sent once per worker
+
+def _init_worker(cache):
+    global _CACHE
+    _CACHE = cache
+
+def forecast_window(window, raw_model=None, retrain_every_days=0, n_jobs=None):
+    """
+    Walks one test window forward. The model is `raw_model` (reused) or, when
+    None, fitted from scratch on all the days before the window. With
+    `retrain_every_days` it is warm-started on the days it has not seen
+    (as the live ModelRetrainer does) every that many days; the days between
+    two retrains are forecast in one model call, each from the inputs known
+    the evening before. Returns the [day x ATM] forecasts and their error.
+    """
+    start = time.perf_counter()
+    cache, (lo, hi) = _CACHE, window
+    if raw_model is None:
+        history = cache.train[:cache.day_rows[lo]]
+        model = fit_model(history[MODEL_FEATURES], history['Net_Cash_Flow'], n_jobs=n_jobs)
+    else:
+        model = model_from_bytes(raw_model)
+
+    predictions = np.empty((hi - lo, len(cache.atm_ids)), dtype=np.float32)
+    day, trained_until, retrains = lo, lo, 0
+    while day < hi:
+        if retrain_every_days and day - trained_until >= retrain_every_days:
+            model = continue_training(model, cache.train[cache.day_rows[trained_until]:cache.day_rows[day]])
+            trained_until, retrains = day, retrains + 1
+        end = min(hi, trained_until + retrain_every_days) if retrain_every_days else hi
+        predictions[day - lo:end - lo] = model.predict(forecast_inputs(cache, day, end)).reshape(end - day, -1)
+        day = end
+
+    actual = cache.flows[lo:hi]
+    known = ~np.isnan(actual)
+    return {
+        "predictions": predictions,
+        "mae": float(np.abs(predictions[known] - actual[known]).mean()) if known.any() else None,
+        "retrains": retrains,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
+
+def score_policy(window, predictions, config, opening_cash=DEFAULT_OPENING_CASH):
+    """
+    Replays the rebalancing policy over one window. Every morning the
+    optimizer (run_optimization_logic with the config's thresholds and mode)
+    plans transfers and vault refills from that day's forecast; they are
+    carried out (a transfer moves at most the source's cash), then the day's
+    actual withdrawals and deposits hit the balances. A withdrawal an ATM
+    cannot cover is a stockout (its balance stays at zero); the cash left in
+    the ATMs each night is charged `interest_rate_daily`.
+    """
+    cache, (lo, hi) = _CACHE, window
+    config = {**DEFAULT_POLICY, **config}
+    costs = {k: config[k] for k in DEFAULT_COSTS}
+    atm_ids = cache.atm_ids.tolist()
+    slot_of = {atm_id: i for i, atm_id in enumerate(atm_ids)}
+    coords = coordinate_lookup(atm_ids)
+    balance = np.broadcast_to(np.asarray(opening_cash, dtype=np.float64), len(atm_ids)).copy()
+    totals = {"trips": 0, "vault_refills": 0, "transfers": 0, "cash_moved": 0.0, "rebalancing_cost": 0.0,
+              "stockouts": 0, "unmet_withdrawals": 0.0, "idle_cash_interest": 0.0}
+
+    for day in range(lo, hi):
+        # 1. Morning: plan from the forecast and move the cash
+        schedule = run_optimization_logic(predictions[day - lo], atm_ids, config['min_cash_threshold'],
+                                          config['max_cash_threshold'], config['optimizer_mode'],
+                                          costs)['rebalancing_schedule']
+        for action in schedule:
+            amount = action['amount']
+            if action['source'] == VAULT_ID:
+                totals['vault_refills'] += 1
+            else:
+                source = slot_of[action['source']]
+                amount = min(amount, balance[source])
+                balance[source] -= amount
+                totals['transfers'] += 1
+            balance[slot_of[action['destination']]] += amount
+            totals['cash_moved'] += amount
+        totals['trips'] += len(schedule)
+        totals['rebalancing_cost'] += schedule_cost(schedule, costs, coords)
+
+        # 2. The day's actual demand; 3. Overnight interest on the idle cash
+        balance += cache.deposits[day] - cache.withdrawals[day]
+        short = balance < 0
+        totals['stockouts'] += int(short.sum())
+        totals['unmet_withdrawals'] -= balance[short].sum()
+        balance[short] = 0
+        totals['idle_cash_interest'] += balance.sum() * config['interest_rate_daily']
+
+    totals['total_cost'] = totals['rebalancing_cost'] + totals['idle_cash_interest']
+    return totals
+
+# --- BACKTEST ---
+
+@METRICS.timed('backtest')
+def run_backtest(df, model=None, configs=None, window_days=DEFAULT_WINDOW_DAYS, n_windows=None,
+                 retrain_every_days=7, opening_cash=DEFAULT_OPENING_CASH, min_train_days=MIN_TRAIN_DAYS,
+                 max_workers=None):
+    """
+    Walk-forward backtest of the forecast + optimizer policy on a history
+    frame: how many trips, stockouts and how much idle-cash interest each
+    config (default: one per risk profile) would have produced.
+
+    The history is cut into test windows (walk_forward_windows). Each window's
+    forecasts are made once (forecast_window: a model trained on the days
+    before it, or `model` reused, retrained every `retrain_every_days`) and
+    then scored under every config (score_policy); windows start from
+    `opening_cash` per ATM, so they are independent. Forecast jobs and, as
+    they finish, (window, config) scoring jobs run on a process pool; the
+    feature cache is built once and sent once to each worker.
+    A reused `model` should not have been trained on the windows' days
+    (the shipped model was trained on the whole history, which flatters it).
+    """
+    start = time.perf_counter()
+    configs = configs or risk_profile_configs()
+    cache = build_feature_cache(df)
+    windows = walk_forward_windows(cache.dates, window_days, n_windows, min_train_days)
+    raw_model = None if model is None else model_to_bytes(model)
+    workers, threads = split_cpu_budget(len(windows) * len(configs), max_workers)
+    print(f"Backtesting {len(configs)} configs x {len(windows)} windows of {window_days} days "
+          f"({len(cache.atm_ids)} ATMs, {workers} workers)...")
+
+    # 1. Forecast every window, then score it under every config
+    if workers == 1:
+        _init_worker(cache)
+        try:
+            forecasts = [forecast_window(w, raw_model, retrain_every_days, threads) for w in windows]
+            scores = {(i, c): score_policy(windows[i], f['predictions'], config, opening_cash)
+                      for i, f in enumerate(forecasts) for c, config in enumerate(configs)}
+        finally:
+            _init_worker(None)
+    else:
+        # 'spawn': never fork a process that may run the API's threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker, initargs=(cache,)) as pool:
+            pending = {pool.submit(forecast_window, w, raw_model, retrain_every_days, threads): i
+                       for i, w in enumerate(windows)}
+            forecasts, scoring = [None] * len(windows), {}
+            for future in as_completed(pending):
+                i = pending[future]
+                forecasts[i] = future.result()
+                for c, config in enumerate(configs):
+                    scoring[(i, c)] = pool.submit(score_policy, windows[i], forecasts[i]['predictions'],
+                                                  config, opening_cash)
+            scores = {key: future.result() for key, future in scoring.items()}
+
+    # 2. Report: per window, per (window, config) and per config over all windows
+    labels = [config.get('risk_tolerance', f'config_{c}') for c, config in enumerate(configs)]
+    day_str = lambda d: str(cache.dates[d].astype('datetime64[D]'))
+    results, summary = [], []
+    for c, label in enumerate(labels):
+        total = {}
+        for i, (lo, hi) in enumerate(windows):
+            score = scores[(i, c)]
+            results.append({"config": label, "window": i, "start": day_str(lo), "end": day_str(hi - 1),
+                            **{k: round(float(v), 2) for k, v in score.items()}})
+            total = {k: total.get(k, 0) + v for k, v in score.items()}
+        atm_days = sum(hi - lo for lo, hi in windows) * len(cache.atm_ids)
+        summary.append({"config": label, **{k: round(float(v), 2) for k, v in total.items()},
+                        "stockout_rate": round(total['stockouts'] / atm_days, 4)})
+    return {
+        "windows": [
+            {"start": day_str(lo), "end": day_str(hi - 1), "days": hi - lo, "forecast_mae": None if f['mae'] is None
+             else round(f['mae'], 2), "retrains": f['retrains'], "forecast_seconds": f['seconds']}
+            for (lo, hi), f in zip(windows, forecasts)
+        ],
+        "configs": [{"config": label, **config} for label, config in zip(labels, configs)],
+        "results": results,
+        "summary": summary,
+        "atms": len(cache.atm_ids),
+        "workers": workers,
+        "seconds": round(time.perf_counter() - start, 3)
+    }
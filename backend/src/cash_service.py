@@ -1,124 +1,426 @@
 import pandas as pd
 import numpy as np
+import os
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from .simulation_engine import SimulationEngine
-from .model_trainer import load_model
-from .optimizer import predict_next_day
+from .model_trainer import load_model, save_model
+from .optimizer import RISK_PROFILES, predict_next_day
+from .aggregates import TOTAL_COLUMNS
+from .flow_optimizer import DEFAULT_COSTS
+from .route_planner import plan_routes
+from .response_cache import ResponseCache
+from .retrainer import ModelRetrainer
+from .scenario_engine import ScenarioEngine
+from .metrics import process_memory_bytes
+
+MODEL_PATH = os.environ.get('ATM_MODEL_PATH', 'backend/models/xgb_model.json')
+
+# Everything a read depends on, published as one object. `version` grows with
+# every write (simulation step, reset, event, config change, model reload).
+ServiceView = namedtuple('ServiceView', ['state', 'config', 'model', 'version'])
+
+REFILL_SCAN_DAYS = 90 # Days read per step when looking back for refills (see latest_refills)
+DETAIL_COLUMNS = [
+    'Date', 'Location_Type', 'Withdrawals', 'Deposits', 'Net_Cash_Flow', 'Health',
+    'Revenue', 'Cost', 'W_100', 'W_500', 'W_2000', 'D_100', 'D_500', 'D_2000'
+]
 
 class CashService:
-    def __init__(self):
-        self.engine = SimulationEngine()
+    """
+    Read methods work on a ServiceView (engine state + config + model, taken
+    once per call) and never lock. Write methods (update_config,
+    advance_simulation, inject_event, reset_simulation, reload_model, the
+    checkpoint methods) publish a new view with a higher version; when called
+    concurrently they must go through `submit`, which runs them one at a time
+    on a single writer thread.
+    Read results are cached per version (see `cached`); `listeners` are called
+    with every newly published view (e.g. to push updates to dashboards).
+    The model is loaded after startup and retrained in the background (see
+    ModelRetrainer), then hot-swapped the same way.
+    A session service (`base` given) forks the base service's simulation in
+    memory and serves the base's model; it never retrains or writes the store.
+    """
+    def __init__(self, store_dir=None, model_path=None, base=None):
+        """
+        store_dir / model_path override the default history store and model file.
+        base: run as a session of this service (see sessions.SessionManager).
+        """
+        start = time.perf_counter()
+        self.base = base
+        self.model_path = model_path or MODEL_PATH
+        self.engine = SimulationEngine(store_dir=store_dir, base=base.engine if base is not None else None)
+        self.timings = {**self.engine.timings, 'engine_init': time.perf_counter() - start}
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='engine-writer')
+        self.cache = ResponseCache(maxsize=256 if base is None else 32)
+        self.boot_id = uuid.uuid4().hex[:8] # Keeps ETags from matching across restarts
+        self.view = None
+        self.listeners = [] # Called as listener(view) after each publish, on the publishing thread
+        self.closed = False
+        self.retrainer = ModelRetrainer(trained_rows=len(self.engine.history))
+        self.scenarios = ScenarioEngine() if base is None else base.scenarios # Sessions share the pool
         
-        # Load or Train Model
-        model_path = 'backend/models/xgb_model.json'
-        try:
-            print("Attempting to load XGBoost model...")
-            self.model = load_model(model_path)
-            print("Model loaded successfully.")
-        except Exception as e:
-            print(f"Model Load Failed: {e}. Retraining on current history...")
-            from .model_trainer import train_model, save_model
-            self.model, mae = train_model(self.engine.data)
-            save_model(self.model, model_path)
         # Default Configuration
-        self.config = {
+        config = {
             'risk_tolerance': 'moderate', # aggressive, moderate, conservative
             'min_cash_threshold': 100000,
             'max_cash_threshold': 500000,
             'cost_per_trip': 2000,
-            'interest_rate_daily': 0.0002 # ~7% per annum
+            'interest_rate_daily': 0.0002, # ~7% per annum
+            'optimizer_mode': 'greedy', # greedy, min_cost
+            'cost_per_km': DEFAULT_COSTS['cost_per_km'],
+            'cit_fee_rate': DEFAULT_COSTS['cit_fee_rate'],
+            'truck_cash_limit': DEFAULT_COSTS['truck_cash_limit'],
+            'max_stops_per_route': 8,
+            'route_time_budget_ms': 200,
+            'retrain_every_days': 7,     # Retrain after this many new days...
+            'drift_threshold': 1.5,      # ...or when recent error > 1.5x the reference error
+            'retrain_holdout_days': 2,   # Newest days held out to validate a retrained model
+            'atm_opening_cash': 2000000  # Cash per ATM at the start of a Monte Carlo scenario
         }
+        if base is not None:
+            # Sessions start from the base's settings and serve its model
+            self.publish(config=dict(base.config), model=base.model)
+            return
+        self.publish(config=config, model=None)
+        
+        # The model loads on the writer thread, so requests are served meanwhile (/predict answers 503)
+        self.submit(self.load_or_train_model)
+
+    def load_or_train_model(self):
+        """Loads the saved model, or trains one in the background if that fails."""
+        start = time.perf_counter()
+        try:
+            print("Attempting to load XGBoost model...")
+            model = load_model(self.model_path)
+            print("Model loaded successfully.")
+        except Exception as e:
+            print(f"Model Load Failed: {e}. Retraining on current history...")
+            self.retrainer.start_full(self.view.state.data, self._on_retrain_done)
+            return
+        finally:
+            self.timings['model_load'] = time.perf_counter() - start
+        self.publish(model=model)
+
+    @property
+    def config(self):
+        return self.view.config
+
+    @property
+    def model(self):
+        return self.view.model
+
+    def publish(self, **changes):
+        """Publishes a new view with the engine's current state, `changes` and the next version."""
+        current = self.view._asdict() if self.view else {}
+        current.update(changes, state=self.engine.snapshot(), version=current.get('version', 0) + 1)
+        self.view = view = ServiceView(**current)
+        for listener in self.listeners:
+            listener(view)
+        return view
+
+    def etag(self, view=None):
+        """Entity tag of every read response for `view` (default: the current one)."""
+        return f'"{self.boot_id}-{(view or self.view).version}"'
+
+    def cached(self, read_method, *args, view=None):
+        """
+        Runs a read method on `view` (default: the current one), reusing the
+        result of an identical call on the same version. Returns (etag, result).
+        """
+        view = view or self.view
+        key = (read_method.__name__, args, view.version)
+        result = self.cache.get_or_compute(key, lambda: read_method(*args, view=view))
+        return self.etag(view), result
+
+    def submit(self, write_method, *args):
+        """Queues a write method on the single writer thread; returns a concurrent Future."""
+        return self.writer.submit(write_method, *args)
+
+    def close(self):
+        """Finishes queued writes and stops the writer thread and the training process."""
+        self.closed = True
+        self.retrainer.close()
+        if self.base is None:
+            self.scenarios.close()
+        self.writer.shutdown(wait=True)
+        self.engine.save_state_snapshot() # Next start skips rebuilding the derived state
 
     def update_config(self, new_config):
-        """Updates the operational parameters."""
+        """Updates the operational parameters (publishes a new config dict)."""
         print(f"Updating Config: {new_config}")
-        self.config.update(new_config)
+        config = {**self.config, **new_config}
         
         # Auto-adjust thresholds based on risk profile request if provided
         if 'risk_tolerance' in new_config:
-            if new_config['risk_tolerance'] == 'aggressive':
-                self.config['min_cash_threshold'] = 50000 
-                self.config['max_cash_threshold'] = 300000
-            elif new_config['risk_tolerance'] == 'conservative':
-                self.config['min_cash_threshold'] = 200000 
-                self.config['max_cash_threshold'] = 800000
-            else: # moderate
-                self.config['min_cash_threshold'] = 100000 
-                self.config['max_cash_threshold'] = 500000
+            config.update(RISK_PROFILES.get(new_config['risk_tolerance'], RISK_PROFILES['moderate']))
         
-        return self.config
+        self.publish(config=config)
+        return config
+
+    def reload_model(self, path=None):
+        """Loads the model from `path` (default: the service's model file) and serves it from the next view on."""
+        path = path or self.model_path
+        print(f"Reloading model from {path}...")
+        self.publish(model=load_model(path))
+        self.retrainer.rebase(len(self.view.state.history))
+
+    def use_model(self, model):
+        """Serves `model` from the next view on (sessions follow the base's hot-swaps)."""
+        self.publish(model=model)
+        self.retrainer.rebase(len(self.view.state.history))
+
+    def retrain_model(self, reason='manual'):
+        """Starts a background retrain now. Returns the retrainer status."""
+        if self.base is not None:
+            raise ValueError("Sessions serve the main simulation's model; retrain it there")
+        view = self.view
+        if view.model is not None:
+            self.retrainer.start(view.state, view.model, reason, view.config, self._on_retrain_done)
+        return self.retrainer.status()
+
+    def _on_retrain_done(self, job, future):
+        # Runs on a pool thread: hand the result to the writer (unless shutting down)
+        if not self.closed:
+            self.submit(self.apply_retrained_model, job, future)
 
-    def get_status(self):
-        """Returns the current network status and history for charts."""
-        df = self.engine.data
-        latest_day = df['Date'].max()
-        today_data = df[df['Date'] == latest_day]
+    def apply_retrained_model(self, job, future):
+        """Swaps in a finished retrain if the retrainer accepts it, and persists it."""
+        try:
+            model = self.retrainer.finish(job, result=future.result())
+        except Exception as e:
+            print(f"Retraining failed: {e}")
+            self.retrainer.finish(job, error=e)
+            return
+        if model is None:
+            print(f"Retrained model rejected: {self.retrainer.stats['last_run']}")
+            return
+        tmp_path = self.model_path + '.tmp.json'
+        save_model(model, tmp_path)
+        os.replace(tmp_path, self.model_path)
+        self.publish(model=model)
+        print(f"Model hot-swapped ({job['reason']}, version {self.view.version}).")
+
+    def metric_gauges(self):
+        """Point-in-time values for /metrics: (name, type, help, value, labels)."""
+        view, cache, retrainer = self.view, self.cache.stats(), self.retrainer.status()
+        return [
+            ('atm_process_resident_memory_bytes', 'gauge', 'Resident memory of the API process.',
+             process_memory_bytes(), {}),
+            ('atm_history_rows', 'gauge', 'History rows held in memory.', len(view.state.history), {}),
+            ('atm_history_memory_bytes', 'gauge', 'Memory used by the history blocks.',
+             int(sum(b.memory_usage(index=False, deep=True).sum() for b in view.state.history.blocks)), {}),
+            ('atm_fleet_size', 'gauge', 'ATMs in the simulation.', len(view.state.last_state), {}),
+            ('atm_state_version', 'gauge', 'Current service state version.', view.version, {}),
+            ('atm_model_loaded', 'gauge', '1 when a forecasting model is being served.', int(view.model is not None), {}),
+            ('atm_cache_requests_total', 'counter', 'Response cache lookups.', cache['hits'], {'result': 'hit'}),
+            ('atm_cache_requests_total', 'counter', 'Response cache lookups.', cache['misses'], {'result': 'miss'}),
+            ('atm_cache_entries', 'gauge', 'Entries in the response cache.', cache['size'], {}),
+            ('atm_retrain_runs_total', 'counter', 'Background retrains by outcome.', retrainer['accepted'], {'outcome': 'accepted'}),
+            ('atm_retrain_runs_total', 'counter', 'Background retrains by outcome.', retrainer['rejected'], {'outcome': 'rejected'}),
+            ('atm_retrain_runs_total', 'counter', 'Background retrains by outcome.', retrainer['failed'], {'outcome': 'failed'}),
+            ('atm_model_drift_ratio', 'gauge', 'Recent live forecast error / reference error.', retrainer['drift'], {}),
+        ]
+
+    def get_model_status(self):
+        """
+        Retraining status, trigger policy and timings. A session tracks drift on
+        its own days but never retrains (it serves the main simulation's model).
+        """
+        config = self.config
+        return {
+            **self.retrainer.status(),
+            "model_loaded": self.model is not None,
+            "can_retrain": self.base is None,
+            "policy": {k: config[k] for k in ('retrain_every_days', 'drift_threshold', 'retrain_holdout_days')}
+        }
+
+    def get_status(self, view=None):
+        """
+        Returns the current network status and history for charts.
+        Reads the engine's materialized daily totals: O(30 days), whatever the history size.
+        """
+        state, config = (view or self.view)[:2]
+        totals = state.daily_totals
+        latest_day = totals.latest_date()
+        today = totals.latest()
         
         # History for Charts (last 30 days)
-        last_30_days = df[df['Date'] > (latest_day - pd.Timedelta(days=30))]
-        daily_trends = last_30_days.groupby('Date')['Net_Cash_Flow'].sum().reset_index()
-        chart_data = [{'date': str(d.date()), 'net_flow': int(f)} for d, f in zip(daily_trends['Date'], daily_trends['Net_Cash_Flow'])]
+        dates, values = totals.window(30)
+        flows = values[:, TOTAL_COLUMNS.index('Net_Cash_Flow')].tolist()
+        chart_data = [{'date': str(d), 'net_flow': f} for d, f in zip(dates.astype('datetime64[D]'), flows)]
 
         return {
             "date": str(latest_day.date()),
-            "total_cash_flow": int(today_data['Net_Cash_Flow'].sum()),
+            "total_cash_flow": today['Net_Cash_Flow'],
+            "network_totals": {col.lower(): v for col, v in today.items()},
             "chart_data": chart_data,
-            "config": self.config
+            "config": config
         }
 
-    def get_forecast(self):
-        """Runs the optimizer with CURRENT configuration."""
-        # Pass dynamic thresholds to optimizer
-        return predict_next_day(
-            self.model, 
-            self.engine.data, 
-            min_threshold=self.config['min_cash_threshold'],
-            max_threshold=self.config['max_cash_threshold']
+    def get_forecast(self, horizon=1, view=None):
+        """
+        Runs the optimizer with CURRENT configuration and groups its schedule into truck routes.
+        `horizon` > 1 forecasts that many days ahead and plans for the cumulative flow.
+        """
+        state, config, model, _ = view or self.view
+        if model is None:
+            return {"error": "Model is still loading or training"}
+        costs = {k: config[k] for k in DEFAULT_COSTS}
+        # Pass dynamic thresholds to optimizer; the feature tail holds the last 7 days per ATM
+        results = predict_next_day(
+            model, 
+            state.feature_tail, 
+            min_threshold=config['min_cash_threshold'],
+            max_threshold=config['max_cash_threshold'],
+            event=state.next_event,
+            mode=config['optimizer_mode'],
+            costs=costs,
+            horizon=horizon
+        )
+        results['route_plan'] = plan_routes(
+            results['rebalancing_schedule'], costs=costs,
+            max_stops=config['max_stops_per_route'],
+            time_budget_ms=config['route_time_budget_ms']
         )
+        return results
     
-    def advance_simulation(self):
-        return self.engine.advance_day()
+    def run_scenario(self, horizon_days=14, runs=1000, events=None, seed=None, opening_cash=None, view=None):
+        """
+        Monte Carlo stockout risk over the next `horizon_days` from the current state.
+        `events` maps day offsets (1 = next day) to event types; the event already
+        scheduled for the next day applies unless day 1 is given.
+        """
+        state, config = (view or self.view)[:2]
+        calendar = {} if state.next_event is None else {1: state.next_event}
+        calendar.update(events or {})
+        if opening_cash is None:
+            opening_cash = config['atm_opening_cash']
+        return self.scenarios.run(state.last_state, horizon_days, runs, calendar, opening_cash, seed)
+
+    def advance_simulation(self, days=1, events=None):
+        """
+        Advances one day, or fast-forwards `days` days in one step with an
+        optional event calendar (see SimulationEngine.advance_days).
+        """
+        if days == 1 and not events:
+            new_date = self.engine.advance_day()
+        else:
+            new_date = self.engine.advance_days(days, events)
+        view = self.publish()
+        
+        # Score the serving model on the new day; retrain in the background if the policy says so
+        reason = self.retrainer.observe(view.state, view.model, view.config)
+        if reason and self.base is None:
+            self.retrainer.start(view.state, view.model, reason, view.config, self._on_retrain_done)
+        return new_date
     
     def inject_event(self, event_type):
         self.engine.set_next_event(event_type)
+        self.publish()
         return {"message": f"Event '{event_type}' scheduled for next simulation step."}
     
     def reset_simulation(self):
         self.engine.reset_simulation()
+        view = self.publish()
+        self.retrainer.rebase(len(view.state.history))
+        if view.model is None and self.base is None:
+            self.retrainer.start_full(view.state.data, self._on_retrain_done)
 
-    def get_atm_detail(self, atm_id):
-        """Returns detailed data for a specific ATM including history and analytics."""
-        df = self.engine.data
-        latest_day = df['Date'].max()
-        
-        # Filter for this ATM
-        atm_data = df[df['ATM_ID'] == atm_id].copy()
-        
-        if atm_data.empty:
+    def create_checkpoint(self, name):
+        """Names the current state so it can be restored later (see SimulationEngine checkpoints)."""
+        checkpoint = self.engine.create_checkpoint(name)
+        return {"message": f"Checkpoint '{name}' created", "name": name,
+                "date": str(checkpoint.state.daily_totals.latest_date().date())}
+
+    def list_checkpoints(self):
+        return self.engine.list_checkpoints()
+
+    def delete_checkpoint(self, name):
+        self.engine.delete_checkpoint(name)
+        return {"message": f"Checkpoint '{name}' deleted"}
+
+    def restore_checkpoint(self, name):
+        """Rolls the simulation back (or over) to checkpoint `name`; the model is kept."""
+        checkpoint = self.engine.restore_checkpoint(name)
+        view = self.publish()
+        self.retrainer.rebase(len(view.state.history))
+        return {"message": f"Checkpoint '{name}' restored", "name": name,
+                "date": str(checkpoint.state.daily_totals.latest_date().date())}
+
+    def branch_checkpoint(self, name, save_as=None):
+        """
+        What-if branch: checkpoints the current state as `save_as` (default: an
+        automatic name), then restores `name`. Restoring `save_as` later
+        returns to the line that was left.
+        """
+        if name not in self.engine.checkpoints:
+            raise KeyError(name)
+        save_as = save_as or f"auto-{self.view.state.daily_totals.latest_date().date()}-v{self.view.version}"
+        self.engine.create_checkpoint(save_as)
+        try:
+            return {**self.restore_checkpoint(name), "saved_as": save_as}
+        except Exception:
+            self.engine.delete_checkpoint(save_as) # Nothing was switched: drop the checkpoint just made
+            raise
+
+    def latest_refills(self, state, atm_id, n=5):
+        """
+        The `n` latest "Refill" days (net inflow above 200k) of one ATM. Reads
+        back REFILL_SCAN_DAYS at a time and stops once `n` are found, so usually
+        only the newest span is read.
+        """
+        index = state.atm_index
+        first_date = pd.Timestamp(index.dates[0])
+        span_end = pd.Timestamp(index.dates[-1])
+        refills = []
+        while len(refills) < n and span_end >= first_date:
+            span_start = span_end - pd.Timedelta(days=REFILL_SCAN_DAYS - 1)
+            rows = state.history.take(index.positions(atm_id, span_start, span_end), ['Date', 'Net_Cash_Flow'])
+            is_refill = rows['Net_Cash_Flow'] > 200000
+            refills = [
+                {"date": str(d), "amount": a, "type": "Refill"}
+                for d, a in zip(rows['Date'][is_refill].astype('datetime64[D]'), rows['Net_Cash_Flow'][is_refill].tolist())
+            ] + refills
+            span_end = span_start - pd.Timedelta(days=1)
+        return refills[-n:]
+
+    def get_atm_detail(self, atm_id, start=None, end=None, view=None):
+        """
+        Returns detailed data for a specific ATM including history and analytics.
+        Reads only this ATM's rows in the window (plus its latest row) through
+        the engine's per-ATM index, so the cost does not grow with the history.
+        `start`/`end` select the history window (default: last 30 days).
+        """
+        state = (view or self.view).state
+        index = state.atm_index
+        if not index.has_atm(atm_id):
             return {"error": "ATM not found"}
         
-        # Latest state
-        latest = atm_data[atm_data['Date'] == latest_day].iloc[0]
-        
-        # History for Charts (last 30 days)
-        last_30_days = atm_data[atm_data['Date'] > (latest_day - pd.Timedelta(days=30))].sort_values('Date')
+        # History window (default: last 30 days, like the charts), in date order
+        if start is None and end is None:
+            start = pd.Timestamp(index.dates[-1]) - pd.Timedelta(days=29)
+        window = state.history.take(index.positions(atm_id, start, end), DETAIL_COLUMNS)
+        latest_row = state.history.take(np.array([index.last_position(atm_id)]), DETAIL_COLUMNS)
+        latest = {col: values[0] for col, values in latest_row.items()}
+        dates = [str(d) for d in window['Date'].astype('datetime64[D]')]
         
         # Format transaction history
-        transaction_history = []
-        for _, row in last_30_days.iterrows():
-            transaction_history.append({
-                "date": str(row['Date'].date()),
-                "withdrawals": int(row['Withdrawals']),
-                "deposits": int(row['Deposits']),
-                "net_flow": int(row['Net_Cash_Flow'])
-            })
+        transaction_history = [
+            {"date": d, "withdrawals": w, "deposits": dep, "net_flow": f}
+            for d, w, dep, f in zip(dates, window['Withdrawals'].tolist(), window['Deposits'].tolist(),
+                                    window['Net_Cash_Flow'].tolist())
+        ]
             
         # Analytics
-        avg_daily_flow = int(last_30_days['Net_Cash_Flow'].mean())
-        total_volume = int(last_30_days['Withdrawals'].sum() + last_30_days['Deposits'].sum())
+        avg_daily_flow = int(window['Net_Cash_Flow'].mean()) if len(dates) else 0
+        total_volume = int(window['Withdrawals'].sum() + window['Deposits'].sum())
         
         # Financials
-        total_revenue = int(last_30_days['Revenue'].sum())
-        total_cost = int(last_30_days['Cost'].sum())
+        total_revenue = int(window['Revenue'].sum())
+        total_cost = int(window['Cost'].sum())
         roi = round(((total_revenue - total_cost) / total_cost) * 100, 1) if total_cost > 0 else 0
 
         # Denomination Mix (Latest)
@@ -129,23 +431,13 @@ class CashService:
         ]
 
         # Financial Trend for charts
-        financial_history = []
-        for _, row in last_30_days.iterrows():
-            financial_history.append({
-                "date": str(row['Date'].date()),
-                "revenue": int(row['Revenue']),
-                "cost": int(row['Cost'])
-            })
+        financial_history = [
+            {"date": d, "revenue": r, "cost": c}
+            for d, r, c in zip(dates, window['Revenue'].tolist(), window['Cost'].tolist())
+        ]
 
         # Identify "Refill" events
-        refills = []
-        possible_refills = atm_data[atm_data['Net_Cash_Flow'] > 200000]
-        for _, row in possible_refills.tail(5).iterrows():
-            refills.append({
-                "date": str(row['Date'].date()),
-                "amount": int(row['Net_Cash_Flow']),
-                "type": "Refill" 
-            })
+        refills = self.latest_refills(state, atm_id)
 
         # Derive status from health
         h = latest['Health']
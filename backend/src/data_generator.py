@@ -1,10 +1,23 @@
 import pandas as pd
 import numpy as np
+from .schema import compact_frame
 
-def generate_atm_data(n_days=365, n_atms=5):
+PAYDAY_DAYS = (1, 2, 3, 4, 5, 30, 31)
+FESTIVAL_PROBABILITY = 0.02
+
+GENERATED_COLUMNS = [
+    'Date', 'ATM_ID', 'Location_Type', 'Is_Weekend', 'Is_Payday', 'Is_Festival',
+    'Withdrawals', 'Deposits',
+    'W_100', 'W_500', 'W_2000',
+    'D_100', 'D_500', 'D_2000',
+    'Health', 'Revenue', 'Cost'
+]
+
+def generate_atm_data(n_days=365, n_atms=5, compact=True):
     """
     Generates synthetic ATM data simulating Indian banking patterns.
     Includes 'Deposits' to simulate Cash Recyclers (CRMs).
+    compact: use the compact column dtypes (see schema.COMPACT_DTYPES).
     """
     np.random.seed(42)
     dates = pd.date_range(start='2024-01-01', periods=n_days)
@@ -75,16 +88,136 @@ def generate_atm_data(n_days=365, n_atms=5):
                 health, int(revenue), int(op_cost)
             ])
 
-    cols = [
-        'Date', 'ATM_ID', 'Location_Type', 'Is_Weekend', 'Is_Payday', 'Is_Festival', 
-        'Withdrawals', 'Deposits',
-        'W_100', 'W_500', 'W_2000',
-        'D_100', 'D_500', 'D_2000',
-        'Health', 'Revenue', 'Cost'
-    ]
-    df = pd.DataFrame(data, columns=cols)
+    df = pd.DataFrame(data, columns=GENERATED_COLUMNS)
     
     # TARGET VARIABLE: Net Cash Flow
     df['Net_Cash_Flow'] = df['Deposits'] - df['Withdrawals']
     
-    return df
+    return compact_frame(df) if compact else df
+
+
+# --- VECTORIZED FLEET GENERATOR ---
+
+def location_types(atm_ids):
+    """Even IDs = 'Market', Odd IDs = 'Residential' (same rule as generate_atm_data)."""
+    atm_ids = np.asarray(atm_ids)
+    return np.where(atm_ids % 2 == 0, 'Market', 'Residential').astype(object)
+
+def calendar_flags(dates):
+    """Returns (is_weekend, is_payday) int64 arrays for the given dates."""
+    dates = pd.DatetimeIndex(dates)
+    is_weekend = (dates.dayofweek >= 5).astype(np.int64)
+    is_payday = np.isin(dates.day, PAYDAY_DAYS).astype(np.int64)
+    return is_weekend, is_payday
+
+def atm_rng(atm_id, seed=42):
+    """
+    Independent RNG stream for one ATM.
+    The stream depends only on (seed, atm_id), so any subset of the fleet can be
+    generated on a separate worker and still match a single-process run.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(atm_id),)))
+
+def apply_demand_effects(base_withdraw, base_deposit, is_weekend, is_payday, is_market, is_festival,
+                         festival_boost=1.8):
+    """
+    Applies the payday, weekend, location and festival multipliers to arrays of
+    base demand. All inputs broadcast against each other.
+    """
+    withdraw = base_withdraw * np.where(is_payday == 1, 1.4, 1.0)
+    withdraw = withdraw * np.where(is_weekend == 1, 1.2, 1.0)
+    withdraw = withdraw * np.where(is_market, 0.8, 1.2)
+    deposit = base_deposit * np.where(is_market, 1.6, 0.3)
+    withdraw = withdraw * np.where(is_festival == 1, festival_boost, 1.0)
+    return withdraw, deposit
+
+def expected_demand(is_weekend, is_payday, is_market, is_festival, festival_boost=1.8):
+    """Mean withdrawals and deposits the demand model gives days with these flags (noise averaged out)."""
+    return apply_demand_effects(500000.0, 300000.0, is_weekend, is_payday, is_market, is_festival,
+                                festival_boost=festival_boost)
+
+def split_denominations(withdraw_val, deposit_val):
+    """Splits integer withdrawal/deposit arrays into note counts (same mix as generate_atm_data)."""
+    return {
+        'W_100': ((withdraw_val * 0.3) // 100).astype(np.int64),
+        'W_500': ((withdraw_val * 0.6) // 500).astype(np.int64),
+        'W_2000': ((withdraw_val * 0.1) // 2000).astype(np.int64),
+        'D_100': ((deposit_val * 0.20) // 100).astype(np.int64),
+        'D_500': ((deposit_val * 0.75) // 500).astype(np.int64),
+        'D_2000': ((deposit_val * 0.05) // 2000).astype(np.int64),
+    }
+
+def revenue_and_cost(withdraw_val, deposit_val, health):
+    """Revenue (Rs 25 per 5k withdrawn, Rs 10 per 5k deposited) and health-based OPEX."""
+    revenue = (withdraw_val // 5000) * 25 + (deposit_val // 5000) * 10
+    cost = (500 + (100 - health) * 50).astype(np.int64)
+    return revenue.astype(np.int64), cost
+
+def generate_fleet_data(n_days=365, n_atms=5, seed=42, atm_ids=None, start_date='2024-01-01', compact=True):
+    """
+    Vectorized version of generate_atm_data for large fleets.
+
+    Builds the whole (ATM x day) grid with NumPy arrays instead of one Python
+    iteration per cell. Pass `atm_ids` to generate only part of the fleet
+    (e.g. one shard per worker); every ATM draws from its own `atm_rng` stream,
+    so concatenating shards gives exactly the single-call result.
+
+    Matches generate_atm_data in:
+      - columns, column order, dtypes and row order (ATM-major, then Date)
+      - demand model: N(5L, 50k) withdrawals / N(3L, 30k) deposits with the same
+        payday (x1.4), weekend (x1.2), location and festival (2%, x1.8) effects
+      - denomination split, initial health (100 - U(0, 5)), revenue and cost
+    It is statistically equivalent but NOT bit-identical: the legacy function
+    draws from the global `np.random.seed(42)` stream in cell order, which
+    cannot be reproduced per ATM.
+    Both return compact dtypes unless `compact=False`.
+    """
+    dates = pd.date_range(start=start_date, periods=n_days)
+    atm_ids = np.arange(n_atms, dtype=np.int64) if atm_ids is None else np.asarray(atm_ids, dtype=np.int64)
+    n = len(atm_ids)
+
+    # 1. Random draws: one stream per ATM, each vectorized over all days
+    normals = np.empty((2, n, n_days))
+    uniforms = np.empty((2, n, n_days))
+    for i, atm_id in enumerate(atm_ids):
+        rng = atm_rng(atm_id, seed)
+        normals[:, i, :] = rng.standard_normal((2, n_days))
+        uniforms[:, i, :] = rng.random((2, n_days))
+
+    base_withdraw = 500000 + 50000 * normals[0]
+    base_deposit = 300000 + 30000 * normals[1]
+    is_festival = (uniforms[0] < FESTIVAL_PROBABILITY).astype(np.int64)
+
+    # 2. Calendar (per day) and location (per ATM) effects, broadcast over the grid
+    is_weekend, is_payday = calendar_flags(dates)
+    loc = location_types(atm_ids)
+    is_market = (loc == 'Market')[:, None]
+    withdraw, deposit = apply_demand_effects(
+        base_withdraw, base_deposit, is_weekend[None, :], is_payday[None, :], is_market, is_festival
+    )
+
+    # 3. Deep analytics columns
+    withdraw_val = withdraw.astype(np.int64).ravel()
+    deposit_val = deposit.astype(np.int64).ravel()
+    health = np.maximum(0, 100 - uniforms[1] * 5).ravel()
+    revenue, cost = revenue_and_cost(withdraw_val, deposit_val, health)
+
+    df = pd.DataFrame({
+        'Date': np.tile(dates.values, n),
+        'ATM_ID': np.repeat(atm_ids, n_days),
+        'Location_Type': pd.Categorical(np.repeat(loc, n_days)) if compact else np.repeat(loc, n_days),
+        'Is_Weekend': np.tile(is_weekend, n),
+        'Is_Payday': np.tile(is_payday, n),
+        'Is_Festival': is_festival.ravel(),
+        'Withdrawals': withdraw_val,
+        'Deposits': deposit_val,
+        **split_denominations(withdraw_val, deposit_val),
+        'Health': health,
+        'Revenue': revenue,
+        'Cost': cost,
+    })[GENERATED_COLUMNS]
+
+    # TARGET VARIABLE: Net Cash Flow
+    df['Net_Cash_Flow'] = df['Deposits'] - df['Withdrawals']
+
+    return compact_frame(df) if compact else df
@@ -1,19 +1,94 @@
 import pandas as pd
+import numpy as np
+from .metrics import METRICS
+from .schema import compact_frame
 
-def add_advanced_features(df):
+LAG_DAYS = 7
+ROLLING_WINDOW = 3
+
+# Model inputs, in training order
+MODEL_FEATURES = ['ATM_ID', 'Is_Weekend', 'Is_Payday', 'Is_Festival', 'Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
+
+@METRICS.timed('add_advanced_features')
+def add_advanced_features(df, compact=True):
     """
     Adds Lag and Rolling features to capture seasonality and trends.
+    compact: store the features as float32 (and any other column in its compact dtype).
     """
     # Sort to ensure shifts work correctly
     df = df.sort_values(by=['ATM_ID', 'Date'])
     
     # 1. LAG FEATURE: "What was the Net Flow on this day last week?" (Weekly Seasonality)
-    df['Net_Flow_Lag_7'] = df.groupby('ATM_ID')['Net_Cash_Flow'].shift(7)
+    df['Net_Flow_Lag_7'] = df.groupby('ATM_ID')['Net_Cash_Flow'].shift(LAG_DAYS)
     
     # 2. ROLLING MEAN: "Average Net Flow of last 3 days" (Short-term Trend)
-    df['Net_Flow_Rolling_3'] = df.groupby('ATM_ID')['Net_Cash_Flow'].transform(lambda x: x.rolling(window=3).mean())
+    df['Net_Flow_Rolling_3'] = df.groupby('ATM_ID')['Net_Cash_Flow'].transform(lambda x: x.rolling(window=ROLLING_WINDOW).mean())
     
     # Fill NaNs created by shifting (First 7 days will be empty)
     df = df.fillna(0).reset_index(drop=True)
     
-    return df
+    return compact_frame(df) if compact else df
+
+def build_feature_tail(df):
+    """
+    Returns the per-ATM tail buffer used by add_incremental_features:
+    the last LAG_DAYS rows (ATM_ID, Date, Net_Cash_Flow) of every ATM, in date order.
+    """
+    tail = df[['ATM_ID', 'Date', 'Net_Cash_Flow']].sort_values(by=['ATM_ID', 'Date'], kind='stable')
+    return tail.groupby('ATM_ID').tail(LAG_DAYS).reset_index(drop=True)
+
+def add_incremental_features(new_rows, tail):
+    """
+    Computes Net_Flow_Lag_7 and Net_Flow_Rolling_3 for `new_rows` only.
+
+    `tail` is the buffer from build_feature_tail (or a previous call) and must
+    only hold rows older than `new_rows`. The work is O(ATMs x (LAG_DAYS + new days)),
+    independent of the history length, and the values equal what
+    add_advanced_features would produce on the full concatenated history.
+
+    Returns (new rows sorted by ATM_ID/Date with features, updated tail).
+    """
+    new_rows = new_rows.sort_values(by=['ATM_ID', 'Date'], kind='stable').reset_index(drop=True)
+    n_tail = len(tail)
+
+    # 1. Stack tail + new rows and group them by ATM (stable, so dates stay in order)
+    ids = np.concatenate([tail['ATM_ID'].to_numpy(), new_rows['ATM_ID'].to_numpy()])
+    dates = np.concatenate([tail['Date'].to_numpy(), new_rows['Date'].to_numpy()])
+    flows = np.concatenate([tail['Net_Cash_Flow'].to_numpy(), new_rows['Net_Cash_Flow'].to_numpy()])
+    order = np.argsort(ids, kind='stable')
+    ids, dates, flows = ids[order], dates[order], flows[order]
+    is_new = order >= n_tail
+
+    # 2. Position of every row inside its ATM's sequence
+    rows = np.arange(len(ids))
+    starts = np.r_[True, ids[1:] != ids[:-1]]
+    group_start = np.maximum.accumulate(np.where(starts, rows, 0))
+    pos = rows - group_start
+
+    # 3. Lag and rolling mean, only where enough history exists (else 0 like fillna)
+    values = flows.astype(np.float64)
+    lag = np.zeros(len(ids))
+    has_lag = pos >= LAG_DAYS
+    lag[has_lag] = values[rows[has_lag] - LAG_DAYS]
+
+    rolling = np.zeros(len(ids))
+    has_window = pos >= ROLLING_WINDOW - 1
+    window_sum = np.zeros(has_window.sum())
+    for k in range(ROLLING_WINDOW - 1, -1, -1):
+        window_sum += values[rows[has_window] - k]
+    rolling[has_window] = window_sum / ROLLING_WINDOW
+
+    new_rows['Net_Flow_Lag_7'] = lag[is_new]
+    new_rows['Net_Flow_Rolling_3'] = rolling[is_new]
+
+    # 4. Keep only the last LAG_DAYS rows per ATM as the next tail
+    group_id = np.cumsum(starts) - 1
+    group_len = np.bincount(group_id)
+    keep = pos >= group_len[group_id] - LAG_DAYS
+    new_tail = pd.DataFrame({
+        'ATM_ID': ids[keep],
+        'Date': dates[keep],
+        'Net_Cash_Flow': flows[keep],
+    })
+
+    return new_rows, new_tail
@@ -0,0 +1,143 @@
+import numpy as np
+
+VAULT_ID = 'CENTRAL_VAULT'
+
+# Cost model shared by the planners (overridable through CashService.config)
+DEFAULT_COSTS = {
+    'cost_per_trip': 2000,        # Fixed CIT dispatch cost per trip (Rs)
+    'cost_per_km': 25,            # Truck running cost (Rs/km)
+    'cit_fee_rate': 0.0005,       # CIT handling fee per rupee carried
+    'truck_cash_limit': 2000000,  # Cash one truck may carry (Rs)
+}
+
+# Candidate surplus sources considered per deficit ATM (plus the vault).
+# More candidates barely lower the LP objective but split deliveries into more trips.
+NEAREST_SOURCES = 4
+
+def _hash_uniform(ids, salt):
+    """Deterministic U(0, 1) per integer ID (splitmix64), independent of fleet size/order."""
+    x = (np.asarray(ids, dtype=np.uint64) + np.uint64(salt)) * np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+def atm_coordinates(atm_ids, city_radius_km=15.0):
+    """
+    Synthetic (x, y) positions in km for ATMs; the central vault sits at (0, 0).
+    The data has no geography, so every ATM gets a fixed pseudo-random spot in
+    a city-sized disc derived from its ID.
+    """
+    r = city_radius_km * np.sqrt(_hash_uniform(atm_ids, 1))
+    theta = 2 * np.pi * _hash_uniform(atm_ids, 2)
+    return np.column_stack([r * np.cos(theta), r * np.sin(theta)])
+
+def coordinate_lookup(atm_ids):
+    """{ATM ID: (x, y)} for the given ATMs, using atm_coordinates."""
+    return dict(zip(atm_ids, atm_coordinates(atm_ids)))
+
+def _coords_of(ids, coords):
+    if coords is None:
+        return atm_coordinates(ids)
+    return np.array([coords[i] for i in ids], dtype=np.float64).reshape(len(ids), 2)
+
+def trip_cost(distance, amount, costs):
+    """Cost of one CIT trip covering `distance` km and carrying `amount` rupees."""
+    return costs['cost_per_trip'] + distance * costs['cost_per_km'] + amount * costs['cit_fee_rate']
+
+def transfer_unit_cost(distance, costs):
+    """Per-rupee cost used by the LP: handling fee + trip cost spread over a full truck."""
+    return costs['cit_fee_rate'] + (costs['cost_per_trip'] + distance * costs['cost_per_km']) / costs['truck_cash_limit']
+
+def schedule_cost(schedule, costs=None, coords=None):
+    """Total cost of a rebalancing schedule, one trip per entry. `coords` maps ATM ID -> (x, y)."""
+    costs = {**DEFAULT_COSTS, **(costs or {})}
+    if coords is None:
+        coords = coordinate_lookup(sorted({a['destination'] for a in schedule} |
+                                          {a['source'] for a in schedule if a['source'] != VAULT_ID}))
+    vault = np.zeros(2)
+    total = 0.0
+    for action in schedule:
+        src = vault if action['source'] == VAULT_ID else coords[action['source']]
+        dist = 1.3 * np.hypot(*(coords[action['destination']] - src))
+        total += trip_cost(dist, action['amount'], costs)
+    return total
+
+def plan_min_cost_transfers(surplus_atms, deficit_atms, costs=None, coords=None):
+    """
+    Solves surplus -> deficit transfers plus vault refills as a transportation
+    problem (min-cost flow on a bipartite graph) with SciPy's HiGHS LP solver.
+
+    Every deficit must be fully covered, either by surplus ATMs (up to their
+    surplus) or by the vault (unlimited). To keep the LP small for large fleets,
+    each deficit only considers its NEAREST_SOURCES closest surplus ATMs
+    (k-d tree query), so the LP has O(ATMs) variables instead of O(ATMs^2).
+
+    `coords` optionally maps ATM ID -> (x, y) km; defaults to atm_coordinates.
+    Returns the schedule in the same format as the greedy planner.
+    """
+    # SciPy is imported on first use: it is only needed in 'min_cost' mode and slows startup
+    from scipy.optimize import linprog
+    from scipy.sparse import coo_matrix
+    from scipy.spatial import cKDTree
+    costs = {**DEFAULT_COSTS, **(costs or {})}
+    if not deficit_atms:
+        return []
+
+    d_ids = [d['id'] for d in deficit_atms]
+    demand = np.array([d['amount'] for d in deficit_atms], dtype=np.float64)
+    s_ids = [s['id'] for s in surplus_atms]
+    supply = np.array([s['amount'] for s in surplus_atms], dtype=np.float64)
+    n_d, n_s = len(d_ids), len(s_ids)
+
+    d_xy = _coords_of(d_ids, coords)
+    s_xy = _coords_of(s_ids, coords)
+
+    # 1. Candidate edges: k nearest surplus ATMs per deficit, plus one vault edge each
+    if n_s:
+        k = min(NEAREST_SOURCES, n_s)
+        dist, nearest = cKDTree(s_xy).query(d_xy, k=k)
+        edge_d = np.repeat(np.arange(n_d), k)
+        edge_s = np.asarray(nearest).reshape(n_d, k).ravel()
+        edge_cost = transfer_unit_cost(1.3 * np.asarray(dist).reshape(n_d, k).ravel(), costs)
+    else:
+        edge_d = edge_s = np.empty(0, dtype=np.int64)
+        edge_cost = np.empty(0)
+    vault_cost = transfer_unit_cost(1.3 * np.hypot(d_xy[:, 0], d_xy[:, 1]), costs)
+
+    # The vault is unlimited, so an edge that is not cheaper than it is never used
+    useful = edge_cost < vault_cost[edge_d]
+    edge_d, edge_s, edge_cost = edge_d[useful], edge_s[useful], edge_cost[useful]
+    n_e = len(edge_d)
+
+    # 2. LP: variables = [edge flows..., vault flows...]
+    c = np.concatenate([edge_cost, vault_cost])
+    rows = np.concatenate([edge_d, np.arange(n_d)])
+    cols = np.arange(n_e + n_d)
+    A_eq = coo_matrix((np.ones(n_e + n_d), (rows, cols)), shape=(n_d, n_e + n_d)).tocsr()
+    A_ub = coo_matrix((np.ones(n_e), (edge_s, np.arange(n_e))), shape=(n_s, n_e + n_d)).tocsr() if n_s else None
+    res = linprog(c, A_ub=A_ub, b_ub=supply if n_s else None, A_eq=A_eq, b_eq=demand,
+                  bounds=(0, None), method='highs')
+    if res.status != 0:
+        raise RuntimeError(f"Min-cost rebalancing failed: {res.message}")
+    flow = np.round(res.x).astype(np.int64)
+
+    # 3. Schedule (transfers first, then refills)
+    schedule = []
+    for e in np.flatnonzero(flow[:n_e] > 0):
+        schedule.append({
+            "action": "INTER_ATM_TRANSFER",
+            "source": s_ids[edge_s[e]],
+            "destination": d_ids[edge_d[e]],
+            "amount": int(flow[e]),
+            "notes": "Saved 1 Vault Trip"
+        })
+    for d in np.flatnonzero(flow[n_e:] > 0):
+        schedule.append({
+            "action": "VAULT_REFILL",
+            "source": VAULT_ID,
+            "destination": d_ids[d],
+            "amount": int(flow[n_e + d]),
+            "notes": "Standard Refill"
+        })
+    return schedule
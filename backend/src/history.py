@@ -0,0 +1,215 @@
+import threading
+import numpy as np
+import pandas as pd
+
+class History:
+    """
+    Immutable, append-only simulation history made of DataFrame blocks.
+
+    Appending a simulated day adds a small block instead of copying the whole
+    history. Trailing blocks are merged binary-counter style (a block is merged
+    into its predecessor once it is at least as large), so there are only
+    O(log rows) blocks and each row is copied O(log rows) times overall.
+    Blocks are never modified, so older History objects stay valid and can
+    share blocks with newer ones.
+    """
+
+    def __init__(self, blocks=()):
+        self.blocks = tuple(blocks)
+        self._frame = None # Memoized concatenation of the blocks (see frame)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls([df.reset_index(drop=True)])
+
+    def __len__(self):
+        return sum(len(b) for b in self.blocks)
+
+    @property
+    def offsets(self):
+        """Global row position where each block starts (plus the total length)."""
+        return np.cumsum([0] + [len(b) for b in self.blocks])
+
+    @property
+    def columns(self):
+        return self.blocks[0].columns
+
+    @property
+    def dtypes(self):
+        return self.blocks[0].dtypes
+
+    def append(self, block):
+        """Returns a new History with `block` added at the end."""
+        blocks = [self._frame] if self._frame is not None else list(self.blocks)
+        blocks.append(block.reset_index(drop=True))
+        while len(blocks) > 1 and len(blocks[-2]) <= len(blocks[-1]):
+            last = blocks.pop()
+            blocks[-1] = pd.concat([blocks[-1], last], ignore_index=True)
+        return History(blocks)
+
+    def frame(self):
+        """
+        The whole history as one DataFrame.
+        The concatenation is memoized beside the blocks, which never change: readers
+        and forks sharing this object are unaffected, and a concurrent call at worst
+        concatenates twice. Appends start from the memo, so once older states are
+        dropped the original blocks are freed and memory is not doubled.
+        """
+        if not self.blocks:
+            return pd.DataFrame()
+        if len(self.blocks) == 1:
+            return self.blocks[0]
+        frame = self._frame
+        if frame is None:
+            frame = self._frame = pd.concat(self.blocks, ignore_index=True)
+        return frame
+
+    def take(self, positions, columns):
+        """
+        Returns {column: array} for the rows at global `positions` (ascending),
+        reading only the blocks and columns involved.
+        """
+        offsets = self.offsets
+        block_of = np.searchsorted(offsets, positions, side='right') - 1
+        parts = {col: [] for col in columns}
+        for b in np.unique(block_of):
+            local = positions[block_of == b] - offsets[b]
+            block = self.blocks[b]
+            for col in columns:
+                values = block[col]
+                if pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_datetime64_any_dtype(values.dtype):
+                    parts[col].append(values.to_numpy()[local]) # zero-copy column view
+                else:
+                    parts[col].append(values.take(local).to_numpy())
+        return {
+            col: np.concatenate(arrays) if arrays else np.empty(0, dtype=self.dtypes[col])
+            for col, arrays in parts.items()
+        }
+
+# --- SHARED GROWABLE BUFFERS ---
+
+_CLAIM_LOCK = threading.Lock() # Guards GrowableBuffer.length (see extend_buffer)
+
+class GrowableBuffer:
+    """
+    Append-only array with spare capacity, shared by successive versions of a
+    derived structure. A version only sees its first `length` rows, so an
+    append can fill the spare capacity without disturbing older versions.
+    """
+
+    def __init__(self, array, length=None):
+        self.array = array
+        self.length = len(array) if length is None else length
+
+def extend_buffer(buffer, length, rows):
+    """
+    Appends `rows` after the first `length` rows of `buffer` and returns the
+    buffer holding the result. Copies into a new buffer when capacity runs out
+    or when another version already appended past `length` (a branch).
+    Checking and claiming the spare capacity is atomic: forked engines (sessions)
+    share buffers with the base but append from their own writer threads.
+    """
+    needed = length + len(rows)
+    with _CLAIM_LOCK:
+        claimed = buffer.length == length and needed <= len(buffer.array)
+        if claimed:
+            buffer.length = needed
+    if not claimed:
+        array = np.empty((max(2 * needed, 16),) + buffer.array.shape[1:], dtype=buffer.array.dtype)
+        array[:length] = buffer.array[:length]
+        buffer = GrowableBuffer(array, needed)
+    buffer.array[length:needed] = rows
+    return buffer
+
+# --- PER-ATM INDEX ---
+
+class AtmHistoryIndex:
+    """
+    Row positions of every (day, ATM) cell of a History, kept as a
+    [day x ATM] grid (-1 = no row). One ATM's history over a date range is a
+    contiguous slice of one grid column, found with a binary search on dates.
+    Appending a day writes one grid row; the index never rescans the history.
+    """
+
+    def __init__(self, dates, atm_ids, grid, n_days):
+        self._dates = dates      # GrowableBuffer of datetime64 (sorted)
+        self._grid = grid        # GrowableBuffer of int64 [day, slot]
+        self.atm_ids = atm_ids   # sorted ATM IDs; slot = position in this array
+        self.n_days = n_days
+
+    @classmethod
+    def build(cls, df):
+        dates = np.unique(df['Date'].to_numpy())
+        atm_ids = np.unique(df['ATM_ID'].to_numpy())
+        grid = np.full((len(dates), len(atm_ids)), -1, dtype=np.int64)
+        grid[np.searchsorted(dates, df['Date'].to_numpy()),
+             np.searchsorted(atm_ids, df['ATM_ID'].to_numpy())] = np.arange(len(df))
+        return cls(GrowableBuffer(dates), atm_ids, GrowableBuffer(grid), len(dates))
+
+    def to_arrays(self):
+        """Compact arrays for persisting the index (positions as int32 when they fit)."""
+        grid = self._grid.array[:self.n_days]
+        if grid.size and grid.max() < np.iinfo(np.int32).max:
+            grid = grid.astype(np.int32)
+        return {'dates': self.dates, 'atm_ids': self.atm_ids, 'grid': grid}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        dates = arrays['dates']
+        grid = arrays['grid'].astype(np.int64)
+        return cls(GrowableBuffer(dates), arrays['atm_ids'], GrowableBuffer(grid), len(dates))
+
+    @property
+    def dates(self):
+        return self._dates.array[:self.n_days]
+
+    def has_atm(self, atm_id):
+        slot = np.searchsorted(self.atm_ids, atm_id)
+        return slot < len(self.atm_ids) and self.atm_ids[slot] == atm_id
+
+    def append(self, new_rows, start):
+        """
+        Returns a new index that also covers `new_rows`, stored at global
+        positions start, start + 1, ... Their dates must not precede the last
+        indexed day.
+        """
+        row_dates = new_rows['Date'].to_numpy().astype(self.dates.dtype)
+        row_atms = new_rows['ATM_ID'].to_numpy()
+        dates_buf, grid_buf, atm_ids, n_days = self._dates, self._grid, self.atm_ids, self.n_days
+
+        # New ATMs need extra grid columns (rare: copies the grid)
+        unseen = np.setdiff1d(row_atms, atm_ids)
+        if len(unseen):
+            merged = np.union1d(atm_ids, unseen)
+            grid = np.full((n_days, len(merged)), -1, dtype=np.int64)
+            grid[:, np.searchsorted(merged, atm_ids)] = grid_buf.array[:n_days]
+            grid_buf, atm_ids = GrowableBuffer(grid), merged
+
+        # New days get fresh grid rows
+        new_days = np.setdiff1d(row_dates, self.dates)
+        if len(new_days):
+            dates_buf = extend_buffer(dates_buf, n_days, new_days)
+            grid_buf = extend_buffer(grid_buf, n_days, np.full((len(new_days), len(atm_ids)), -1, dtype=np.int64))
+            n_days += len(new_days)
+
+        day_idx = np.searchsorted(dates_buf.array[:n_days], row_dates)
+        if grid_buf is self._grid and (day_idx < self.n_days).any():
+            # Rows for an already indexed day: copy so older versions stay unchanged
+            grid_buf = GrowableBuffer(grid_buf.array[:n_days].copy())
+        grid_buf.array[day_idx, np.searchsorted(atm_ids, row_atms)] = start + np.arange(len(new_rows))
+        return AtmHistoryIndex(dates_buf, atm_ids, grid_buf, n_days)
+
+    def last_position(self, atm_id):
+        """Global row position of one ATM's latest row."""
+        column = self._grid.array[:self.n_days, np.searchsorted(self.atm_ids, atm_id)]
+        if column[-1] >= 0:
+            return column[-1] # The usual case: the ATM has a row on the latest day
+        return column[np.flatnonzero(column >= 0)[-1]]
+
+    def positions(self, atm_id, start=None, end=None):
+        """Global row positions of one ATM between `start` and `end` (inclusive), in date order."""
+        dates = self.dates
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(start, 'D'), side='left')
+        hi = self.n_days if end is None else np.searchsorted(dates, np.datetime64(end, 'D'), side='right')
+        column = self._grid.array[lo:hi, np.searchsorted(self.atm_ids, atm_id)]
+        return np.sort(column[column >= 0])
@@ -0,0 +1,183 @@
+import json
+import os
+import uuid
+import numpy as np
+import pandas as pd
+from .schema import compact_frame
+
+META_FILE = 'meta.json'
+
+class ColumnLogStore:
+    """
+    Append-only columnar history on disk.
+
+    Every column lives in its own raw binary file (`<column>.bin`) that only ever
+    grows, so persisting a simulated day writes just that day's rows instead of
+    rewriting the whole history. Text columns are stored as integer codes with
+    their categories in `meta.json`. `meta.json` is replaced atomically after each
+    write and its `n_rows` is the source of truth: bytes past it (from an
+    interrupted append) are ignored on load and truncated on the next append.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.meta_path = os.path.join(root, META_FILE)
+
+    def exists(self):
+        return os.path.exists(self.meta_path)
+
+    def n_rows(self):
+        return self._read_meta()['n_rows'] if self.exists() else 0
+
+    def column_names(self):
+        return [col['name'] for col in self._read_meta()['columns']]
+
+    def attrs(self):
+        """Metadata recorded with the stored history (see set_attrs); {} if none."""
+        return self._read_meta().get('attrs', {}) if self.exists() else {}
+
+    def set_attrs(self, attrs):
+        """Records JSON-serializable metadata about the stored rows (kept on append, dropped on write)."""
+        meta = self._read_meta()
+        meta['attrs'] = attrs
+        self._write_meta(meta)
+
+    def version(self):
+        """
+        (write_id, n_rows): identifies the stored contents. write_id changes on every
+        rewrite or truncation, so equal versions mean the same rows.
+        """
+        if not self.exists():
+            return None
+        meta = self._read_meta()
+        return meta.get('write_id'), meta['n_rows']
+
+    # --- WRITE PATH ---
+
+    def write(self, df, attrs=None):
+        """Replaces the stored history with `df` (and its metadata with `attrs`)."""
+        os.makedirs(self.root, exist_ok=True)
+        meta = {'n_rows': 0, 'write_id': uuid.uuid4().hex, 'attrs': attrs or {},
+                'columns': [self._describe(df[col]) for col in df.columns]}
+        for col in meta['columns']:
+            open(self._column_path(col['name']), 'wb').close()
+        self._write_meta(meta)
+        self.append(df)
+
+    def append(self, df):
+        """Appends rows to the end of every column file."""
+        if not self.exists():
+            return self.write(df)
+
+        meta = self._read_meta()
+        names = [col['name'] for col in meta['columns']]
+        if set(names) != set(df.columns):
+            raise ValueError(f"Column mismatch: store has {names}, got {list(df.columns)}")
+
+        for col in meta['columns']:
+            values = self._encode(col, df[col['name']])
+            path = self._column_path(col['name'])
+            with open(path, 'r+b') as f:
+                f.truncate(meta['n_rows'] * np.dtype(col['storage']).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(values.tobytes())
+
+        meta['n_rows'] += len(df)
+        self._write_meta(meta)
+
+    def truncate(self, n_rows):
+        """Drops every row after the first `n_rows` (the data files shrink on the next append)."""
+        meta = self._read_meta()
+        meta['n_rows'] = min(n_rows, meta['n_rows'])
+        meta['write_id'] = uuid.uuid4().hex
+        self._write_meta(meta)
+
+    # --- READ PATH ---
+
+    def load(self, columns=None, start=None, end=None, last_days=None):
+        """
+        Loads the history as a DataFrame.
+        Only the requested `columns` are read, and rows can be limited to a
+        [start, end] date range or to the `last_days` days before the latest date.
+        Column files are memory-mapped, so skipped rows are never parsed.
+        """
+        meta = self._read_meta()
+        n = meta['n_rows']
+        specs = {col['name']: col for col in meta['columns']}
+        columns = list(specs) if columns is None else [c for c in specs if c in columns]
+
+        mask = None
+        if start is not None or end is not None or last_days is not None:
+            dates = self._read_column(specs['Date'], n)
+            if last_days is not None and n > 0:
+                start = dates.max() - pd.Timedelta(days=last_days - 1)
+            mask = np.ones(n, dtype=bool)
+            if start is not None:
+                mask &= dates >= np.datetime64(pd.Timestamp(start))
+            if end is not None:
+                mask &= dates <= np.datetime64(pd.Timestamp(end))
+
+        return pd.DataFrame({name: self._read_column(specs[name], n, mask) for name in columns})
+
+    # --- CSV IMPORT / EXPORT ---
+
+    def import_csv(self, path):
+        """Replaces the stored history with the contents of a history CSV (in compact dtypes)."""
+        self.write(compact_frame(pd.read_csv(path, parse_dates=['Date'])))
+
+    def export_csv(self, path, **load_kwargs):
+        """Writes the stored history (or a slice of it) to CSV."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.load(**load_kwargs).to_csv(path, index=False)
+
+    # --- INTERNALS ---
+
+    def _column_path(self, name):
+        return os.path.join(self.root, f"{name}.bin")
+
+    def _read_meta(self):
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp = self.meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.meta_path)
+
+    @staticmethod
+    def _describe(series):
+        dtype = series.dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype) or pd.api.types.is_numeric_dtype(dtype):
+            return {'name': series.name, 'kind': 'raw', 'storage': str(dtype)}
+        return {
+            'name': series.name, 'kind': 'category', 'storage': 'int32',
+            'as_category': isinstance(dtype, pd.CategoricalDtype), 'categories': []
+        }
+
+    @staticmethod
+    def _encode(col, series):
+        if col['kind'] == 'raw':
+            return series.to_numpy().astype(col['storage'], copy=False)
+        # New labels are added to the category list; existing codes never change
+        categories = col['categories']
+        lookup = {label: code for code, label in enumerate(categories)}
+        for label in pd.unique(series.astype(object)):
+            if label not in lookup:
+                lookup[label] = len(categories)
+                categories.append(label)
+        return series.astype(object).map(lookup).to_numpy().astype(col['storage'])
+
+    def _read_column(self, col, n, mask=None):
+        storage = np.dtype(col['storage'])
+        if n == 0:
+            raw = np.empty(0, dtype=storage)
+        else:
+            raw = np.memmap(self._column_path(col['name']), dtype=storage, mode='r', shape=(n,))
+        # Copy out of the mapping so the file can be appended/truncated later
+        values = np.array(raw if mask is None else raw[mask])
+        if col['kind'] == 'raw':
+            return values
+        if col['as_category']:
+            return pd.Categorical.from_codes(values, categories=col['categories'])
+        return np.asarray(col['categories'], dtype=object)[values]
@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from .data_generator import GENERATED_COLUMNS, calendar_flags, revenue_and_cost, split_denominations
+from .features import add_incremental_features, build_feature_tail
+from .history_store import ColumnLogStore
+from .metrics import METRICS, process_memory_bytes
+from .schema import compact_frame
+from .simulation_engine import demand_sums
+
+# Columns read from a transaction CSV (atm_cash_management_dataset.csv schema)
+SOURCE_COLUMNS = ['ATM_ID', 'Date', 'Total_Withdrawals', 'Total_Deposits', 'Location_Type',
+                  'Holiday_Flag', 'Special_Event_Flag']
+HISTORY_COLUMNS = GENERATED_COLUMNS + ['Net_Cash_Flow', 'Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
+DEFAULT_HEALTH = 100.0 # The dataset has no machine health; ingested ATMs start healthy
+DEFAULT_CHUNKSIZE = 100000
+# Dataset Location_Type -> the engine's demand categories (schema.LOCATION_TYPES):
+# retail sites see Market demand, standalone kiosks Residential. Unknown types count as Residential.
+LOCATION_CATEGORIES = {
+    'Market': 'Market', 'Residential': 'Residential',
+    'Mall': 'Market', 'Supermarket': 'Market', 'Gas Station': 'Market', 'Bank Branch': 'Market',
+    'Standalone': 'Residential',
+}
+
+def parse_atm_ids(values):
+    """'ATM_0041' -> 41 (plain integer IDs pass through)."""
+    if pd.api.types.is_integer_dtype(values):
+        return values.to_numpy().astype(np.int64)
+    # Each distinct ID is parsed once (a chunk has far fewer ATMs than rows)
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_numeric(pd.Series(uniques).astype(str).str.extract(r'(\d+)\s*$')[0]).to_numpy(np.int64)
+    return parsed[codes]
+
+def parse_dates(values):
+    """ISO date strings -> datetime64, parsing each distinct date once."""
+    codes, uniques = pd.factorize(values)
+    return pd.to_datetime(uniques, format='%Y-%m-%d').normalize().to_numpy()[codes]
+
+def map_location_types(values):
+    """Dataset location types -> engine categories (see LOCATION_CATEGORIES), mapping each distinct value once."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.array([LOCATION_CATEGORIES.get(str(u).strip(), 'Residential') for u in uniques], dtype=object)
+    return mapped[codes]
+
+def daily_partials(chunk):
+    """
+    Aggregates one chunk of intraday rows to one row per (Date, ATM).
+    Sums and maxima are associative, so partials of the same day from
+    different chunks can be combined later.
+    """
+    df = pd.DataFrame({
+        'Date': parse_dates(chunk['Date']),
+        'ATM_ID': parse_atm_ids(chunk['ATM_ID']),
+        'Withdrawals': chunk['Total_Withdrawals'].astype(np.int64),
+        'Deposits': chunk['Total_Deposits'].astype(np.int64),
+        'Is_Festival': (chunk['Holiday_Flag'].astype(bool) | chunk['Special_Event_Flag'].astype(bool)).astype(np.int8),
+        'Location_Type': map_location_types(chunk['Location_Type']),
+    })
+    return combine_partials(df)
+
+def combine_partials(df):
+    return df.groupby(['Date', 'ATM_ID'], sort=False, as_index=False).agg(
+        Withdrawals=('Withdrawals', 'sum'), Deposits=('Deposits', 'sum'),
+        Is_Festival=('Is_Festival', 'max'), Location_Type=('Location_Type', 'last'))
+
+def to_engine_rows(daily):
+    """Daily per-ATM totals -> rows in the engine's history schema (without features)."""
+    withdraw = daily['Withdrawals'].to_numpy()
+    deposit = daily['Deposits'].to_numpy()
+    is_weekend, is_payday = calendar_flags(daily['Date'])
+    health = np.full(len(daily), DEFAULT_HEALTH)
+    revenue, cost = revenue_and_cost(withdraw, deposit, health)
+    return pd.DataFrame({
+        'Date': daily['Date'].to_numpy(),
+        'ATM_ID': daily['ATM_ID'].to_numpy(),
+        'Location_Type': daily['Location_Type'].to_numpy(),
+        'Is_Weekend': is_weekend,
+        'Is_Payday': is_payday,
+        'Is_Festival': daily['Is_Festival'].to_numpy(),
+        'Withdrawals': withdraw,
+        'Deposits': deposit,
+        **split_denominations(withdraw, deposit),
+        'Health': health,
+        'Revenue': revenue,
+        'Cost': cost,
+        'Net_Cash_Flow': deposit - withdraw,
+    })
+
+def ingest_csv(path, store_dir, chunksize=DEFAULT_CHUNKSIZE, replace=True):
+    """
+    Streams a transaction CSV (intraday rows: ATM_ID, Date, Time_of_Day,
+    Total_Withdrawals, Total_Deposits, ...) into a history store.
+
+    1. Chunks of `chunksize` rows are aggregated to daily (Date, ATM) partials
+       and spilled to disk, partitioned by month (the file need not be sorted).
+    2. Months are then processed in date order: partials are combined into
+       daily rows in the engine schema, features are computed incrementally
+       from the per-ATM tail buffer, and the rows are appended to the store.
+    Memory is bounded by one chunk plus one month of daily rows, whatever the
+    file size. Columns the engine has no place for (Time_of_Day,
+    Previous_Day_Cash_Level, Weather_Condition, ...) are not stored; Health is
+    set to DEFAULT_HEALTH. Per-ATM demand sums are recorded with the store, so
+    simulated days follow each ATM's own demand level (see demand_scales).
+
+    replace: rewrite the store; otherwise append, skipping days not newer than
+    the store's latest date.
+    Returns a report (row counts, rows/sec, peak memory).
+    """
+    start = time.perf_counter()
+    store = ColumnLogStore(store_dir)
+    spill_dir = tempfile.mkdtemp(prefix='atm_ingest_')
+    report = {"input_rows": 0, "chunks": 0, "daily_rows": 0, "skipped_rows": 0, "months": 0}
+    peak_memory = process_memory_bytes()
+
+    try:
+        # 1. Chunked read -> daily partials spilled per month
+        for i, chunk in enumerate(pd.read_csv(path, usecols=SOURCE_COLUMNS, chunksize=chunksize)):
+            partials = daily_partials(chunk)
+            for month, part in partials.groupby(partials['Date'].to_numpy().astype('datetime64[M]'), sort=False):
+                month_dir = os.path.join(spill_dir, str(np.datetime64(month, 'M')))
+                os.makedirs(month_dir, exist_ok=True)
+                part.to_pickle(os.path.join(month_dir, f'{i:06d}.pkl'))
+            report['input_rows'] += len(chunk)
+            report['chunks'] += 1
+            METRICS.inc('atm_rows_total', len(chunk), stage='ingested')
+            peak_memory = max(peak_memory or 0, process_memory_bytes() or 0)
+        print(f"Read {report['input_rows']} rows in {report['chunks']} chunks; writing daily history...")
+
+        # 2. Months in date order -> engine rows with features -> store
+        if replace or not store.exists():
+            last_date = None
+            tail = pd.DataFrame({'ATM_ID': np.empty(0, np.int32), 'Date': np.empty(0, 'datetime64[us]'),
+                                 'Net_Cash_Flow': np.empty(0, np.int32)})
+        else:
+            existing = store.load(columns=['ATM_ID', 'Date', 'Net_Cash_Flow'])
+            last_date = existing['Date'].max()
+            tail = build_feature_tail(existing)
+            del existing
+        columns = HISTORY_COLUMNS if replace or not store.exists() else store.column_names()
+        stored_sums = None if replace else store.attrs().get('demand_sums')
+        sums = None if stored_sums is None else pd.DataFrame(stored_sums).set_index('ATM_ID')
+
+        atm_ids, written = set(), False
+        for month in sorted(os.listdir(spill_dir)):
+            month_dir = os.path.join(spill_dir, month)
+            parts = [pd.read_pickle(os.path.join(month_dir, f)) for f in sorted(os.listdir(month_dir))]
+            daily = combine_partials(pd.concat(parts, ignore_index=True))
+            if last_date is not None:
+                stale = daily['Date'] <= last_date
+                report['skipped_rows'] += int(stale.sum())
+                daily = daily[~stale]
+            if daily.empty:
+                continue
+            rows = to_engine_rows(daily.sort_values(['Date', 'ATM_ID']))
+            rows, tail = add_incremental_features(compact_frame(rows), tail)
+            rows = compact_frame(rows)[columns]
+            if replace and not written:
+                store.write(rows)
+            else:
+                store.append(rows)
+            written = True
+            month_sums = demand_sums(rows)
+            sums = month_sums if sums is None else sums.add(month_sums, fill_value=0)
+            atm_ids.update(rows['ATM_ID'].tolist())
+            report['daily_rows'] += len(rows)
+            report['months'] += 1
+            peak_memory = max(peak_memory or 0, process_memory_bytes() or 0)
+        if written:
+            store.set_attrs({**store.attrs(), 'demand_sums': sums.reset_index().to_dict('list')})
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    report.update(
+        atms=len(atm_ids),
+        seconds=round(seconds, 3),
+        rows_per_second=round(report['input_rows'] / seconds) if seconds else None,
+        peak_memory_mb=round(peak_memory / 1e6, 1) if peak_memory else None
+    )
+    print(f"Ingested {report['input_rows']} rows -> {report['daily_rows']} daily rows for {report['atms']} ATMs "
+          f"in {seconds:.2f}s ({report['rows_per_second']} rows/s)")
+    return report
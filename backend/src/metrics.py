@@ -0,0 +1,221 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency buckets (seconds) shared by every histogram
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'atm_stage_duration_seconds': 'Duration of internal pipeline stages.',
+    'atm_http_request_duration_seconds': 'Duration of API requests by route.',
+    'atm_rows_total': 'History rows processed by stage.',
+}
+
+class Histogram:
+    """Fixed-bucket latency histogram (Prometheus semantics: cumulative `le` buckets)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    In-process metrics: latency histograms and counters keyed by name + labels.
+    Recording is a dict lookup and a few additions under one lock, cheap enough
+    for every request and pipeline stage. `render` writes the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def time(self, stage):
+        """Times the block into atm_stage_duration_seconds{stage=...}."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('atm_stage_duration_seconds', time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage):
+        """Decorator form of `time`."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=()):
+        """
+        Prometheus text exposition of all metrics plus `gauges`, a list of
+        (name, type, help, value, labels) sampled by the caller at scrape time.
+        """
+        with self._lock:
+            histograms = {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name in sorted({k[0] for k in histograms}):
+            lines += [f"# HELP {name} {METRIC_HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + (float('inf'),), counts):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for name in sorted({k[0] for k in counters}):
+            lines += [f"# HELP {name} {METRIC_HELP.get(name, name)}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_labels(labels)} {value}" for (metric, labels), value in sorted(counters.items())
+                      if metric == name]
+
+        seen = set()
+        for name, kind, help_text, value, labels in gauges:
+            if value is None:
+                continue
+            if name not in seen:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                seen.add(name)
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def process_memory_bytes():
+    """Resident memory of this process (Linux /proc; None elsewhere)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+# Process-wide registry used by the engine, optimizer and API
+METRICS = MetricsRegistry()
+
+# --- SAMPLING PROFILER ---
+
+class SamplingProfiler:
+    """
+    Statistical profiler: a background thread records the Python stack of every
+    other thread every `interval` seconds. The result is in folded-stack format
+    ("frame;frame;frame count" per line), ready for flamegraph tools.
+    Overhead is one stack walk per thread per sample, and only while running.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.folded()
+
+    def folded(self):
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+class SlowRequestProfiler:
+    """
+    Opt-in hook that captures one slow request: once armed, requests are
+    profiled one at a time and the first one slower than `min_ms` keeps its
+    profile (then the hook disarms). Profiles cover every thread during that
+    request, so concurrent requests may appear in it too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.armed = False
+        self.min_ms = None
+        self.active = None
+        self.capture = None
+
+    def arm(self, min_ms=500, interval_ms=5):
+        with self._lock:
+            self.armed, self.min_ms, self.interval = True, min_ms, interval_ms / 1000.0
+            self.capture = None
+
+    def begin(self):
+        """Starts profiling this request if armed and idle. Returns the profiler or None."""
+        with self._lock:
+            if not self.armed or self.active is not None:
+                return None
+            self.active = SamplingProfiler(self.interval).start()
+            return self.active
+
+    def end(self, profiler, route, elapsed_ms):
+        folded = profiler.stop()
+        with self._lock:
+            self.active = None
+            if self.armed and elapsed_ms >= self.min_ms:
+                self.armed = False
+                self.capture = {"route": route, "duration_ms": round(elapsed_ms, 1),
+                                "captured_at": time.strftime('%Y-%m-%dT%H:%M:%S'), "folded": folded}
+
+    def status(self):
+        with self._lock:
+            return {"armed": self.armed, "min_ms": self.min_ms,
+                    "captured": None if self.capture is None else
+                    {k: v for k, v in self.capture.items() if k != 'folded'}}
+
+PROFILER = SlowRequestProfiler()
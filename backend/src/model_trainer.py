@@ -1,17 +1,37 @@
-import xgboost as xgb
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import mean_absolute_error
+import numpy as np
+import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from .features import MODEL_FEATURES
 
-def train_model(df):
+# xgboost (which pulls in sklearn) and sklearn take about a second to import,
+# so they are imported inside the functions: the API can start serving before
+# any model code is loaded.
+
+DEFAULT_PARAMS = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 5}
+WARM_START_RATE = 0.5 # Learning rate of warm-started trees, relative to the model's own (see continue_training)
+
+# Hyperparameter grid for search_hyperparameters (every combination is tried)
+SEARCH_GRID = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.05, 0.1],
+    'n_estimators': [100, 200],
+}
+
+def train_model(df, params=None, n_jobs=None):
     """
     Trains an XGBoost model on the provided dataframe.
     Returns the trained model and the MAE on test set.
+    params: overrides DEFAULT_PARAMS (e.g. the best configuration of a search).
     """
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error
+
     # Define Features & Target
-    features = ['ATM_ID', 'Is_Weekend', 'Is_Payday', 'Is_Festival', 'Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
-    X = df[features]
+    X = df[MODEL_FEATURES]
     y = df['Net_Cash_Flow']
 
     # Train/Test Split
@@ -19,8 +39,7 @@ def train_model(df):
 
     # Train XGBoost Model
     print("Training XGBoost Model...")
-    model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=100, learning_rate=0.1, max_depth=5)
-    model.fit(X_train, y_train)
+    model = fit_model(X_train, y_train, params, n_jobs)
 
     # Evaluate Performance
     preds = model.predict(X_test)
@@ -29,14 +48,257 @@ def train_model(df):
     
     return model, mae
 
+def fit_model(X, y, params=None, n_jobs=None):
+    """Fits an XGBoost model on every row of X / y (no holdout, no output)."""
+    import xgboost as xgb
+    model = xgb.XGBRegressor(objective='reg:squarederror', n_jobs=n_jobs, **{**DEFAULT_PARAMS, **(params or {})})
+    model.fit(X, y)
+    return model
+
+# --- PARALLEL TRAINING (search and per-segment models) ---
+
+def split_cpu_budget(n_tasks, cpu_budget=None):
+    """
+    Splits `cpu_budget` cores (default: all) between concurrent fits.
+    Returns (parallel fits, xgboost threads per fit); their product never exceeds the budget.
+    """
+    cpu_budget = max(1, cpu_budget or os.cpu_count() or 1)
+    workers = max(1, min(n_tasks, cpu_budget))
+    return workers, max(1, cpu_budget // workers)
+
+def _run_fits(tasks, cpu_budget=None):
+    """
+    Runs `tasks` (functions taking n_jobs) concurrently within the CPU budget.
+    Threads are enough: xgboost releases the GIL while it trains.
+    """
+    workers, threads = split_cpu_budget(len(tasks), cpu_budget)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda task: task(threads), tasks))
+
+def _fit_and_score(params, train, valid, n_jobs):
+    import xgboost as xgb
+    start = time.perf_counter()
+    model = xgb.XGBRegressor(objective='reg:squarederror', n_jobs=n_jobs, **params)
+    model.fit(train[MODEL_FEATURES], train['Net_Cash_Flow'])
+    mae = float(np.mean(np.abs(model.predict(valid[MODEL_FEATURES]) - valid['Net_Cash_Flow'].to_numpy())))
+    return model, mae, time.perf_counter() - start
+
+def time_series_folds(df, n_splits=3):
+    """
+    Expanding-window CV over dates: the date range is cut into n_splits + 1 blocks
+    and fold k trains on blocks 0..k and validates on block k + 1 (never on the past).
+    Returns a list of (train rows, validation rows).
+    """
+    dates = np.sort(df['Date'].unique())
+    bounds = [dates[len(dates) * k // (n_splits + 1)] for k in range(1, n_splits + 1)]
+    bounds.append(dates[-1] + np.timedelta64(1, 'D'))
+    return [
+        (df[df['Date'] < bounds[k]], df[(df['Date'] >= bounds[k]) & (df['Date'] < bounds[k + 1])])
+        for k in range(n_splits)
+    ]
+
+def search_hyperparameters(df, grid=None, n_splits=3, cpu_budget=None):
+    """
+    Time-series cross-validated grid search. Every (configuration, fold) fit runs
+    in parallel within `cpu_budget` cores.
+    Returns (best params, report sorted by mean MAE); each report entry has the
+    configuration, its per-fold and mean MAE and its total fit time.
+    """
+    grid = grid or SEARCH_GRID
+    configs = [dict(zip(grid, values)) for values in product(*grid.values())]
+    folds = time_series_folds(df, n_splits)
+    tasks = [(c, f) for c in range(len(configs)) for f in range(len(folds))]
+    workers, threads = split_cpu_budget(len(tasks), cpu_budget)
+    print(f"Searching {len(configs)} configurations x {len(folds)} folds "
+          f"({workers} parallel fits x {threads} threads)...")
+
+    start = time.perf_counter()
+    results = _run_fits([
+        lambda n_jobs, c=c, f=f: _fit_and_score(configs[c], *folds[f], n_jobs)[1:] for c, f in tasks
+    ], cpu_budget)
+
+    report = []
+    for c, params in enumerate(configs):
+        scores = [results[i] for i, (tc, _) in enumerate(tasks) if tc == c]
+        report.append({
+            "params": params,
+            "fold_mae": [round(mae, 2) for mae, _ in scores],
+            "mae": round(float(np.mean([mae for mae, _ in scores])), 2),
+            "fit_seconds": round(sum(seconds for _, seconds in scores), 3)
+        })
+    report.sort(key=lambda r: r['mae'])
+    print(f"Search done in {time.perf_counter() - start:.1f}s. Best: {report[0]['params']} (MAE {report[0]['mae']:.2f})")
+    return report[0]['params'], report
+
+def segment_atms(df, segment_by='Location_Type', n_clusters=4):
+    """
+    Assigns every ATM to a segment: its `segment_by` column value, or with
+    segment_by='cluster', a k-means cluster of its flow profile (mean and
+    spread of the net flow, weekend and payday lift).
+    Returns a Series indexed by ATM_ID.
+    """
+    if segment_by != 'cluster':
+        return df.groupby('ATM_ID')[segment_by].last().astype(str)
+    from sklearn.cluster import KMeans
+    flow = df['Net_Cash_Flow']
+    grouped = flow.groupby(df['ATM_ID'])
+    profile = pd.DataFrame({
+        'mean': grouped.mean(),
+        'std': grouped.std().fillna(0),
+        'weekend': flow[df['Is_Weekend'] == 1].groupby(df['ATM_ID']).mean() - grouped.mean(),
+        'payday': flow[df['Is_Payday'] == 1].groupby(df['ATM_ID']).mean() - grouped.mean(),
+    }).fillna(0)
+    scaled = (profile - profile.mean()) / profile.std().replace(0, 1).fillna(1)
+    k = min(n_clusters, len(profile))
+    labels = KMeans(n_clusters=k, n_init=10, random_state=0).fit_predict(scaled.to_numpy())
+    return pd.Series([f"cluster_{label}" for label in labels], index=profile.index)
+
+class SegmentedModel:
+    """
+    One XGBoost model per ATM segment, used like a single model: `predict`
+    routes each row to its ATM's segment model (ATMs not seen in training go
+    to the largest segment). Saved as one JSON file holding every booster.
+    """
+
+    def __init__(self, models, segment_of, segment_by=None):
+        self.models = models # {segment: XGBRegressor}
+        self.segment_of = segment_of.sort_index() # ATM_ID -> segment
+        self.segment_by = segment_by
+        self.default = segment_of.value_counts().idxmax()
+
+    def segments(self, atm_ids):
+        """Segment name of each ATM ID (vectorized lookup)."""
+        known = self.segment_of.index.to_numpy()
+        atm_ids = np.asarray(atm_ids)
+        pos = np.clip(np.searchsorted(known, atm_ids), 0, len(known) - 1)
+        return np.where(known[pos] == atm_ids, self.segment_of.to_numpy()[pos], self.default)
+
+    def predict(self, X):
+        segments = self.segments(X['ATM_ID'].to_numpy())
+        preds = np.zeros(len(X), dtype=np.float32)
+        for name, model in self.models.items():
+            rows = segments == name
+            if rows.any():
+                preds[rows] = model.predict(X[rows])
+        return preds
+
+    def map_models(self, fn):
+        """New SegmentedModel with fn(segment, model) applied to every segment model."""
+        return SegmentedModel({name: fn(name, m) for name, m in self.models.items()}, self.segment_of, self.segment_by)
+
+    def to_dict(self):
+        return {
+            "segmented_model": 1,
+            "segment_by": self.segment_by,
+            "segment_of": {str(k): v for k, v in self.segment_of.items()},
+            "models": {name: model_to_bytes(m).decode() for name, m in self.models.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        models = {name: model_from_bytes(raw.encode()) for name, raw in data['models'].items()}
+        segment_of = pd.Series(data['segment_of'])
+        segment_of.index = segment_of.index.astype(np.int64)
+        return cls(models, segment_of, data['segment_by'])
+
+    def save_model(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+def train_segment_models(df, segment_by='Location_Type', params=None, cpu_budget=None, n_clusters=4,
+                         holdout=0.2):
+    """
+    Trains one model per ATM segment (see segment_atms), all in parallel within
+    `cpu_budget` cores. Each model is fitted on its segment's older dates and
+    scored on the newest `holdout` share of dates.
+    Returns (SegmentedModel, overall holdout MAE, per-segment report).
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    segment_of = segment_atms(df, segment_by, n_clusters)
+    dates = np.sort(df['Date'].unique())
+    cutoff = dates[int(len(dates) * (1 - holdout))]
+    row_segments = df['ATM_ID'].map(segment_of).to_numpy()
+    names = sorted(segment_of.unique())
+    splits = [(df[(row_segments == name) & (df['Date'] < cutoff)], df[(row_segments == name) & (df['Date'] >= cutoff)])
+              for name in names]
+    workers, threads = split_cpu_budget(len(names), cpu_budget)
+    print(f"Training {len(names)} segment models by {segment_by} ({workers} parallel fits x {threads} threads)...")
+
+    start = time.perf_counter()
+    results = _run_fits([lambda n_jobs, s=s: _fit_and_score(params, *s, n_jobs) for s in splits], cpu_budget)
+    report = [
+        {"segment": name, "atms": int((segment_of == name).sum()), "train_rows": len(train),
+         "holdout_rows": len(valid), "mae": round(mae, 2), "fit_seconds": round(seconds, 3)}
+        for name, (train, valid), (_, mae, seconds) in zip(names, splits, results)
+    ]
+    model = SegmentedModel({name: m for name, (m, _, _) in zip(names, results)}, segment_of, segment_by)
+    total = sum(len(valid) for _, valid in splits)
+    mae = sum(r['mae'] * r['holdout_rows'] for r in report) / total if total else float('nan')
+    print(f"Segment models trained in {time.perf_counter() - start:.1f}s. MAE: {mae:.2f}")
+    return model, mae, report
+
 def save_model(model, path='backend/models/xgb_model.json'):
     """Saves the trained model to disk."""
     os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not isinstance(model, SegmentedModel):
+        _keep_learning_rate(model)
     model.save_model(path)
     print(f"Model saved to {path}")
 
 def load_model(path='backend/models/xgb_model.json'):
-    """Loads the trained model from disk."""
+    """Loads the trained model (single or segmented) from disk."""
+    with open(path, 'rb') as f:
+        return model_from_bytes(f.read())
+
+def model_to_bytes(model):
+    """Serializes a model to raw JSON bytes (for passing between processes)."""
+    if isinstance(model, SegmentedModel):
+        return json.dumps(model.to_dict()).encode()
+    _keep_learning_rate(model)
+    return bytes(model.get_booster().save_raw('json'))
+
+def learning_rate_of(model):
+    """
+    The learning rate `model` was fitted with. xgboost does not save the sklearn
+    parameters, so it travels as a booster attribute (see _keep_learning_rate);
+    model files written without it are assumed to use DEFAULT_PARAMS'.
+    """
+    rate = model.get_booster().attr('learning_rate') or model.get_params().get('learning_rate')
+    return float(rate) if rate is not None else DEFAULT_PARAMS['learning_rate']
+
+def _keep_learning_rate(model):
+    model.get_booster().set_attr(learning_rate=str(learning_rate_of(model)))
+
+def model_from_bytes(raw):
+    """Inverse of model_to_bytes."""
+    import xgboost as xgb
+    if b'"segmented_model"' in raw[:32]:
+        return SegmentedModel.from_dict(json.loads(raw))
     model = xgb.XGBRegressor()
-    model.load_model(path)
+    model.load_model(bytearray(raw))
     return model
+
+def continue_training(model, df, n_rounds=20, learning_rate=None):
+    """
+    Warm-starts from `model` and adds `n_rounds` trees fitted on `df`
+    (xgboost training continuation via `xgb_model`). `model` is not modified.
+    A SegmentedModel continues each segment model on its own rows.
+    learning_rate: rate of the new trees. Default: WARM_START_RATE times the rate
+    the model was fitted with (learning_rate_of), so a few days of data refine
+    the model instead of overwriting it. The result keeps the model's own rate,
+    so repeated continuations do not keep shrinking it.
+    """
+    import xgboost as xgb
+    if isinstance(model, SegmentedModel):
+        segments = model.segments(df['ATM_ID'].to_numpy())
+        return model.map_models(lambda name, m: continue_training(m, df[segments == name], n_rounds, learning_rate)
+                                if (segments == name).any() else m)
+    skip = ('n_estimators', 'base_score') # base score comes from the booster itself
+    params = {k: v for k, v in model.get_params().items() if v is not None and k not in skip}
+    model_rate = learning_rate_of(model)
+    params['learning_rate'] = WARM_START_RATE * model_rate if learning_rate is None else learning_rate
+    params.setdefault('max_depth', 5)
+    updated = xgb.XGBRegressor(**params, n_estimators=n_rounds)
+    updated.fit(df[MODEL_FEATURES], df['Net_Cash_Flow'], xgb_model=model.get_booster())
+    updated.get_booster().set_attr(learning_rate=str(model_rate))
+    return updated
@@ -1,10 +1,64 @@
 import pandas as pd
 import numpy as np
+from .data_generator import calendar_flags
+from .features import LAG_DAYS, MODEL_FEATURES, ROLLING_WINDOW
+from .flow_optimizer import VAULT_ID, plan_min_cost_transfers, schedule_cost
+from .metrics import METRICS
 
-def run_optimization_logic(predictions, atm_ids, min_threshold=100000, max_threshold=100000):
+OPTIMIZER_MODES = ('greedy', 'min_cost')
+
+# Flow thresholds of each risk profile (CashService.update_config, the backtester)
+RISK_PROFILES = {
+    'aggressive': {'min_cash_threshold': 50000, 'max_cash_threshold': 300000},
+    'moderate': {'min_cash_threshold': 100000, 'max_cash_threshold': 500000},
+    'conservative': {'min_cash_threshold': 200000, 'max_cash_threshold': 800000},
+}
+
+def greedy_schedule(surplus_atms, deficit_atms):
+    """
+    Greedy matching: each deficit ATM takes from the first surplus ATM in the list,
+    otherwise gets a vault refill. Mutates the amounts in the given lists.
+    """
+    schedule = []
+    for def_atm in deficit_atms:
+        if surplus_atms:
+            surplus = surplus_atms[0] # Pick the first available surplus ATM
+            transfer_amt = min(surplus['amount'], def_atm['amount'])
+            
+            schedule.append({
+                "action": "INTER_ATM_TRANSFER",
+                "source": surplus['id'],
+                "destination": def_atm['id'],
+                "amount": transfer_amt,
+                "notes": "Saved 1 Vault Trip"
+            })
+            
+            # Update remaining amounts
+            surplus['amount'] -= transfer_amt
+            def_atm['amount'] -= transfer_amt
+            
+            # If surplus ATM is drained, remove it from list
+            if surplus['amount'] < 50000:
+                surplus_atms.pop(0)
+        else:
+            schedule.append({
+                "action": "VAULT_REFILL",
+                "source": VAULT_ID,
+                "destination": def_atm['id'],
+                "amount": def_atm['amount'],
+                "notes": "Standard Refill"
+            })
+    return schedule
+
+@METRICS.timed('optimizer')
+def run_optimization_logic(predictions, atm_ids, min_threshold=100000, max_threshold=100000,
+                           mode='greedy', costs=None):
     """
     Runs the logistics algorithm to determine rebalancing actions.
     Returns structured data for the API/Dashboard.
+    mode: 'greedy' (first-fit matching) or 'min_cost' (transportation LP over the
+    travel + CIT cost matrix, see flow_optimizer). 'min_cost' also reports the
+    cost saved versus the greedy plan.
     """
     surplus_atms = [] # Cash Heavy
     deficit_atms = [] # Cash Starved
@@ -30,71 +84,113 @@ def run_optimization_logic(predictions, atm_ids, min_threshold=100000, max_thres
             "status": status
         })
 
-    # 2. OPTIMIZED REBALANCING (Greedy Algorithm)
-    if not deficit_atms:
-        pass # No critical deficits
+    # 2. REBALANCING
+    if mode == 'min_cost':
+        results["rebalancing_schedule"] = plan_min_cost_transfers(surplus_atms, deficit_atms, costs)
+        
+        # Compare against the greedy plan (its uncovered deficits topped up from the vault)
+        remaining = [dict(d) for d in deficit_atms]
+        greedy = greedy_schedule([dict(s) for s in surplus_atms], remaining)
+        refilled = {a['destination'] for a in greedy if a['source'] == VAULT_ID}
+        greedy += [
+            {"action": "VAULT_REFILL", "source": VAULT_ID, "destination": d['id'], "amount": d['amount']}
+            for d in remaining if d['amount'] > 0 and d['id'] not in refilled
+        ]
+        greedy_cost = schedule_cost(greedy, costs)
+        optimized_cost = schedule_cost(results["rebalancing_schedule"], costs)
+        results["cost_summary"] = {
+            "greedy_cost": round(float(greedy_cost), 2),
+            "optimized_cost": round(float(optimized_cost), 2),
+            "cost_saved": round(float(greedy_cost - optimized_cost), 2)
+        }
+    elif mode == 'greedy':
+        results["rebalancing_schedule"] = greedy_schedule(surplus_atms, deficit_atms)
     else:
-        for def_atm in deficit_atms:
-            if surplus_atms:
-                surplus = surplus_atms[0] # Pick the first available surplus ATM
-                transfer_amt = min(surplus['amount'], def_atm['amount'])
-                
-                results["rebalancing_schedule"].append({
-                    "action": "INTER_ATM_TRANSFER",
-                    "source": surplus['id'],
-                    "destination": def_atm['id'],
-                    "amount": transfer_amt,
-                    "notes": "Saved 1 Vault Trip"
-                })
-                
-                # Update remaining amounts
-                surplus['amount'] -= transfer_amt
-                def_atm['amount'] -= transfer_amt
-                
-                # If surplus ATM is drained, remove it from list
-                if surplus['amount'] < 50000:
-                    surplus_atms.pop(0)
-            else:
-                results["rebalancing_schedule"].append({
-                    "action": "VAULT_REFILL",
-                    "source": "CENTRAL_VAULT",
-                    "destination": def_atm['id'],
-                    "amount": def_atm['amount'],
-                    "notes": "Standard Refill"
-                })
+        raise ValueError(f"Unknown optimizer mode: {mode}")
                 
     return results
 
-def predict_next_day(model, df, min_threshold=100000, max_threshold=500000):
+def recent_flows(df, days=LAG_DAYS):
     """
-    Simulates input for the next day based on the latest data in df.
+    Latest `days` Net_Cash_Flow values of every ATM in one grouped pass.
+    Returns (atm_ids, [ATM x days] matrix oldest-first, NaN-padded for short histories).
+    Rows of each ATM must be in date order (as the engine keeps them).
     """
-    input_data = []
-    atm_ids = [0, 1, 2, 3, 4]
-    
-    for atm in atm_ids:
-        # Get the most recent known values for this ATM to build Lag features
-        last_7_days = df[df['ATM_ID'] == atm].iloc[-7:] 
-        
-        if len(last_7_days) < 7:
-             lag_7_val = 0
-             roll_3_val = 0
-        else:
-            lag_7_val = last_7_days['Net_Cash_Flow'].values[0]
-            roll_3_val = last_7_days['Net_Cash_Flow'].tail(3).mean()
-        
-        input_data.append({
-            'ATM_ID': atm,
-            'Is_Weekend': 0,    # Assuming Weekday for demo
-            'Is_Payday': 1,     # Assuming it's a Payday
-            'Is_Festival': 0,
-            'Net_Flow_Lag_7': lag_7_val,
-            'Net_Flow_Rolling_3': roll_3_val
-        })
-    
-    input_df = pd.DataFrame(input_data)
-    # Reorder columns to match training
-    features = ['ATM_ID', 'Is_Weekend', 'Is_Payday', 'Is_Festival', 'Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
-    predictions = model.predict(input_df[features])
-    
-    return run_optimization_logic(predictions, atm_ids, min_threshold, max_threshold)
+    ids = df['ATM_ID'].to_numpy()
+    order = np.argsort(ids, kind='stable')
+    ids, values = ids[order], df['Net_Cash_Flow'].to_numpy()[order].astype(np.float64)
+
+    # Group boundaries of the sorted IDs, and each row's distance from its ATM's latest day
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    atm_ids = ids[starts]
+    counts = np.diff(np.r_[starts, len(ids)])
+    slot = np.repeat(np.arange(len(atm_ids)), counts)
+    from_end = np.repeat(starts + counts, counts) - 1 - np.arange(len(ids))
+
+    # Right-align so the last column is always the latest day
+    keep = from_end < days
+    flows = np.full((len(atm_ids), days), np.nan)
+    flows[slot[keep], days - 1 - from_end[keep]] = values[keep]
+    return atm_ids, flows
+
+def next_day_features(atm_ids, flows, next_date, is_festival=0):
+    """
+    Model inputs for `next_date` for the whole fleet: real calendar flags plus
+    lag/rolling values from the recent flow matrix (0 when an ATM has < 7 days).
+    """
+    is_weekend, is_payday = calendar_flags([next_date])
+    n = len(atm_ids)
+    has_week = ~np.isnan(flows).any(axis=1)
+    return pd.DataFrame({
+        'ATM_ID': atm_ids,
+        'Is_Weekend': np.repeat(is_weekend, n),
+        'Is_Payday': np.repeat(is_payday, n),
+        'Is_Festival': np.full(n, is_festival),
+        'Net_Flow_Lag_7': np.where(has_week, flows[:, 0], 0),
+        'Net_Flow_Rolling_3': np.where(has_week, flows[:, -ROLLING_WINDOW:].mean(axis=1), 0),
+    })[MODEL_FEATURES]
+
+def forecast_horizon(model, df, horizon=1, event=None):
+    """
+    Recursive multi-day forecast for the whole fleet.
+    Each step scores every ATM in one model call, then feeds the predictions
+    back in as the newest day of the lag/rolling window for the next step.
+    `event` only affects the first day (it is the engine's next-day event).
+    Returns (atm_ids, dates, [ATM x horizon] predicted net flows).
+    """
+    atm_ids, flows = recent_flows(df)
+    first_date = pd.Timestamp(df['Date'].max()) + pd.Timedelta(days=1)
+    dates = pd.date_range(first_date, periods=horizon, freq='D')
+    predictions = np.empty((len(atm_ids), horizon))
+    for step, date in enumerate(dates):
+        is_festival = int(step == 0 and event == 'FESTIVAL')
+        features = next_day_features(atm_ids, flows, date, is_festival)
+        with METRICS.time('model_predict'):
+            predictions[:, step] = model.predict(features)
+        METRICS.inc('atm_rows_total', len(atm_ids), stage='scored')
+        flows = np.column_stack([flows[:, 1:], predictions[:, step]])
+    return atm_ids, dates, predictions
+
+def predict_next_day(model, df, min_threshold=100000, max_threshold=500000, event=None,
+                     mode='greedy', costs=None, horizon=1):
+    """
+    Forecasts the net flow of every ATM in `df` with one model call per day,
+    then runs the rebalancing logic.
+    With `horizon` > 1 the forecast runs recursively for that many days and the
+    rebalancing covers the cumulative flow over the horizon (one cash order
+    placed in advance); the per-day forecast is returned under "horizon".
+    `df` only needs the last 7 days per ATM (the engine's feature tail is enough).
+    """
+    atm_ids, dates, predictions = forecast_horizon(model, df, horizon, event)
+    results = run_optimization_logic(predictions.sum(axis=1), atm_ids.tolist(), min_threshold, max_threshold,
+                                     mode, costs)
+    if horizon > 1:
+        results["horizon"] = {
+            "days": horizon,
+            "dates": [str(d.date()) for d in dates],
+            "daily_forecast": [
+                {"atm_id": atm_id, "net_flows": flows}
+                for atm_id, flows in zip(atm_ids.tolist(), np.round(predictions).astype(np.int64).tolist())
+            ]
+        }
+    return results
@@ -0,0 +1,174 @@
+import asyncio
+import json
+from .metrics import METRICS
+
+HEARTBEAT_SECONDS = 15  # Comment line sent to idle streams so proxies keep them open
+QUEUE_SIZE = 16         # Messages buffered per subscriber; a slower one is resynced with a snapshot
+
+def encode_event(kind, version, data):
+    """One Server-Sent Events message (bytes), with the state version as its id."""
+    body = json.dumps(data, separators=(',', ':'), default=str)
+    return f"id: {version}\nevent: {kind}\ndata: {body}\n\n".encode()
+
+def diff_payload(old, new):
+    """
+    Compact delta between two dashboard payloads ({"status", "forecast"}), or
+    None when the client must start over from a snapshot (reset, model
+    loading/failing, fleet change).
+    Fields that did not change are left out; chart points are sent only when
+    newer than the old chart's last point, and ATM rows only when they changed.
+    """
+    if 'error' in old['forecast'] or 'error' in new['forecast'] or new['status']['date'] < old['status']['date']:
+        return None
+    old_rows = {row['atm_id']: row for row in old['forecast']['network_status']}
+    if len(old_rows) != len(new['forecast']['network_status']):
+        return None
+
+    # 1. Status: changed fields, plus the new chart points (the client keeps a 30-day window)
+    old_chart = old['status']['chart_data']
+    last_date = old_chart[-1]['date'] if old_chart else ''
+    delta = {
+        "status": {k: v for k, v in new['status'].items() if k != 'chart_data' and old['status'].get(k) != v},
+        "chart_append": [p for p in new['status']['chart_data'] if p['date'] > last_date],
+    }
+    # 2. Forecast: changed fields, plus the ATM rows that changed
+    delta['forecast'] = {k: v for k, v in new['forecast'].items()
+                         if k != 'network_status' and old['forecast'].get(k) != v}
+    delta['network_status'] = []
+    for row in new['forecast']['network_status']:
+        if row['atm_id'] not in old_rows:
+            return None
+        if old_rows[row['atm_id']] != row:
+            delta['network_status'].append(row)
+    return delta
+
+class UpdateFeed:
+    """
+    Pushes dashboard updates to every connected client (Server-Sent Events)
+    instead of having each dashboard poll.
+
+    The service calls `notify` after each published write (advance, event,
+    config, reset, model swap). The feed then builds the dashboard payload
+    once (through the service's versioned read cache, shared with the HTTP
+    reads), diffs it against the previous one, encodes one message and puts
+    the same bytes on every subscriber's queue. Bursts of writes coalesce:
+    a delta always covers everything since the last one sent. Nothing is
+    computed while nobody is subscribed.
+    """
+
+    def __init__(self, service, horizon=1):
+        self.service = service
+        self.horizon = horizon
+        self.subscribers = set()
+        self.pending = set()  # New subscribers waiting for their first snapshot
+        self.payload = None   # Last payload sent (what subscribers have)
+        self.version = None
+        self.snapshot = None  # Encoded snapshot of `payload`, built on demand
+        self.loop = None
+        self.wake = None
+        self.task = None
+
+    def start(self):
+        """Starts the feed on the running event loop and registers it with the service."""
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        self.service.listeners.append(self.notify)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops the feed; subscribers get None (end of stream)."""
+        if self.notify in self.service.listeners:
+            self.service.listeners.remove(self.notify)
+        for queue in list(self.subscribers):
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    def notify(self, view):
+        """Service listener; runs on the publishing (writer) thread."""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wake.set)
+
+    def subscribe(self, last_version=None):
+        """
+        Returns a new subscriber queue. It first receives a snapshot of the
+        current state, unless `last_version` (the SSE Last-Event-ID of a
+        reconnecting client) shows the client is already up to date.
+        """
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers.add(queue)
+        current = self.payload is not None and self.version == self.service.view.version
+        if current and str(last_version) == str(self.version):
+            pass
+        elif current:
+            queue.put_nowait(self._snapshot())
+        else:
+            self.pending.add(queue)
+            self.wake.set()
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        self.pending.discard(queue)
+
+    def metric_gauges(self):
+        """Point-in-time values for /metrics: (name, type, help, value, labels)."""
+        return [('atm_push_subscribers', 'gauge', 'Dashboards connected to the update stream.', len(self.subscribers), {})]
+
+    async def _run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            try:
+                await self._refresh()
+            except Exception as e:
+                print(f"Update feed error: {e}")
+
+    async def _refresh(self):
+        if not self.subscribers or self.service.view.version == self.version and not self.pending:
+            return
+        # 1. One payload for everyone (CPU-heavy forecast: off the event loop)
+        version, payload = await asyncio.to_thread(self._build)
+        if version == self.version:
+            new_version = False
+        else:
+            new_version = True
+            delta = diff_payload(self.payload, payload) if self.payload is not None else None
+            self.payload, self.version, self.snapshot = payload, version, None
+
+        # 2. One encoded message, fanned out to every queue
+        waiting, self.pending = self.pending, set()
+        if new_version:
+            if delta is None:
+                message, kind = self._snapshot(), 'snapshot'
+            else:
+                message, kind = encode_event('delta', version, delta), 'delta'
+            METRICS.inc('atm_push_messages_total', kind=kind)
+            for queue in self.subscribers - waiting:
+                self._put(queue, message)
+        for queue in waiting & self.subscribers:
+            self._put(queue, self._snapshot())
+
+    def _build(self):
+        view = self.service.view
+        with METRICS.time('push_payload'):
+            _, status = self.service.cached(self.service.get_status, view=view)
+            _, forecast = self.service.cached(self.service.get_forecast, self.horizon, view=view)
+        return view.version, {"status": status, "forecast": forecast}
+
+    def _snapshot(self):
+        if self.snapshot is None:
+            self.snapshot = encode_event('snapshot', self.version, self.payload)
+        return self.snapshot
+
+    def _put(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Too far behind to catch up with deltas: drop its backlog and resync
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self._snapshot())
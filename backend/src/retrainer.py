@@ -0,0 +1,220 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from .features import MODEL_FEATURES
+from .model_trainer import continue_training, model_from_bytes, model_to_bytes, train_model
+
+RETRAIN_ROUNDS = 20  # Trees added per incremental retrain
+DRIFT_WINDOW = 7     # Days of live forecast error averaged for the drift check
+TRAIN_COLUMNS = ['Date', 'Net_Cash_Flow'] + MODEL_FEATURES
+
+# --- WORKER PROCESS JOBS (module-level so they can be pickled) ---
+
+def _mae(model, df):
+    return float(np.mean(np.abs(model.predict(df[MODEL_FEATURES]) - df['Net_Cash_Flow'].to_numpy())))
+
+def incremental_job(raw_model, df, holdout_days, n_rounds=RETRAIN_ROUNDS):
+    """
+    Continues training `raw_model` on `df` minus its last `holdout_days` days,
+    then scores the old and new model on those held-out days.
+    """
+    start = time.perf_counter()
+    model = model_from_bytes(raw_model)
+    cutoff = np.sort(df['Date'].unique())[-holdout_days]
+    train, holdout = df[df['Date'] < cutoff], df[df['Date'] >= cutoff]
+    updated = continue_training(model, train, n_rounds)
+    return {
+        "model": model_to_bytes(updated),
+        "train_rows": len(train),
+        "holdout_rows": len(holdout),
+        "holdout_mae_before": _mae(model, holdout),
+        "holdout_mae_after": _mae(updated, holdout),
+        "train_seconds": round(time.perf_counter() - start, 3)
+    }
+
+def full_job(df):
+    """Trains a model from scratch (used when no model could be loaded)."""
+    start = time.perf_counter()
+    model, mae = train_model(df)
+    return {
+        "model": model_to_bytes(model),
+        "train_rows": len(df),
+        "holdout_rows": 0,
+        "holdout_mae_before": None,
+        "holdout_mae_after": float(mae),
+        "train_seconds": round(time.perf_counter() - start, 3)
+    }
+
+# --- SCHEDULER ---
+
+class ModelRetrainer:
+    """
+    Keeps the forecasting model current without blocking the API.
+
+    After every simulated day the writer calls `observe`, which scores the
+    serving model on the new day (live error) and applies the trigger policy:
+    retrain every `retrain_every_days` new days, or earlier when the recent
+    error exceeds `drift_threshold` x the reference error. Training runs in a
+    separate process (warm-started from the current booster on the days it has
+    not seen yet); `finish` accepts the result only if it does not do worse
+    on the held-out days. Jobs started before a reset are discarded.
+    """
+
+    def __init__(self, trained_rows=0):
+        self.pool = None              # Worker process, started on first use
+        self.job = None               # Running job description
+        self.generation = 0           # Bumped by rebase(); stale jobs are ignored
+        self.trained_rows = trained_rows  # History rows the serving model has been trained on
+        self.seen_rows = trained_rows     # History rows already scored by observe()
+        self.days_since_train = 0
+        self.daily_mae = deque(maxlen=DRIFT_WINDOW)
+        self.reference_mae = None
+        self.lock = threading.Lock()
+        self.stats = {"runs": 0, "accepted": 0, "rejected": 0, "failed": 0, "last_run": None}
+
+    def rebase(self, n_rows):
+        """Treats the first `n_rows` history rows as trained on (after a reset or reload)."""
+        with self.lock:
+            self.generation += 1
+            self.job = None
+            self.trained_rows = self.seen_rows = n_rows
+            self.days_since_train = 0
+            self.daily_mae.clear()
+            self.reference_mae = None
+
+    def drift(self):
+        """Recent live error relative to the reference error (None until both are known)."""
+        if not self.reference_mae or not self.daily_mae:
+            return None
+        return float(np.mean(self.daily_mae) / self.reference_mae)
+
+    def observe(self, state, model, config):
+        """
+        Scores `model` on history rows appended since the last call.
+        Returns the retrain reason ('schedule' or 'drift') or None.
+        """
+        n = len(state.history)
+        if model is None or n <= self.seen_rows:
+            return None
+        rows = pd.DataFrame(state.history.take(np.arange(self.seen_rows, n), TRAIN_COLUMNS))
+        with self.lock:
+            self.seen_rows = n
+            self.days_since_train += rows['Date'].nunique()
+            # One error per day, also when several days arrive at once (fast-forward)
+            errors = np.abs(model.predict(rows[MODEL_FEATURES]) - rows['Net_Cash_Flow'].to_numpy())
+            for mae in pd.Series(errors).groupby(rows['Date'].to_numpy()).mean():
+                self.daily_mae.append(float(mae))
+                if self.reference_mae is None and len(self.daily_mae) == DRIFT_WINDOW:
+                    self.reference_mae = float(np.mean(self.daily_mae))
+            if self.job is not None:
+                return None
+            if self.days_since_train >= config['retrain_every_days']:
+                return 'schedule'
+            drift = self.drift()
+            if drift is not None and drift > config['drift_threshold']:
+                return 'drift'
+        return None
+
+    def start(self, state, model, reason, config, on_done):
+        """
+        Submits an incremental retrain on the rows the model has not been trained on.
+        `on_done(job, future)` is called from a pool thread when it finishes.
+        Returns the job, or None if one is running or there is too little new data.
+        """
+        holdout_days = config['retrain_holdout_days']
+        with self.lock:
+            if self.job is not None:
+                return None
+            lo, hi = self.trained_rows, len(state.history)
+            rows = pd.DataFrame(state.history.take(np.arange(lo, hi), TRAIN_COLUMNS))
+            if rows['Date'].nunique() <= holdout_days:
+                return None
+            # Held-out days are trained on next time
+            n_holdout = int((rows['Date'] >= np.sort(rows['Date'].unique())[-holdout_days]).sum())
+            self.job = {
+                "generation": self.generation, "reason": reason, "kind": "incremental",
+                "rows": [lo, hi], "trained_until": hi - n_holdout, "started": time.time()
+            }
+            job = self.job
+        future = self._pool().submit(incremental_job, model_to_bytes(model), rows, holdout_days)
+        future.add_done_callback(lambda f: on_done(job, f))
+        print(f"Retraining started ({reason}) on {len(rows)} new rows...")
+        return job
+
+    def start_full(self, df, on_done):
+        """Submits a from-scratch training on `df` (no model to warm-start from)."""
+        with self.lock:
+            self.job = {
+                "generation": self.generation, "reason": "no_model", "kind": "full",
+                "rows": [0, len(df)], "trained_until": len(df), "started": time.time()
+            }
+            job = self.job
+        future = self._pool().submit(full_job, df)
+        future.add_done_callback(lambda f: on_done(job, f))
+        print("Training initial model in the background...")
+        return job
+
+    def finish(self, job, result=None, error=None):
+        """
+        Records a finished job. Returns the new model if it should be swapped in,
+        otherwise None (stale, failed, or worse on the holdout).
+        """
+        with self.lock:
+            if job['generation'] != self.generation:
+                return None
+            self.job = None
+            self.stats['runs'] += 1
+            run = {"reason": job['reason'], "kind": job['kind'], "rows": job['rows'],
+                   "wall_seconds": round(time.time() - job['started'], 3)}
+            if error is not None:
+                if isinstance(error, BrokenProcessPool):
+                    self.pool = None # The worker died; start a fresh one next time
+                self.stats['failed'] += 1
+                self.stats['last_run'] = {**run, "accepted": False, "error": str(error)}
+                return None
+
+            before, after = result['holdout_mae_before'], result['holdout_mae_after']
+            accepted = before is None or after <= before
+            run.update({k: v for k, v in result.items() if k != 'model'}, accepted=accepted)
+            self.stats['last_run'] = run
+            if not accepted:
+                self.stats['rejected'] += 1
+                self.days_since_train = 0 # Wait a full period before trying again
+                return None
+
+            self.stats['accepted'] += 1
+            self.trained_rows = job['trained_until']
+            self.days_since_train = 0
+            self.daily_mae.clear()
+            self.reference_mae = after
+            return model_from_bytes(result['model'])
+
+    def status(self):
+        with self.lock:
+            return {
+                "state": "training" if self.job else "idle",
+                "running_job": None if self.job is None else {
+                    k: self.job[k] for k in ('reason', 'kind', 'rows', 'started')
+                },
+                "days_since_train": self.days_since_train,
+                "trained_rows": self.trained_rows,
+                "recent_mae": round(float(np.mean(self.daily_mae)), 2) if self.daily_mae else None,
+                "reference_mae": None if self.reference_mae is None else round(self.reference_mae, 2),
+                "drift": None if self.drift() is None else round(self.drift(), 3),
+                **self.stats
+            }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _pool(self):
+        if self.pool is None:
+            # 'spawn': never fork a process that runs the API's threads
+            self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
@@ -0,0 +1,193 @@
+import time
+import numpy as np
+from .flow_optimizer import DEFAULT_COSTS, VAULT_ID, atm_coordinates
+from .metrics import METRICS
+
+ROAD_FACTOR = 1.3        # Road distance = straight line x 1.3 (same as flow_optimizer)
+SAVINGS_NEIGHBOURS = 20  # Candidate merges per job for the savings heuristic
+
+def _road_km(a, b):
+    return ROAD_FACTOR * np.sqrt(((np.asarray(a) - np.asarray(b)) ** 2).sum(axis=-1))
+
+def _build_jobs(schedule, cash_limit):
+    """
+    Turns schedule actions into route jobs. A refill is one stop (cash loaded at
+    the vault); a transfer is a pickup immediately followed by a drop. Jobs larger
+    than a truck's cash limit are split.
+    """
+    jobs = []
+    for action in schedule:
+        is_refill = action['source'] == VAULT_ID
+        amount = int(action['amount'])
+        pieces = max(1, -(-amount // cash_limit))
+        for p in range(pieces):
+            part = amount // pieces + (1 if p < amount % pieces else 0)
+            jobs.append({
+                'refill': is_refill,
+                'entry': action['destination'] if is_refill else action['source'],
+                'exit': action['destination'],
+                'amount': part,
+            })
+    return jobs
+
+class _Route:
+    __slots__ = ('jobs', 'vault_cash', 'max_transfer', 'stops')
+
+    def __init__(self, job, info):
+        self.jobs = [job]
+        self.vault_cash = info['amount'] if info['refill'] else 0
+        self.max_transfer = 0 if info['refill'] else info['amount']
+        self.stops = 1 if info['refill'] else 2
+
+    def load(self):
+        # Vault cash for every refill is on board from the start, plus one transfer in transit
+        return self.vault_cash + self.max_transfer
+
+@METRICS.timed('route_planner')
+def plan_routes(schedule, costs=None, coords=None, max_stops=8, time_budget_ms=200):
+    """
+    Groups a rebalancing schedule into capacitated CIT truck routes.
+
+    Every route starts and ends at the central vault, carries at most
+    `truck_cash_limit` and visits at most `max_stops` ATMs. Routes are built with
+    the Clarke-Wright savings heuristic (merges limited to each job's nearest
+    neighbours) and then improved by moving single jobs within a route. Both
+    phases stop when `time_budget_ms` is used up; the plan stays valid, only
+    less optimized.
+
+    Returns the routes plus trip/cost totals and the savings versus the
+    one-trip-per-action baseline.
+    """
+    from scipy.spatial import cKDTree # imported on first use (slow to import at startup)
+    costs = {**DEFAULT_COSTS, **(costs or {})}
+    deadline = time.perf_counter() + time_budget_ms / 1000.0
+    jobs = _build_jobs(schedule, costs['truck_cash_limit'])
+    n = len(jobs)
+
+    def lookup(ids):
+        if coords is None:
+            return atm_coordinates(ids)
+        return np.array([coords[i] for i in ids], dtype=np.float64).reshape(len(ids), 2)
+
+    entry_xy = lookup([j['entry'] for j in jobs])
+    exit_xy = lookup([j['exit'] for j in jobs])
+    from_vault = _road_km(entry_xy, 0)
+    to_vault = _road_km(exit_xy, 0)
+    inside = _road_km(entry_xy, exit_xy)
+
+    def route_km(seq):
+        km = from_vault[seq[0]] + to_vault[seq[-1]] + inside[seq].sum()
+        if len(seq) > 1:
+            km += _road_km(exit_xy[seq[:-1]], entry_xy[seq[1:]]).sum()
+        return km
+
+    # 1. Baseline: one vault round trip per schedule action
+    baseline_trips = len(schedule)
+    if baseline_trips:
+        is_refill = np.array([a['source'] == VAULT_ID for a in schedule])
+        src_xy = np.zeros((baseline_trips, 2))
+        if (~is_refill).any():
+            src_xy[~is_refill] = lookup([a['source'] for a in schedule if a['source'] != VAULT_ID])
+        dst_xy = lookup([a['destination'] for a in schedule])
+        baseline_km = (_road_km(src_xy, 0) + _road_km(src_xy, dst_xy) + _road_km(dst_xy, 0)).sum()
+    else:
+        baseline_km = 0.0
+
+    # 2. Savings heuristic: s(i -> j) = exit_i->vault + vault->entry_j - exit_i->entry_j
+    routes = {i: _Route(i, jobs[i]) for i in range(n)}
+    route_of = np.arange(n)
+    timed_out = False
+    if n > 1:
+        k = min(SAVINGS_NEIGHBOURS + 1, n)
+        _, nbrs = cKDTree(entry_xy).query(exit_xy, k=k)
+        src = np.repeat(np.arange(n), k)
+        dst = np.asarray(nbrs).reshape(n, k).ravel()
+        pair = src != dst
+        src, dst = src[pair], dst[pair]
+        savings = to_vault[src] + from_vault[dst] - _road_km(exit_xy[src], entry_xy[dst])
+        order = np.argsort(-savings, kind='stable')
+        order = order[savings[order] > 0]
+
+        for step, e in enumerate(order):
+            if step % 256 == 0 and time.perf_counter() > deadline:
+                timed_out = True
+                break
+            i, j = src[e], dst[e]
+            ka, kb = route_of[i], route_of[j]
+            a, b = routes[ka], routes[kb]
+            # i must end route a, j must start route b, and they must differ
+            if ka == kb or a.jobs[-1] != i or b.jobs[0] != j:
+                continue
+            if a.stops + b.stops > max_stops:
+                continue
+            if a.vault_cash + b.vault_cash + max(a.max_transfer, b.max_transfer) > costs['truck_cash_limit']:
+                continue
+            a.jobs.extend(b.jobs)
+            a.vault_cash += b.vault_cash
+            a.max_transfer = max(a.max_transfer, b.max_transfer)
+            a.stops += b.stops
+            route_of[b.jobs] = ka
+            del routes[kb]
+
+    # 3. Local search: relocate single jobs inside each route while it helps
+    for route in routes.values():
+        if timed_out or time.perf_counter() > deadline:
+            timed_out = True
+            break
+        seq = list(route.jobs)
+        best = route_km(seq)
+        improved = True
+        while improved and time.perf_counter() <= deadline:
+            improved = False
+            for p in range(len(seq)):
+                rest = seq[:p] + seq[p + 1:]
+                for q in range(len(seq)):
+                    if q == p:
+                        continue
+                    cand = rest[:q] + [seq[p]] + rest[q:]
+                    km = route_km(cand)
+                    if km < best - 1e-9:
+                        seq, best, improved = cand, km, True
+                        break
+                if improved:
+                    break
+        route.jobs = seq
+
+    # 4. Output
+    plan, total_km, total_cash = [], 0.0, 0
+    for r, route in enumerate(routes.values()):
+        km = float(route_km(route.jobs))
+        cash = int(sum(jobs[j]['amount'] for j in route.jobs))
+        stops = []
+        for j in route.jobs:
+            job = jobs[j]
+            if job['refill']:
+                stops.append({"atm_id": job['exit'], "action": "REFILL", "amount": job['amount']})
+            else:
+                stops.append({"atm_id": job['entry'], "action": "PICKUP", "amount": job['amount']})
+                stops.append({"atm_id": job['exit'], "action": "DROP", "amount": job['amount']})
+        plan.append({
+            "route_id": r + 1,
+            "stops": stops,
+            "distance_km": round(km, 2),
+            "cash_moved": cash,
+            "max_cash_on_board": int(route.load()),
+            "cost": round(float(costs['cost_per_trip'] + km * costs['cost_per_km'] + cash * costs['cit_fee_rate']), 2)
+        })
+        total_km += km
+        total_cash += cash
+
+    fees = sum(int(a['amount']) for a in schedule) * costs['cit_fee_rate']
+    total_cost = len(plan) * costs['cost_per_trip'] + total_km * costs['cost_per_km'] + total_cash * costs['cit_fee_rate']
+    baseline_cost = baseline_trips * costs['cost_per_trip'] + float(baseline_km) * costs['cost_per_km'] + fees
+    return {
+        "routes": plan,
+        "total_trips": len(plan),
+        "total_distance_km": round(float(total_km), 2),
+        "total_cost": round(float(total_cost), 2),
+        "baseline_trips": baseline_trips,
+        "baseline_cost": round(float(baseline_cost), 2),
+        "trips_saved": baseline_trips - len(plan),
+        "cost_saved": round(float(baseline_cost - total_cost), 2),
+        "timed_out": timed_out
+    }
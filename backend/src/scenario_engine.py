@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .simulation_engine import EVENT_TYPES, simulate_demand
+from .metrics import METRICS
+
+SCENARIO_EVENTS = EVENT_TYPES
+CHUNK_RUNS = 250                # Futures per job; each job has its own RNG stream
+INLINE_MAX_CELLS = 2_000_000    # runs x ATMs x days below this are simulated in-process (no pool start-up)
+PERCENTILES = (5, 50, 95)
+
+# --- WORKER PROCESS JOB (module-level so it can be pickled) ---
+
+def run_chunk(spec, chunk, n_runs):
+    """
+    Simulates `n_runs` independent futures of the whole fleet, one vectorized
+    (runs x ATMs) draw per day. The RNG stream depends only on (seed, chunk),
+    so results do not depend on how chunks are spread over workers.
+    An ATM stocks out when a day's withdrawals exceed its cash; the balance then
+    stays at zero (unmet withdrawals are counted as shortfall) until deposits come in.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(spec['seed'], spawn_key=(chunk,)))
+    is_market = spec['is_market']
+    shape = (n_runs, len(is_market))
+    balance = np.broadcast_to(spec['opening_cash'], shape).astype(np.float64)
+    stocked = np.zeros(shape, dtype=bool)
+    shortfall = np.zeros(shape[1])
+    stockouts_by_day = np.empty((len(spec['dates']), shape[1]), dtype=np.int64)
+    network_flow = np.empty((n_runs, len(spec['dates'])))
+
+    for day, (date, event) in enumerate(zip(spec['dates'], spec['events'])):
+        withdraw, deposit, _ = simulate_demand(date, is_market, rng, event, shape,
+                                               spec['withdraw_scale'], spec['deposit_scale'])
+        if event == 'SYSTEM_FAILURE':
+            withdraw = np.zeros(shape) # Cannot dispense cash
+        balance += deposit - withdraw
+        short = balance < 0
+        stocked |= short
+        shortfall += np.where(short, -balance, 0).sum(axis=0)
+        balance[short] = 0
+        stockouts_by_day[day] = stocked.sum(axis=0)
+        network_flow[:, day] = (deposit - withdraw).sum(axis=1)
+
+    return {
+        "runs": n_runs,
+        "end_balance": balance.astype(np.float32),
+        "stockouts_by_day": stockouts_by_day,
+        "any_stockout": int(stocked.any(axis=1).sum()),
+        "shortfall": shortfall,
+        "network_flow": network_flow
+    }
+
+# --- SCENARIO ENGINE ---
+
+class ScenarioEngine:
+    """
+    Monte Carlo what-if analysis: runs many stochastic futures of the fleet from
+    a given engine state under an event calendar, and summarizes them as
+    stockout probabilities and percentiles. Uses the engine's demand model
+    (simulate_demand) but only reads the state, so the live simulation is never touched.
+    Large runs are split into chunks spread over a process pool.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pool = None # Worker processes, started on first large run
+
+    @METRICS.timed('scenario')
+    def run(self, last_state, horizon_days=14, runs=1000, events=None, opening_cash=2000000, seed=None):
+        """
+        last_state: the engine's latest Date/Location_Type per ATM (indexed by ATM_ID).
+        events: {day offset (1 = the next day): event type} calendar.
+        opening_cash: cash in every ATM at the start (scalar, or one value per ATM).
+        seed: makes the run reproducible (None = fresh entropy; the seed used is returned).
+        """
+        start = time.perf_counter()
+        events = events or {}
+        for day, event in events.items():
+            if not 1 <= day <= horizon_days:
+                raise ValueError(f"Event day {day} is outside the {horizon_days}-day horizon")
+            if event not in SCENARIO_EVENTS:
+                raise ValueError(f"Unknown event '{event}' (expected one of {', '.join(SCENARIO_EVENTS)})")
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy)
+
+        # 1. Inputs shared by every chunk (small: no history is sent to the workers)
+        atm_ids = last_state.index.to_numpy()
+        first_date = pd.Timestamp(last_state['Date'].max()) + pd.Timedelta(days=1)
+        dates = pd.date_range(first_date, periods=horizon_days, freq='D')
+        spec = {
+            "seed": seed,
+            "is_market": (last_state['Location_Type'] == 'Market').to_numpy(),
+            "withdraw_scale": last_state['Withdraw_Scale'].to_numpy(),
+            "deposit_scale": last_state['Deposit_Scale'].to_numpy(),
+            "opening_cash": np.broadcast_to(np.asarray(opening_cash, dtype=np.float64), len(atm_ids)),
+            "dates": list(dates),
+            "events": [events.get(day + 1) for day in range(horizon_days)]
+        }
+        chunks = [(c, min(CHUNK_RUNS, runs - c * CHUNK_RUNS)) for c in range(-(-runs // CHUNK_RUNS))]
+
+        # 2. Simulate (in-process when small, otherwise on the pool)
+        if runs * len(atm_ids) * horizon_days <= INLINE_MAX_CELLS or len(chunks) == 1:
+            parts = [run_chunk(spec, c, n) for c, n in chunks]
+            workers = 1
+        else:
+            futures = [self._pool().submit(run_chunk, spec, c, n) for c, n in chunks]
+            parts = [f.result() for f in futures]
+            workers = min(self.max_workers, len(chunks))
+
+        # 3. Summaries
+        end_balance = np.concatenate([p['end_balance'] for p in parts])
+        stockouts_by_day = sum(p['stockouts_by_day'] for p in parts) / runs
+        shortfall = sum(p['shortfall'] for p in parts) / runs
+        network_flow = np.concatenate([p['network_flow'] for p in parts])
+        balance_pct = np.percentile(end_balance, PERCENTILES, axis=0)
+        flow_pct = np.percentile(network_flow, PERCENTILES, axis=0)
+
+        atms = [
+            {
+                "atm_id": atm_id,
+                "location_type": loc,
+                "stockout_probability": round(float(stockouts_by_day[-1, i]), 4),
+                "stockout_probability_by_day": np.round(stockouts_by_day[:, i], 4).tolist(),
+                "expected_shortfall": int(shortfall[i]),
+                "end_balance": {f"p{p}": int(balance_pct[k, i]) for k, p in enumerate(PERCENTILES)}
+            }
+            for i, (atm_id, loc) in enumerate(zip(atm_ids.tolist(), last_state['Location_Type'].tolist()))
+        ]
+        return {
+            "runs": runs,
+            "horizon_days": horizon_days,
+            "seed": seed,
+            "events": [{"day": day, "date": str(dates[day - 1].date()), "type": e} for day, e in sorted(events.items())],
+            "atms": atms,
+            "network": {
+                "any_stockout_probability": round(sum(p['any_stockout'] for p in parts) / runs, 4),
+                "expected_stockouts_by_day": np.round(stockouts_by_day.sum(axis=1), 2).tolist(),
+                "daily_net_flow": [
+                    {"date": str(d.date()), **{f"p{p}": int(flow_pct[k, day]) for k, p in enumerate(PERCENTILES)}}
+                    for day, d in enumerate(dates)
+                ]
+            },
+            "workers": workers,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def _pool(self):
+        if self.pool is None:
+            # 'spawn': never fork a process that runs the API's threads
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+LOCATION_TYPES = ['Market', 'Residential']
+
+# Compact in-memory/on-disk dtypes of the history columns.
+# Flags fit in int8; cash amounts and note counts stay far below int32's
+# 2.1 billion per ATM-day; features are float32, which xgboost uses internally anyway.
+COMPACT_DTYPES = {
+    'ATM_ID': 'int32',
+    'Location_Type': 'category',
+    'Is_Weekend': 'int8',
+    'Is_Payday': 'int8',
+    'Is_Festival': 'int8',
+    'Withdrawals': 'int32',
+    'Deposits': 'int32',
+    'W_100': 'int32', 'W_500': 'int32', 'W_2000': 'int32',
+    'D_100': 'int32', 'D_500': 'int32', 'D_2000': 'int32',
+    'Health': 'float32',
+    'Revenue': 'int32',
+    'Cost': 'int32',
+    'Net_Cash_Flow': 'int32',
+    'Net_Flow_Lag_7': 'float32',
+    'Net_Flow_Rolling_3': 'float32',
+}
+
+def _fits(values, dtype):
+    """True if every value of the integer array `values` can be stored as `dtype`."""
+    if not len(values):
+        return True
+    info = np.iinfo(dtype)
+    return info.min <= values.min() and values.max() <= info.max
+
+def compact_frame(df):
+    """
+    Returns `df` with COMPACT_DTYPES applied to the columns it has (`df` itself
+    when nothing changes). Location_Type becomes a categorical whose categories
+    start with LOCATION_TYPES, so history blocks concatenate without falling
+    back to object. An integer column whose values would not fit keeps its
+    wider dtype.
+    """
+    columns, changed = {}, False
+    for col in df.columns:
+        series = df[col]
+        dtype = COMPACT_DTYPES.get(col)
+        if dtype is None or str(series.dtype) == dtype:
+            columns[col] = series.array
+            continue
+        values = series.to_numpy()
+        if dtype == 'category':
+            values = pd.Categorical(values)
+            extra = sorted(set(values.categories) - set(LOCATION_TYPES))
+            columns[col] = values.set_categories(LOCATION_TYPES + extra)
+        elif dtype.startswith('int') and not (np.issubdtype(values.dtype, np.integer) and _fits(values, dtype)):
+            columns[col] = series.array
+            continue
+        else:
+            columns[col] = values.astype(dtype)
+        changed = True
+    return pd.DataFrame(columns, index=df.index, copy=False) if changed else df
+
+def memory_report(df):
+    """Bytes used by each column of `df` (strings counted in full) plus the total."""
+    usage = df.memory_usage(index=False, deep=True)
+    return {"columns": {col: int(n) for col, n in usage.items()}, "total_bytes": int(usage.sum())}
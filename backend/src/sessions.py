@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+import uuid
+import weakref
+from .cash_service import CashService
+
+MAX_SESSIONS = int(os.environ.get('ATM_MAX_SESSIONS', 20))
+SESSION_IDLE_SECONDS = float(os.environ.get('ATM_SESSION_IDLE_SECONDS', 1800))
+
+class SessionLimitError(RuntimeError):
+    """No room for another session (the cap is reached and none is idle)."""
+
+class Session:
+    """One analyst's simulation (a session CashService) plus its usage stats."""
+
+    def __init__(self, session_id, service):
+        self.id = session_id
+        self.service = service
+        self.created_at = self.last_used = time.time()
+        self.requests = 0
+        # History blocks shared with the base at fork time (weak: a reset may drop them)
+        self.shared_blocks = {id(b): weakref.ref(b) for b in service.view.state.history.blocks}
+
+    def touch(self):
+        self.last_used = time.time()
+        self.requests += 1
+
+    def own_blocks(self):
+        """History blocks this session created itself (days it appended, or a reset)."""
+        own = []
+        for block in self.service.view.state.history.blocks:
+            ref = self.shared_blocks.get(id(block))
+            if ref is None or ref() is not block:
+                own.append(block)
+        return own
+
+    def stats(self):
+        view = self.service.view
+        own = self.own_blocks()
+        return {
+            "session_id": self.id,
+            "created_at": self.created_at,
+            "idle_seconds": round(time.time() - self.last_used, 1),
+            "requests": self.requests,
+            "version": view.version,
+            "date": str(view.state.daily_totals.latest_date().date()),
+            "history_rows": len(view.state.history),
+            "own_rows": sum(len(b) for b in own),
+            "own_memory_bytes": int(sum(b.memory_usage(index=False).sum() for b in own)),
+            "checkpoints": len(self.service.engine.checkpoints)
+        }
+
+class SessionManager:
+    """
+    Session-scoped simulations in one process. Each session is a CashService
+    forked from the base service: it starts from the base's current state,
+    shares its history blocks and model (and follows the base's model
+    hot-swaps), and only holds the days it appends itself. Sessions idle for
+    `idle_seconds` are evicted; at most `max_sessions` live at once.
+    """
+
+    def __init__(self, base, max_sessions=MAX_SESSIONS, idle_seconds=SESSION_IDLE_SECONDS):
+        self.base = base
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.model = base.view.model
+        self.evictions = 0
+        base.listeners.append(self._on_base_publish)
+
+    def create(self):
+        """
+        Starts a new session. Idle sessions are evicted first; raises
+        SessionLimitError when the cap is still reached.
+        Returns (session, evicted sessions).
+        """
+        evicted = self.evict_idle()
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise SessionLimitError(f"Session limit reached ({self.max_sessions} live sessions)")
+            session = Session(uuid.uuid4().hex, CashService(base=self.base))
+            self.sessions[session.id] = session
+        if session.service.model is not self.base.model:
+            # The base swapped models while the session was being created
+            session.service.submit(session.service.use_model, self.base.model)
+        print(f"Session {session.id} started ({len(self.sessions)} live)")
+        return session, evicted
+
+    def get(self, session_id):
+        """The live session `session_id` (KeyError if unknown or evicted); counts as activity."""
+        session = self.sessions[session_id]
+        session.touch()
+        return session
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id)
+        session.service.close()
+        return session
+
+    def evict_idle(self, now=None):
+        """Closes the sessions idle for longer than `idle_seconds`; returns them."""
+        now = now or time.time()
+        with self.lock:
+            idle = [s for s in self.sessions.values() if now - s.last_used > self.idle_seconds]
+            for session in idle:
+                del self.sessions[session.id]
+            self.evictions += len(idle)
+        for session in idle:
+            print(f"Session {session.id} evicted after {now - session.last_used:.0f}s idle")
+            session.service.close()
+        return idle
+
+    def close_all(self):
+        for session_id in list(self.sessions):
+            self.close(session_id)
+
+    def stats(self):
+        return {
+            "live": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "idle_seconds": self.idle_seconds,
+            "evictions": self.evictions,
+            "sessions": [s.stats() for s in list(self.sessions.values())]
+        }
+
+    def metric_gauges(self):
+        """Point-in-time values for /metrics: (name, type, help, value, labels)."""
+        sessions = list(self.sessions.values())
+        return [
+            ('atm_sessions_live', 'gauge', 'Live simulation sessions.', len(sessions), {}),
+            ('atm_sessions_evicted_total', 'counter', 'Sessions evicted for being idle.', self.evictions, {}),
+            ('atm_sessions_own_memory_bytes', 'gauge', 'History memory held by sessions beyond the shared base.',
+             sum(s.stats()['own_memory_bytes'] for s in sessions), {}),
+        ]
+
+    def _on_base_publish(self, view):
+        # Base listener (writer thread): hand a hot-swapped model to every session
+        if view.model is self.model:
+            return
+        self.model = view.model
+        for session in list(self.sessions.values()):
+            session.service.submit(session.service.use_model, view.model)
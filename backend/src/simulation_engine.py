@@ -1,162 +1,709 @@
 import pandas as pd
 import numpy as np
+import json
 import os
-from .data_generator import generate_atm_data
-from .features import add_advanced_features
-from .model_trainer import train_model
+import time
+import uuid
+from collections import namedtuple
+from .data_generator import (
+    FESTIVAL_PROBABILITY, apply_demand_effects, calendar_flags, expected_demand, generate_atm_data,
+    revenue_and_cost, split_denominations
+)
+from .features import add_advanced_features, add_incremental_features, build_feature_tail
+from .aggregates import DailyTotals
+from .history import AtmHistoryIndex, History
+from .history_store import ColumnLogStore
+from .metrics import METRICS
+from .schema import compact_frame, memory_report
 
 HISTORY_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'atm_history.csv')
+HISTORY_STORE_DIR = os.environ.get('ATM_HISTORY_STORE', os.path.join(os.path.dirname(__file__), '..', 'data', 'history'))
+STATE_SNAPSHOT_FILE = 'engine_state.npz' # Derived state saved next to the store for fast restarts
+
+# Columns the engine itself relies on; always loaded even when `columns` is narrowed
+REQUIRED_COLUMNS = ['Date', 'ATM_ID', 'Location_Type', 'Health', 'Net_Cash_Flow']
+
+# (withdrawal, deposit) multipliers for injected real-world events
+EVENT_EFFECTS = {
+    'STORM': (0.2, 0.2),        # 80% Drop
+    'SALARY_WEEK': (1.6, 1.1),  # 60% Spike for salaries
+    'UNREST': (0.05, 0.05),     # Near total freeze
+}
+
+EVENT_TYPES = ('FESTIVAL', 'SYSTEM_FAILURE') + tuple(EVENT_EFFECTS)
+FAILURE_HEALTH = 35.0 # Health on a SYSTEM_FAILURE day
+MIN_HEALTH = 40       # Floor of the slow daily decay
+SIMULATED_FESTIVAL_BOOST = 2.5 # Festival withdrawal spike of simulated days (the generator uses 1.8)
+DEMAND_SCALE_COLUMNS = ['Withdraw_Scale', 'Deposit_Scale'] # Per-ATM demand level in the last-state table
+
+# A named, in-memory snapshot of the engine. `state` shares its history blocks and
+# buffers with the live state; `lineage`/`rows` locate its rows in the store.
+Checkpoint = namedtuple('Checkpoint', ['name', 'state', 'lineage', 'rows', 'created_at'])
+
+def new_lineage(start=0, parent=()):
+    """
+    Store lineage: ((segment id, first row), ...). A segment is a run of rows
+    appended on one branch; a restore starts a new segment, so equal segments
+    in two lineages always hold the same rows.
+    """
+    return tuple(seg for seg in parent if seg[1] < start) + ((uuid.uuid4().hex[:12], start),)
+
+def shared_rows(lineage_a, rows_a, lineage_b, rows_b):
+    """Number of leading store rows two lineages (with `rows_a`/`rows_b` rows) have in common."""
+    shared = 0
+    for k, (seg_a, seg_b) in enumerate(zip(lineage_a, lineage_b)):
+        if seg_a != seg_b:
+            break
+        end_a = lineage_a[k + 1][1] if k + 1 < len(lineage_a) else rows_a
+        end_b = lineage_b[k + 1][1] if k + 1 < len(lineage_b) else rows_b
+        shared = min(end_a, end_b)
+        if end_a != end_b:
+            break
+    return shared
+
+def demand_sums(df):
+    """
+    Per-ATM sums of actual and modelled demand over `df` (Withdrawals, Deposits,
+    Expected_Withdrawals, Expected_Deposits). The modelled values are the demand
+    model's means for each row's calendar, location and festival flags, with the
+    festival boost simulated days use. Sums add up over batches of rows.
+    """
+    expected_withdraw, expected_deposit = expected_demand(
+        df['Is_Weekend'].to_numpy(), df['Is_Payday'].to_numpy(), (df['Location_Type'] == 'Market').to_numpy(),
+        df['Is_Festival'].to_numpy(), festival_boost=SIMULATED_FESTIVAL_BOOST)
+    sums = pd.DataFrame({
+        'Withdrawals': df['Withdrawals'].to_numpy(np.float64), 'Deposits': df['Deposits'].to_numpy(np.float64),
+        'Expected_Withdrawals': expected_withdraw, 'Expected_Deposits': expected_deposit,
+    }).groupby(df['ATM_ID'].to_numpy()).sum()
+    sums.index.name = 'ATM_ID'
+    return sums
+
+def demand_scales(atm_ids, sums=None):
+    """
+    Withdraw_Scale / Deposit_Scale per ATM: actual over modelled demand from
+    `sums` (see demand_sums), so an ingested ATM simulates at its own level.
+    Exactly 1 for ATMs without sums (histories drawn from the model itself).
+    """
+    scales = pd.DataFrame({col: np.ones(len(atm_ids)) for col in DEMAND_SCALE_COLUMNS},
+                          index=pd.Index(atm_ids, name='ATM_ID'))
+    if sums is not None and len(sums):
+        sums = sums[sums.index.isin(scales.index)]
+        scales.loc[sums.index, 'Withdraw_Scale'] = sums['Withdrawals'] / sums['Expected_Withdrawals']
+        scales.loc[sums.index, 'Deposit_Scale'] = sums['Deposits'] / sums['Expected_Deposits']
+    return scales
+
+def build_last_state(df, scales=None):
+    """
+    Latest Date, Location_Type and Health of every ATM, indexed by ATM_ID, plus
+    its demand scales (from `scales`, else 1; see demand_scales).
+    """
+    latest = df.sort_values(by=['ATM_ID', 'Date'], kind='stable').groupby('ATM_ID').tail(1)
+    last_state = latest.set_index('ATM_ID')[['Date', 'Location_Type', 'Health']]
+    if scales is None:
+        scales = demand_scales(last_state.index)
+    return last_state.join(scales[DEMAND_SCALE_COLUMNS])
+
+def update_last_state(last_state, new_rows):
+    """
+    Returns a new last-state table with the latest values from `new_rows`
+    (which must be sorted by ATM_ID/Date, as add_incremental_features returns them).
+    The demand scales are kept: they describe the ATM, not the latest day.
+    """
+    columns = [c for c in last_state.columns if c in new_rows.columns]
+    latest = new_rows.drop_duplicates('ATM_ID', keep='last').set_index('ATM_ID')[columns]
+    if latest.index.equals(last_state.index):
+        # Whole fleet advanced (the usual case)
+        return latest.join(last_state.drop(columns=columns))[last_state.columns]
+    return latest.combine_first(last_state)[last_state.columns]
+
+def simulate_demand(date, is_market, rng, event=None, shape=None, withdraw_scale=1.0, deposit_scale=1.0):
+    """
+    Draws one day of demand from the simulation's model (before denominations and health).
+    `is_market` flags each ATM; `shape` defaults to one draw per ATM, and a leading
+    axis (runs x ATMs) gives independent futures in one call (see scenario_engine).
+    withdraw_scale / deposit_scale: each ATM's demand level (see demand_scales).
+    Returns (withdrawals, deposits, is_festival) as arrays of `shape`.
+    """
+    shape = shape or np.shape(is_market)
+    is_weekend, is_payday = calendar_flags([date])
+
+    base_withdraw = rng.normal(500000, 50000, shape) * withdraw_scale
+    base_deposit = rng.normal(300000, 30000, shape) * deposit_scale
+
+    # Event Logic
+    if event == 'FESTIVAL':
+        is_festival = np.ones(shape, dtype=np.int64)
+    else:
+        is_festival = (rng.random(shape) < FESTIVAL_PROBABILITY).astype(np.int64)
+
+    # Massive 2.5x festival spike for "Shock" demo
+    withdraw, deposit = apply_demand_effects(
+        base_withdraw, base_deposit, is_weekend, is_payday, is_market, is_festival,
+        festival_boost=SIMULATED_FESTIVAL_BOOST
+    )
+    
+    # --- REAL-WORLD EVENTS ---
+    if event in EVENT_EFFECTS:
+        w_mult, d_mult = EVENT_EFFECTS[event]
+        withdraw = withdraw * w_mult
+        deposit = deposit * d_mult
+    return withdraw, deposit, is_festival
+
+def simulate_day(date, last_state, rng, event=None):
+    """
+    Generates one day of 'actuals' for every ATM in `last_state`, as whole arrays.
+    Same demand model as generate_atm_data, plus the injected `event`.
+    """
+    atm_ids = last_state.index.to_numpy()
+    n = len(atm_ids)
+    is_market = (last_state['Location_Type'] == 'Market').to_numpy()
+    is_weekend, is_payday = calendar_flags([date])
+    withdraw, deposit, is_festival = simulate_demand(date, is_market, rng, event, None,
+                                                     last_state['Withdraw_Scale'].to_numpy(),
+                                                     last_state['Deposit_Scale'].to_numpy())
+
+    withdraw_val = withdraw.astype(np.int64)
+    deposit_val = deposit.astype(np.int64)
+
+    # Denomination logic (matches generator)
+    denominations = split_denominations(withdraw_val, deposit_val)
+
+    # Health decay
+    decay = rng.random(n) * 0.5
+    if event == 'SYSTEM_FAILURE':
+        health = np.full(n, FAILURE_HEALTH) # Critical failure
+        withdraw_val = np.zeros(n, dtype=np.int64) # Cannot dispense cash
+    else:
+        health = np.maximum(MIN_HEALTH, last_state['Health'].to_numpy() - decay) # Slow decay
+
+    rev, cost = revenue_and_cost(withdraw_val, deposit_val, health)
+
+    return pd.DataFrame({
+        'Date': np.repeat(np.datetime64(date), n),
+        'ATM_ID': atm_ids,
+        'Location_Type': last_state['Location_Type'].to_numpy(),
+        'Is_Weekend': np.repeat(is_weekend, n),
+        'Is_Payday': np.repeat(is_payday, n),
+        'Is_Festival': is_festival,
+        'Withdrawals': withdraw_val,
+        'Deposits': deposit_val,
+        **denominations,
+        'Health': health,
+        'Revenue': rev,
+        'Cost': cost,
+        'Net_Cash_Flow': deposit_val - withdraw_val,
+    })
+
+def event_grid(dates, atm_ids, events=None):
+    """
+    Expands an event calendar into a (days x ATMs) array of event types (None = no event).
+    events: {date: event type} for the whole fleet, or {date: {atm_id: event type}}
+    for some ATMs (atm_id None = the whole fleet, overridden by the other entries).
+    Dates may be strings or timestamps and must fall within `dates`.
+    """
+    grid = np.full((len(dates), len(atm_ids)), None, dtype=object)
+    day_of = {d: i for i, d in enumerate(pd.DatetimeIndex(dates).normalize())}
+    column_of = {atm_id: j for j, atm_id in enumerate(np.asarray(atm_ids).tolist())}
+    for date, entry in (events or {}).items():
+        day = day_of.get(pd.Timestamp(date).normalize())
+        if day is None:
+            raise ValueError(f"Event date {date} is outside {dates[0].date()} .. {dates[-1].date()}")
+        targets = sorted(entry.items(), key=lambda t: t[0] is not None) if isinstance(entry, dict) else [(None, entry)]
+        for atm_id, event in targets:
+            if event not in EVENT_TYPES:
+                raise ValueError(f"Unknown event '{event}' (expected one of {', '.join(EVENT_TYPES)})")
+            if atm_id is None:
+                grid[day] = event
+            elif int(atm_id) in column_of:
+                grid[day, column_of[int(atm_id)]] = event
+            else:
+                raise ValueError(f"ATM {atm_id} not found")
+    return grid
+
+def decay_health(start_health, decay, failed):
+    """
+    Health over consecutive days, all at once: h[t] = max(MIN_HEALTH, h[t-1] - decay[t]),
+    or FAILURE_HEALTH on a failure day. The floor commutes with the (non-negative)
+    decay, so the recurrence is the running sum of decays since the start or the
+    last failure, floored.
+    """
+    since_start = np.maximum(MIN_HEALTH, start_health - np.cumsum(decay, axis=0))
+    # After a failure, 35 - decay is below the floor: health stays at MIN_HEALTH
+    after_failure = np.logical_or.accumulate(failed, axis=0) & ~failed
+    return np.where(failed, FAILURE_HEALTH, np.where(after_failure, MIN_HEALTH, since_start))
+
+def simulate_days(dates, last_state, rng, events=None):
+    """
+    Generates consecutive `dates` of 'actuals' for every ATM in `last_state`
+    as one (days x ATMs) block: same demand, health and revenue model as
+    simulate_day, with `events` from an event grid (see event_grid) or None.
+    Draws differ from calling simulate_day day by day (one draw per column
+    for the whole block), so the same seed gives different, equally likely days.
+    Rows are returned sorted by ATM_ID, then Date.
+    """
+    atm_ids = last_state.index.to_numpy()
+    shape = (len(dates), len(atm_ids))
+    events = np.full(shape, None, dtype=object) if events is None else events
+    is_market = (last_state['Location_Type'] == 'Market').to_numpy()
+    is_weekend, is_payday = (flag[:, None] for flag in calendar_flags(dates))
+
+    # 1. Demand (simulate_demand with a per-cell event)
+    base_withdraw = rng.normal(500000, 50000, shape) * last_state['Withdraw_Scale'].to_numpy()
+    base_deposit = rng.normal(300000, 30000, shape) * last_state['Deposit_Scale'].to_numpy()
+    is_festival = ((events == 'FESTIVAL') | (rng.random(shape) < FESTIVAL_PROBABILITY)).astype(np.int64)
+    withdraw, deposit = apply_demand_effects(
+        base_withdraw, base_deposit, is_weekend, is_payday, is_market, is_festival,
+        festival_boost=SIMULATED_FESTIVAL_BOOST
+    )
+    for event, (w_mult, d_mult) in EVENT_EFFECTS.items():
+        hit = events == event
+        if hit.any():
+            withdraw = np.where(hit, withdraw * w_mult, withdraw)
+            deposit = np.where(hit, deposit * d_mult, deposit)
+    withdraw_val = withdraw.astype(np.int64)
+    deposit_val = deposit.astype(np.int64)
+    denominations = split_denominations(withdraw_val, deposit_val)
+
+    # 2. Health (vectorized recurrence) and failures
+    failed = events == 'SYSTEM_FAILURE'
+    health = decay_health(last_state['Health'].to_numpy(), rng.random(shape) * 0.5, failed)
+    withdraw_val = np.where(failed, 0, withdraw_val) # Cannot dispense cash
+    rev, cost = revenue_and_cost(withdraw_val, deposit_val, health)
+
+    # 3. ATM-major rows
+    atm_major = lambda a: np.broadcast_to(a, shape).T.ravel()
+    return pd.DataFrame({
+        'Date': atm_major(pd.DatetimeIndex(dates).to_numpy()[:, None]),
+        'ATM_ID': atm_major(atm_ids),
+        'Location_Type': atm_major(last_state['Location_Type'].to_numpy()),
+        'Is_Weekend': atm_major(is_weekend),
+        'Is_Payday': atm_major(is_payday),
+        'Is_Festival': atm_major(is_festival),
+        'Withdrawals': atm_major(withdraw_val),
+        'Deposits': atm_major(deposit_val),
+        **{k: atm_major(v) for k, v in denominations.items()},
+        'Health': atm_major(health),
+        'Revenue': atm_major(rev),
+        'Cost': atm_major(cost),
+        'Net_Cash_Flow': atm_major(deposit_val - withdraw_val),
+    })
+
+def _frame_to_arrays(prefix, df):
+    """Columns of `df` as plain numpy arrays (text as fixed-width unicode), plus their dtypes."""
+    arrays, dtypes = {}, {}
+    for col in df.columns:
+        values = df[col].to_numpy()
+        arrays[f'{prefix}.{col}'] = values.astype(str) if values.dtype == object else values
+        dtypes[col] = str(df[col].dtype)
+    return arrays, dtypes
+
+def _frame_from_arrays(prefix, arrays, dtypes):
+    return pd.DataFrame({col: pd.Series(arrays[f'{prefix}.{col}']).astype(dtype) for col, dtype in dtypes.items()})
+
+class EngineState:
+    """
+    Immutable, versioned snapshot of the simulation: the history plus every
+    structure derived from it and the event scheduled for the next day.
+    Writers build the next state and publish it with a single assignment, so a
+    reader that grabbed a state keeps a consistent view without locking.
+    """
+    __slots__ = ('history', 'feature_tail', 'last_state', 'atm_index', 'daily_totals', 'next_event', 'version')
+
+    def __init__(self, history, feature_tail, last_state, atm_index, daily_totals, next_event=None, version=0):
+        self.history = history
+        self.feature_tail = feature_tail # Last 7 days of Net_Cash_Flow per ATM (incremental features)
+        self.last_state = last_state     # Latest Date/Location_Type/Health and demand scales per ATM (indexed by ATM_ID)
+        self.atm_index = atm_index       # Row positions per (day, ATM) for fast per-ATM reads
+        self.daily_totals = daily_totals # Materialized network totals per day
+        self.next_event = next_event
+        self.version = version
+
+    @classmethod
+    def build(cls, df, version=0, scales=None):
+        """
+        Builds a state (and all derived structures) from a full history DataFrame.
+        scales: per-ATM demand scales (see demand_scales); None = 1.
+        """
+        history = History.from_frame(df)
+        df = history.frame()
+        return cls(history, build_feature_tail(df), build_last_state(df, scales),
+                   AtmHistoryIndex.build(df), DailyTotals.build(df), version=version)
+
+    @property
+    def data(self):
+        """Full history as one DataFrame (concatenated lazily from the history blocks)."""
+        return self.history.frame()
+
+    def replace(self, **changes):
+        """Returns a copy of this state with `changes` applied."""
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return EngineState(**fields)
 
 class SimulationEngine:
-    def __init__(self):
-        self.data = None
-        self.next_event = None
-        self.load_or_init_data()
+    """
+    Owns the simulation state and is its only writer.
+    `state` always points to a complete EngineState; every write publishes a
+    new one with a higher version. Writes are not synchronized here: callers
+    must run them one at a time (CashService queues them on a single thread).
+    An engine forked from another (`base`) starts from its current state and
+    lives in memory only: it shares the history blocks and never writes the store.
+    """
+
+    def __init__(self, history_days=None, columns=None, store_dir=None, seed=None, base=None):
+        """
+        history_days: only load the last N days of history into memory (None = all).
+        columns: only load these columns (plus REQUIRED_COLUMNS); None = all.
+        seed: seed for the day-to-day randomness (None = fresh entropy).
+        base: fork this engine's current state instead of loading the store.
+        """
+        self.store = None if base is not None else ColumnLogStore(store_dir or HISTORY_STORE_DIR)
+        self.history_days = history_days
+        self.columns = None if columns is None else list(dict.fromkeys(REQUIRED_COLUMNS + list(columns)))
+        self.state = None
+        self.lineage = new_lineage() # Which branch the stored rows belong to (see checkpoints)
+        self.checkpoints = {}        # name -> Checkpoint
+        self.rng = np.random.default_rng(seed)
+        self.timings = {} # Startup phases (seconds)
+        if base is not None:
+            self.history_days, self.columns = base.history_days, base.columns
+            self.publish(base.state.replace()) # Copy: publish sets the version
+        else:
+            self.load_or_init_data()
+
+    # Read-only views of the current state
+    history = property(lambda self: self.state.history)
+    feature_tail = property(lambda self: self.state.feature_tail)
+    last_state = property(lambda self: self.state.last_state)
+    atm_index = property(lambda self: self.state.atm_index)
+    daily_totals = property(lambda self: self.state.daily_totals)
+    next_event = property(lambda self: self.state.next_event)
+    version = property(lambda self: self.state.version if self.state else 0)
+
+    @property
+    def data(self):
+        """Full history as one DataFrame (concatenated lazily from the history blocks)."""
+        return self.state.data
+
+    @data.setter
+    def data(self, df):
+        self.publish(EngineState.build(df))
+
+    def snapshot(self):
+        """The current state. It never changes, whatever the writer does afterwards."""
+        return self.state
+
+    def publish(self, state):
+        """Makes `state` the current state (one atomic reference swap)."""
+        state.version = self.version + 1
+        self.state = state
 
     def set_next_event(self, event_type):
         """Injects an event for the NEXT simulation step."""
         print(f"Event Injected: {event_type}")
-        self.next_event = event_type
+        self.publish(self.state.replace(next_event=event_type))
 
     def load_or_init_data(self):
-        """Loads history from CSV or generates fresh if missing."""
-        if os.path.exists(HISTORY_FILE):
-            print("Loading simulation history...")
-            try:
-                self.data = pd.read_csv(HISTORY_FILE, parse_dates=['Date'])
-            except Exception as e:
-                print(f"Error loading history: {e}. Regenerating.")
+        """
+        Loads history from the columnar store.
+        A legacy CSV is imported into the store once; if neither exists, generates fresh.
+        The derived state comes from the state snapshot when it matches the store,
+        otherwise it is rebuilt from the history (and the snapshot rewritten).
+        """
+        try:
+            if not self.store.exists() and os.path.exists(HISTORY_FILE):
+                print("Importing CSV history into columnar store...")
+                self.store.import_csv(HISTORY_FILE)
+
+            if self.store.exists():
+                print("Loading simulation history...")
+                start = time.perf_counter()
+                # Stores written before the compact schema are narrowed on load
+                df = compact_frame(self.store.load(columns=self.columns, last_days=self.history_days))
+                self.timings['load_history'] = time.perf_counter() - start
+                
+                start = time.perf_counter()
+                state = self.load_state_snapshot(History.from_frame(df))
+                self.timings['derived_state_source'] = 'snapshot' if state else 'rebuilt'
+                if state is None:
+                    state = EngineState.build(df, scales=self.stored_demand_scales(df))
+                    self.save_state_snapshot(state)
+                self.timings['derived_state'] = time.perf_counter() - start
+                self.lineage = new_lineage()
+                self.publish(state)
+            else:
                 self.reset_simulation()
-        else:
+        except Exception as e:
+            print(f"Error loading history: {e}. Regenerating.")
             self.reset_simulation()
 
     def reset_simulation(self):
         """Resets the simulation to the initial 365 day state."""
         print("Initializing fresh simulation...")
         raw = generate_atm_data(n_days=365)
-        self.data = add_advanced_features(raw)
-        self.save_data()
+        state = EngineState.build(add_advanced_features(raw))
+        if self.store is not None:
+            self.store.write(state.data)
+            self.save_state_snapshot(state)
+        self.lineage = new_lineage()
+        self.publish(state)
+
+    def stored_demand_scales(self, df):
+        """Demand scales of the ATMs in `df` from the demand sums ingest recorded in the store (else 1)."""
+        sums = self.store.attrs().get('demand_sums')
+        return demand_scales(np.unique(df['ATM_ID'].to_numpy()),
+                             None if sums is None else pd.DataFrame(sums).set_index('ATM_ID'))
+
+    def refresh_derived_state(self):
+        """Rebuilds the per-ATM buffers derived from the full history."""
+        scales = self.last_state[DEMAND_SCALE_COLUMNS]
+        self.publish(EngineState.build(self.data, scales=scales).replace(next_event=self.next_event))
+
+    # --- CHECKPOINTS (instant rollback and what-if branches) ---
+
+    def create_checkpoint(self, name):
+        """
+        Saves the current state under `name`. O(1): the checkpoint keeps a
+        reference to the (immutable) state, whose history blocks and buffers are
+        shared with every later state; only days appended afterwards cost memory.
+        Checkpoints live in memory and do not survive a restart.
+        """
+        if not name:
+            raise ValueError("Checkpoint name is required")
+        if name in self.checkpoints:
+            raise ValueError(f"Checkpoint '{name}' already exists")
+        checkpoint = Checkpoint(name, self.state, self.lineage, self.stored_rows(), time.time())
+        self.checkpoints[name] = checkpoint
+        return checkpoint
+
+    def list_checkpoints(self):
+        """
+        Checkpoints, oldest first, with how many days each lies behind the live
+        state (or ahead of it, for one on a branch that was left).
+        """
+        latest = self.state.daily_totals.latest_date()
+        result = []
+        for c in list(self.checkpoints.values()): # Copy: may be read while the writer adds one
+            date = c.state.daily_totals.latest_date()
+            result.append({
+                "name": c.name,
+                "date": str(date.date()),
+                "rows": c.rows,
+                "next_event": c.state.next_event,
+                "days_behind": max((latest - date).days, 0),
+                "days_ahead": max((date - latest).days, 0),
+                "created_at": c.created_at
+            })
+        return result
+
+    def delete_checkpoint(self, name):
+        del self.checkpoints[name]
+
+    @METRICS.timed('restore_checkpoint')
+    def restore_checkpoint(self, name):
+        """
+        Makes checkpoint `name` the current state (the current one is dropped
+        unless checkpointed). The state is swapped in O(1); the store is
+        truncated to the rows it shares with the checkpoint (O(1) when the
+        checkpoint is an ancestor of the current state) and only the
+        checkpoint's rows past that point, if any, are appended.
+        Later days start a new branch, so the checkpoint itself never changes.
+        """
+        checkpoint = self.checkpoints[name]
+        stored = self.stored_rows()
+        fork = shared_rows(self.lineage, stored, checkpoint.lineage, checkpoint.rows)
+        if self.store is None:
+            pass # In-memory engine: nothing to sync
+        elif fork < checkpoint.rows:
+            # Checkpoint on another branch: re-append its rows after the fork. Rows
+            # appended since the load are the last rows of both the store and the
+            # history; the loaded rows (a date window with history_days) may not be
+            # contiguous in the store, so the fork must lie past them.
+            offset = checkpoint.rows - len(checkpoint.state.history) # Rows not loaded in memory
+            if fork < offset or set(self.store.column_names()) != set(checkpoint.state.history.columns):
+                raise ValueError(f"Checkpoint '{name}' is on another branch and its rows are not all in memory")
+            columns = self.store.column_names()
+            rows = checkpoint.state.history.take(np.arange(fork - offset, checkpoint.rows - offset), columns)
+            self.store.truncate(fork)
+            self.store.append(pd.DataFrame(rows)[columns])
+        elif stored != checkpoint.rows:
+            self.store.truncate(checkpoint.rows)
 
+        self.lineage = new_lineage(checkpoint.rows, checkpoint.lineage)
+        self.publish(checkpoint.state.replace()) # Copy: publish sets the version
+        print(f"Restored checkpoint '{name}' ({checkpoint.state.daily_totals.latest_date().date()}, "
+              f"{stored - fork} rows dropped, {checkpoint.rows - fork} re-appended)")
+        return checkpoint
+
+    def stored_rows(self):
+        """Rows in the store (for an in-memory engine: in its history)."""
+        return self.store.n_rows() if self.store is not None else len(self.history)
+
+    # --- STATE SNAPSHOT (fast restarts) ---
+
+    def snapshot_path(self):
+        return os.path.join(self.store.root, STATE_SNAPSHOT_FILE)
+
+    def snapshot_key(self):
+        """What a state snapshot was built from: store contents and load options."""
+        return json.loads(json.dumps({
+            'store': self.store.version(), 'history_days': self.history_days, 'columns': self.columns
+        }))
+
+    def save_state_snapshot(self, state=None):
+        """
+        Saves the derived state (feature tail, last-state table, per-ATM index,
+        daily totals, pending event) as one binary .npz next to the store, tagged
+        with the store version it matches. The history itself stays in the store.
+        """
+        if self.store is None:
+            return
+        state = state or self.state
+        tail, tail_dtypes = _frame_to_arrays('tail', state.feature_tail)
+        last, last_dtypes = _frame_to_arrays('last', state.last_state.reset_index())
+        meta = {'key': self.snapshot_key(), 'next_event': state.next_event,
+                'tail': tail_dtypes, 'last': last_dtypes}
+        arrays = {
+            **tail, **last,
+            **{f'index.{k}': v for k, v in state.atm_index.to_arrays().items()},
+            **{f'totals.{k}': v for k, v in state.daily_totals.to_arrays().items()},
+            'meta': np.array(json.dumps(meta))
+        }
+        tmp = self.snapshot_path() + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, self.snapshot_path())
+
+    def load_state_snapshot(self, history):
+        """Returns the EngineState for `history` from the snapshot, or None if it is missing or stale."""
+        path = self.snapshot_path()
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as f:
+                arrays = {k: f[k] for k in f.files}
+            meta = json.loads(str(arrays['meta']))
+            if meta['key'] != self.snapshot_key() or not set(DEMAND_SCALE_COLUMNS) <= set(meta['last']):
+                print("State snapshot is stale; rebuilding derived state...")
+                return None
+            section = lambda name: {k.split('.', 1)[1]: v for k, v in arrays.items() if k.startswith(name + '.')}
+            return EngineState(
+                history=history,
+                feature_tail=_frame_from_arrays('tail', arrays, meta['tail']),
+                last_state=_frame_from_arrays('last', arrays, meta['last']).set_index('ATM_ID'),
+                atm_index=AtmHistoryIndex.from_arrays(section('index')),
+                daily_totals=DailyTotals.from_arrays(section('totals')),
+                next_event=meta['next_event']
+            )
+        except Exception as e:
+            print(f"Ignoring unreadable state snapshot: {e}")
+            return None
+
+    @METRICS.timed('save_data')
     def save_data(self):
-        """Persists current state to CSV."""
-        os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-        self.data.to_csv(HISTORY_FILE, index=False)
+        """
+        Persists the full current state (rewrites the store). Refused when the
+        engine holds only part of the history (history_days / columns) or has
+        no store (a session fork): rewriting would drop the rest.
+        """
+        if self.store is None:
+            raise ValueError("This engine has no history store (in-memory fork)")
+        if self.history_days is not None or self.columns is not None:
+            raise ValueError("Only part of the history is loaded (history_days/columns); "
+                             "saving would overwrite the rest of the store")
+        METRICS.inc('atm_rows_total', len(self.history), stage='saved')
+        self.store.write(self.data, attrs=self.store.attrs()) # Same history: keep the ingest's demand sums
+        self.save_state_snapshot()
+
+    @METRICS.timed('store_append')
+    def append_data(self, new_rows):
+        """Persists only the newly simulated rows (in-memory engines keep them in the history only)."""
+        if self.store is None:
+            return
+        METRICS.inc('atm_rows_total', len(new_rows), stage='persisted')
+        self.store.append(new_rows)
 
+    def export_csv(self, path=HISTORY_FILE, **load_kwargs):
+        """Exports the persisted history to CSV (e.g. for Excel or the legacy loader)."""
+        self.store.export_csv(path, **load_kwargs)
+
+    def import_csv(self, path=HISTORY_FILE):
+        """Replaces the simulation history with a history CSV."""
+        self.store.import_csv(path)
+        self.load_or_init_data()
+
+    @METRICS.timed('advance_day')
     def advance_day(self):
         """
         Simulates the PASSAGE OF TIME.
         1. 'Yesterday' becomes history (we generate 'actuals' for the day that just passed).
         2. We append this new day to our history.
-        3. Implementation Detail: Since `generate_atm_data` is stateless, we manually
-           generate one new day appearing after the last known date.
+        3. Implementation Detail: Since `generate_atm_data` is stateless, we generate
+           one new day for the whole fleet (taken from `last_state`) as arrays.
+        The next state is built from the current one (whose blocks and buffers it
+        shares) and published once complete, so readers never see a partial day.
         """
-        last_date = self.data['Date'].max()
-        new_date = last_date + pd.Timedelta(days=1)
+        state = self.state
+        new_date = state.last_state['Date'].max() + pd.Timedelta(days=1)
         
         print(f"Advancing simulation to {new_date.date()}...")
         
-        # Generate 1 day of data for each ATM
-        new_rows = []
-        n_atms = 5
-        for atm_id in range(n_atms):
-            atm_type = 'Market' if atm_id % 2 == 0 else 'Residential'
-            
-            # Re-use logic from data_generator (simplified inline for the simulation step)
-            base_withdraw = np.random.normal(500000, 50000)
-            base_deposit = np.random.normal(300000, 30000)
-            
-            is_payday = 1 if new_date.day in [1, 2, 3, 4, 5, 30, 31] else 0
-            if is_payday: base_withdraw *= 1.4
-            
-            is_weekend = 1 if new_date.dayofweek >= 5 else 0
-            if is_weekend: base_withdraw *= 1.2
-            
-            if atm_type == 'Market':
-                base_deposit *= 1.6
-                base_withdraw *= 0.8
-            else:
-                base_deposit *= 0.3
-                base_withdraw *= 1.2
-                
-            # Event Logic
-            is_festival = 0
-            if self.next_event == 'FESTIVAL':
-                is_festival = 1
-            else:
-                is_festival = np.random.choice([0, 1], p=[0.98, 0.02])
-            
-            if is_festival: 
-                base_withdraw *= 2.5 # Massive spike for "Shock" demo
-            
-            # --- NEW REAL-WORLD EVENTS ---
-            if self.next_event == 'STORM':
-                base_withdraw *= 0.2 # 80% Drop
-                base_deposit *= 0.2
-            
-            if self.next_event == 'SALARY_WEEK':
-                base_withdraw *= 1.6 # 60% Spike for salaries
-                base_deposit *= 1.1
-            
-            if self.next_event == 'UNREST':
-                base_withdraw *= 0.05 # Near total freeze
-                base_deposit *= 0.05
-            
-            withdraw_val = int(base_withdraw)
-            deposit_val = int(base_deposit)
-
-            # Denomination logic (matches generator)
-            w100, w500, w2000 = int((withdraw_val*0.3)//100), int((withdraw_val*0.6)//500), int((withdraw_val*0.1)//2000)
-            d100, d500, d2000 = int((deposit_val*0.2)//100), int((deposit_val*0.75)//500), int((deposit_val*0.05)//2000)
-
-            # Health decay
-            prev_atms = self.data[self.data['ATM_ID'] == atm_id]
-            prev_health = prev_atms['Health'].iloc[-1] if not prev_atms.empty else 100
-            
-            if self.next_event == 'SYSTEM_FAILURE':
-                new_health = 35.0 # Critical failure
-                withdraw_val = 0 # Cannot dispense cash
-            else:
-                new_health = max(40, prev_health - np.random.random() * 0.5) # Slow decay
-
-            rev = (withdraw_val // 5000) * 25 + (deposit_val // 5000) * 10
-            cost = 500 + (100 - new_health) * 50
-
-            row = {
-                'Date': new_date,
-                'ATM_ID': atm_id,
-                'Location_Type': atm_type,
-                'Is_Weekend': is_weekend,
-                'Is_Payday': is_payday,
-                'Is_Festival': is_festival,
-                'Withdrawals': withdraw_val,
-                'Deposits': deposit_val,
-                'W_100': w100, 'W_500': w500, 'W_2000': w2000,
-                'D_100': d100, 'D_500': d500, 'D_2000': d2000,
-                'Health': new_health,
-                'Revenue': int(rev),
-                'Cost': int(cost),
-                'Net_Cash_Flow': int(deposit_val - withdraw_val)
-            }
-            new_rows.append(row)
-            
-        new_df = pd.DataFrame(new_rows)
-        
-        # Drop old features to avoid dupes/conflicts
-        base_cols = [
-            'Date', 'ATM_ID', 'Location_Type', 'Is_Weekend', 'Is_Payday', 'Is_Festival', 
-            'Withdrawals', 'Deposits', 'W_100', 'W_500', 'W_2000', 'D_100', 'D_500', 'D_2000',
-            'Health', 'Revenue', 'Cost', 'Net_Cash_Flow'
-        ]
-        current_clean = self.data[base_cols].copy()
+        new_df = compact_frame(simulate_day(new_date, state.last_state, self.rng, state.next_event))
+        self.commit_rows(state, new_df)
+        return new_date
+
+    @METRICS.timed('advance_days')
+    def advance_days(self, days, events=None):
+        """
+        Fast-forwards `days` days in one step: all days x fleet rows are
+        simulated as one array block, features are computed once, the rows
+        are persisted with one append and one new state is published.
+        events: calendar {date: event type} or {date: {atm_id: event type}}
+        (see event_grid). The pending next-day event applies to the first day
+        unless the calendar has an entry for that date.
+        Returns the new latest date.
+        """
+        if days < 1:
+            raise ValueError("days must be at least 1")
+        state = self.state
+        first_date = state.last_state['Date'].max() + pd.Timedelta(days=1)
+        dates = pd.date_range(first_date, periods=days, freq='D')
+        calendar = dict(events or {})
+        if state.next_event in EVENT_TYPES and not any(pd.Timestamp(d).normalize() == first_date for d in calendar):
+            calendar[first_date] = state.next_event
+        grid = event_grid(dates, state.last_state.index.to_numpy(), calendar)
+
+        print(f"Advancing simulation {days} days to {dates[-1].date()}...")
+        new_df = compact_frame(simulate_days(dates, state.last_state, self.rng, grid))
+        self.commit_rows(state, new_df)
+        return dates[-1]
+
+    def commit_rows(self, state, new_df):
+        """Adds newly simulated rows after `state`: features, one store append, one published state."""
+        METRICS.inc('atm_rows_total', len(new_df), stage='simulated')
         
-        updated_df = pd.concat([current_clean, new_df], ignore_index=True)
-        self.data = add_advanced_features(updated_df)
-        self.save_data()
+        # Features for the new days only (per-ATM tail buffer, no full recompute)
+        new_df, feature_tail = add_incremental_features(new_df, state.feature_tail)
         
-        # Reset event
-        self.next_event = None
+        # Each ATM's rows stay in date order; the new days are appended as their own block
+        new_df = new_df.astype(state.history.dtypes.to_dict())
+        self.append_data(new_df)
         
-        return new_date
+        # Publish (the event is consumed)
+        self.publish(EngineState(
+            history=state.history.append(new_df[state.history.columns]),
+            feature_tail=feature_tail,
+            last_state=update_last_state(state.last_state, new_df),
+            atm_index=state.atm_index.append(new_df, start=len(state.history)),
+            daily_totals=state.daily_totals.append(new_df),
+            next_event=None
+        ))
+
+    def memory_report(self):
+        """Memory used by the in-memory history, per column."""
+        return memory_report(self.data)
 
     def get_latest_data(self):
         return self.data
+
+    def n_atms(self):
+        return len(self.last_state)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Add backend to path (so we can import src)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
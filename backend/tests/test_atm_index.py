@@ -0,0 +1,13 @@
+import pandas as pd
+from src.data_generator import generate_fleet_data
+from src.history import AtmHistoryIndex
+
+def test_atm_index_window_and_last_position():
+    df = generate_fleet_data(n_days=20, n_atms=3).sort_values(['Date', 'ATM_ID']).reset_index(drop=True)
+    df = df[~((df['ATM_ID'] == 1) & (df['Date'] == df['Date'].max()))].reset_index(drop=True) # ATM 1 misses the last day
+    index = AtmHistoryIndex.build(df)
+    start, end = df['Date'].min() + pd.Timedelta(days=5), df['Date'].min() + pd.Timedelta(days=9)
+    expected = df.index[(df['ATM_ID'] == 2) & df['Date'].between(start, end)]
+    assert index.positions(2, start, end).tolist() == expected.tolist()
+    assert index.last_position(2) == df.index[df['ATM_ID'] == 2][-1]
+    assert index.last_position(1) == df.index[df['ATM_ID'] == 1][-1]
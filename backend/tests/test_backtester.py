@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from src import backtester
+from src.backtester import build_feature_cache, forecast_inputs, forecast_window
+from src.data_generator import generate_fleet_data
+from src.features import add_advanced_features
+from src.optimizer import next_day_features, recent_flows
+
+HISTORY = add_advanced_features(generate_fleet_data(n_days=120, n_atms=6))
+
+def test_forecast_inputs_match_the_live_forecast():
+    cache = build_feature_cache(HISTORY)
+    for day in (3, 7, 50, 119):
+        before = HISTORY[HISTORY['Date'] < cache.dates[day]].sort_values(['ATM_ID', 'Date'])
+        atm_ids, flows = recent_flows(before)
+        live = next_day_features(atm_ids, flows, pd.Timestamp(cache.dates[day]))
+        cached = forecast_inputs(cache, day, day + 1).assign(Is_Festival=0)
+        np.testing.assert_allclose(cached.to_numpy(np.float64), live.to_numpy(np.float64), atol=0.01)
+
+def test_window_model_is_fitted_on_every_earlier_day(monkeypatch):
+    cache = build_feature_cache(HISTORY)
+    fitted = []
+    real_fit = backtester.fit_model
+    monkeypatch.setattr(backtester, 'fit_model', lambda X, y, **kw: fitted.append(len(X)) or real_fit(X, y, **kw))
+    backtester._init_worker(cache)
+    try:
+        result = forecast_window((90, 100))
+    finally:
+        backtester._init_worker(None)
+    assert fitted == [90 * 6]
+    assert result['predictions'].shape == (10, 6)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.simulation_engine import SimulationEngine, new_lineage, shared_rows
+
+# A narrowed load (every column the engine itself needs, no denominations)
+SOME_COLUMNS = ['Is_Weekend', 'Is_Payday', 'Is_Festival', 'Withdrawals', 'Deposits', 'Revenue', 'Cost',
+                'Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
+
+def history_rows(history, columns):
+    return pd.DataFrame(history.take(np.arange(len(history)), columns))
+
+def assert_store_matches(engine, name):
+    """
+    The store holds exactly the checkpoint's rows. With history_days only a
+    date window of them is in memory: the stored rows of that window must match.
+    """
+    checkpoint = engine.checkpoints[name]
+    columns = engine.store.column_names()
+    assert engine.store.n_rows() == checkpoint.rows
+    expected = history_rows(checkpoint.state.history, columns)
+    stored = engine.store.load()
+    stored = stored[stored['Date'] >= expected['Date'].min()]
+    assert len(stored) == len(expected)
+    for df in (stored, expected):
+        df['Location_Type'] = df['Location_Type'].astype(str)
+    order = ['Date', 'ATM_ID']
+    pd.testing.assert_frame_equal(stored[columns].sort_values(order, ignore_index=True),
+                                  expected[columns].sort_values(order, ignore_index=True), check_dtype=False)
+    assert engine.state.daily_totals.latest_date() == checkpoint.state.daily_totals.latest_date()
+
+@pytest.fixture
+def engine(tmp_path):
+    return SimulationEngine(store_dir=str(tmp_path / 'history'))
+
+def test_shared_rows():
+    root = new_lineage()
+    branch = new_lineage(100, root)
+    assert shared_rows(root, 150, root, 120) == 120
+    assert shared_rows(root, 150, branch, 130) == 100
+    assert shared_rows(branch, 130, new_lineage(110, branch), 115) == 110
+    assert shared_rows(root, 150, new_lineage(), 150) == 0
+
+def test_restore_ancestor(engine):
+    engine.create_checkpoint('a')
+    for _ in range(3):
+        engine.advance_day()
+    engine.restore_checkpoint('a')
+    assert_store_matches(engine, 'a')
+    engine.advance_day() # The checkpoint is not modified by later days
+    assert len(engine.checkpoints['a'].state.history) == engine.checkpoints['a'].rows
+
+def test_restore_across_branches(engine):
+    engine.create_checkpoint('a')
+    engine.advance_day()
+    engine.advance_day()
+    engine.create_checkpoint('b')
+    engine.restore_checkpoint('a')
+    engine.advance_day() # New branch from 'a'
+    engine.create_checkpoint('c')
+    engine.restore_checkpoint('b') # Re-appends b's two days after the fork
+    assert_store_matches(engine, 'b')
+    engine.restore_checkpoint('c')
+    assert_store_matches(engine, 'c')
+    engine.advance_day()
+    engine.restore_checkpoint('b')
+    assert_store_matches(engine, 'b')
+
+def test_restore_after_reset(engine):
+    engine.advance_day()
+    engine.create_checkpoint('before')
+    engine.reset_simulation()
+    engine.advance_day()
+    engine.restore_checkpoint('before')
+    assert_store_matches(engine, 'before')
+
+def test_restore_with_history_days(tmp_path):
+    SimulationEngine(store_dir=str(tmp_path / 'history')) # Creates the store
+    engine = SimulationEngine(store_dir=str(tmp_path / 'history'), history_days=30)
+    assert engine.store.n_rows() > len(engine.history)
+    engine.create_checkpoint('a')
+    engine.advance_day()
+    engine.create_checkpoint('b')
+    engine.restore_checkpoint('a')
+    assert_store_matches(engine, 'a')
+    engine.advance_day()
+    engine.advance_day()
+    engine.restore_checkpoint('b')
+    assert_store_matches(engine, 'b')
+
+def test_restore_refused_when_rows_are_not_in_memory(tmp_path):
+    SimulationEngine(store_dir=str(tmp_path / 'history'))
+    engine = SimulationEngine(store_dir=str(tmp_path / 'history'), columns=SOME_COLUMNS)
+    engine.create_checkpoint('a')
+    engine.advance_day()
+    engine.create_checkpoint('b')
+    engine.restore_checkpoint('a')
+    engine.advance_day()
+    rows = engine.store.n_rows()
+    with pytest.raises(ValueError):
+        engine.restore_checkpoint('b') # Only some columns are loaded: cannot re-append
+    assert engine.store.n_rows() == rows
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+from src.data_generator import generate_fleet_data
+from src.ingest import daily_partials, ingest_csv, map_location_types
+from src.simulation_engine import (
+    DEMAND_SCALE_COLUMNS, SimulationEngine, build_last_state, demand_scales, demand_sums, simulate_day,
+    update_last_state
+)
+
+def test_map_location_types():
+    mapped = map_location_types(pd.Series(['Mall', 'Standalone', 'Bank Branch', 'Market', 'Airport', None, 'Mall']))
+    assert mapped.tolist() == ['Market', 'Residential', 'Market', 'Market', 'Residential', 'Residential', 'Market']
+
+def test_daily_partials_maps_location_types():
+    chunk = pd.DataFrame({
+        'ATM_ID': ['ATM_0001', 'ATM_0002'], 'Date': ['2024-01-01', '2024-01-01'],
+        'Total_Withdrawals': [1000, 2000], 'Total_Deposits': [100, 200],
+        'Location_Type': ['Supermarket', 'Standalone'], 'Holiday_Flag': [0, 0], 'Special_Event_Flag': [0, 1],
+    })
+    assert daily_partials(chunk).sort_values('ATM_ID')['Location_Type'].tolist() == ['Market', 'Residential']
+
+def test_scales_are_exactly_one_without_sums():
+    last_state = build_last_state(generate_fleet_data(n_days=30, n_atms=4))
+    assert (last_state[DEMAND_SCALE_COLUMNS].to_numpy() == 1).all()
+
+def test_simulate_day_scales_demand():
+    last_state = build_last_state(generate_fleet_data(n_days=30, n_atms=4))
+    date = last_state['Date'].max() + pd.Timedelta(days=1)
+    base = simulate_day(date, last_state, np.random.default_rng(7))
+    scaled = simulate_day(date, last_state.assign(Withdraw_Scale=0.1, Deposit_Scale=0.5), np.random.default_rng(7))
+    assert np.allclose(scaled['Withdrawals'], base['Withdrawals'] * 0.1, atol=1)
+    assert np.allclose(scaled['Deposits'], base['Deposits'] * 0.5, atol=1)
+
+def test_demand_scales_follow_the_atm_level():
+    df = generate_fleet_data(n_days=120, n_atms=5)
+    small = df['ATM_ID'] == 2
+    df.loc[small, ['Withdrawals', 'Deposits']] = df.loc[small, ['Withdrawals', 'Deposits']] // 10
+    scales = demand_scales(np.array([1, 2, 3, 9]), demand_sums(df[df['ATM_ID'] <= 2]))
+    assert abs(scales.loc[2, 'Withdraw_Scale'] / scales.loc[1, 'Withdraw_Scale'] - 0.1) < 0.01
+    assert abs(scales.loc[2, 'Deposit_Scale'] / scales.loc[1, 'Deposit_Scale'] - 0.1) < 0.01
+    assert (scales.loc[[3, 9]].to_numpy() == 1).all() # No sums for these ATMs
+
+def test_update_last_state_keeps_scales():
+    df = generate_fleet_data(n_days=30, n_atms=4)
+    last_state = build_last_state(df).assign(Withdraw_Scale=[0.1, 0.2, 0.3, 0.4])
+    new_rows = df[df['Date'] == df['Date'].max()].assign(Date=df['Date'].max() + pd.Timedelta(days=1), Health=50.0)
+    updated = update_last_state(last_state, new_rows.sort_values('ATM_ID'))
+    assert list(updated.columns) == list(last_state.columns)
+    assert (updated['Health'] == 50).all()
+    pd.testing.assert_frame_equal(updated[DEMAND_SCALE_COLUMNS], last_state[DEMAND_SCALE_COLUMNS])
+    partial = update_last_state(last_state, new_rows[new_rows['ATM_ID'] == 2])
+    assert partial.loc[2, 'Health'] == 50 and partial.loc[1, 'Health'] == last_state.loc[1, 'Health']
+    assert partial.loc[1, 'Withdraw_Scale'] == last_state.loc[1, 'Withdraw_Scale'] != 1
+
+def test_ingested_store_simulates_at_its_own_level(tmp_path):
+    days = pd.date_range('2024-01-01', periods=60, freq='D').strftime('%Y-%m-%d')
+    csv = tmp_path / 'transactions.csv'
+    pd.DataFrame({
+        'ATM_ID': np.repeat(['ATM_0001', 'ATM_0002'], len(days)), 'Date': np.tile(days, 2),
+        'Total_Withdrawals': 50000, 'Total_Deposits': 10000,
+        'Location_Type': np.repeat(['Mall', 'Standalone'], len(days)), 'Holiday_Flag': 0, 'Special_Event_Flag': 0,
+    }).to_csv(csv, index=False)
+    ingest_csv(csv, tmp_path / 'store')
+    engine = SimulationEngine(store_dir=str(tmp_path / 'store'), seed=3)
+    assert engine.last_state['Location_Type'].tolist() == ['Market', 'Residential']
+    assert (engine.last_state['Withdraw_Scale'] < 0.2).all()
+    rows = len(engine.history)
+    for _ in range(20):
+        engine.advance_day()
+    simulated = engine.data.iloc[rows:]
+    assert 30000 < simulated['Withdrawals'].mean() < 90000
+    engine.save_data() # Rewrites the same history: the demand sums stay
+    assert 'demand_sums' in engine.store.attrs()
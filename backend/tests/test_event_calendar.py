@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.simulation_engine import FAILURE_HEALTH, MIN_HEALTH, decay_health, event_grid
+
+DATES = pd.date_range('2026-01-08', periods=5, freq='D')
+ATM_IDS = np.array([3, 5, 8])
+
+def test_event_grid_fleet_and_per_atm():
+    grid = event_grid(DATES, ATM_IDS, {
+        '2026-01-08': 'FESTIVAL',
+        pd.Timestamp('2026-01-10 15:00'): {None: 'UNREST', 5: 'SYSTEM_FAILURE'},
+        '2026-01-12': {8: 'FESTIVAL'},
+    })
+    assert grid.shape == (5, 3)
+    assert grid[0].tolist() == ['FESTIVAL'] * 3
+    assert grid[1].tolist() == [None] * 3
+    assert grid[2].tolist() == ['UNREST', 'SYSTEM_FAILURE', 'UNREST'] # The ATM entry overrides the fleet one
+    assert grid[4].tolist() == [None, None, 'FESTIVAL']
+    assert (event_grid(DATES, ATM_IDS) == None).all() # noqa: E711 (object array)
+
+@pytest.mark.parametrize('events', [
+    {'2026-01-07': 'FESTIVAL'},           # Before the first day
+    {'2026-01-13': 'FESTIVAL'},           # After the last day
+    {'2026-01-09': 'ALIENS'},             # Unknown type
+    {'2026-01-09': {4: 'FESTIVAL'}},      # Unknown ATM
+])
+def test_event_grid_rejects(events):
+    with pytest.raises(ValueError):
+        event_grid(DATES, ATM_IDS, events)
+
+def decay_loop(start, decay, failed):
+    health = np.empty_like(decay)
+    current = start.astype(np.float64)
+    for t in range(len(decay)):
+        current = np.where(failed[t], FAILURE_HEALTH, np.maximum(MIN_HEALTH, current - decay[t]))
+        health[t] = current
+    return health
+
+def test_decay_health_matches_day_by_day():
+    rng = np.random.default_rng(0)
+    start = np.array([100.0, 60.0, 41.0, 95.0])
+    decay = rng.uniform(0, 3, size=(40, 4))
+    failed = rng.random((40, 4)) < 0.05
+    failed[0, 3] = failed[-1, 2] = True
+    np.testing.assert_allclose(decay_health(start, decay, failed), decay_loop(start, decay, failed))
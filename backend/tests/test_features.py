@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+from src.data_generator import generate_fleet_data
+from src.features import add_advanced_features, add_incremental_features, build_feature_tail
+from src.simulation_engine import SimulationEngine
+
+FEATURES = ['Net_Flow_Lag_7', 'Net_Flow_Rolling_3']
+HISTORY = generate_fleet_data(n_days=40, n_atms=6)
+
+def assert_features_match(incremental, full):
+    incremental = incremental.sort_values(['ATM_ID', 'Date']).reset_index(drop=True)
+    full = full.sort_values(['ATM_ID', 'Date']).reset_index(drop=True)
+    np.testing.assert_allclose(incremental[FEATURES].to_numpy(np.float64), full[FEATURES].to_numpy(np.float64), rtol=1e-6)
+
+@pytest.mark.parametrize('days_per_step', [1, 3])
+@pytest.mark.parametrize('start_day', [2, 30]) # Before and after a full lag of history
+def test_incremental_features_match_full_recompute(start_day, days_per_step):
+    dates = np.sort(HISTORY['Date'].unique())
+    known = HISTORY[HISTORY['Date'] < dates[start_day]]
+    rows = add_advanced_features(known)
+    tail = build_feature_tail(rows)
+    for lo in range(start_day, len(dates), days_per_step):
+        step = HISTORY[HISTORY['Date'].isin(dates[lo:lo + days_per_step])]
+        new_rows, tail = add_incremental_features(step, tail)
+        rows = pd.concat([rows, new_rows], ignore_index=True)
+    assert_features_match(rows, add_advanced_features(HISTORY))
+
+def test_advance_day_features_match_full_recompute(tmp_path):
+    engine = SimulationEngine(store_dir=str(tmp_path / 'history'), seed=5)
+    for _ in range(3):
+        engine.advance_day()
+    df = engine.data
+    assert_features_match(df, add_advanced_features(df.drop(columns=FEATURES)))
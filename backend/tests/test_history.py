@@ -0,0 +1,23 @@
+import pandas as pd
+from src.history import History
+
+def block(start, n):
+    return pd.DataFrame({'ATM_ID': range(start, start + n), 'Net_Cash_Flow': range(n)})
+
+def test_frame_leaves_shared_blocks_alone():
+    history = History.from_frame(block(0, 8)).append(block(8, 2)).append(block(10, 1))
+    blocks = history.blocks
+    fork = history.append(block(11, 1)) # Shares the blocks, as a session fork does
+    fork_blocks = fork.blocks
+    df = history.frame()
+    assert history.blocks is blocks and fork.blocks == fork_blocks
+    assert df['ATM_ID'].tolist() == list(range(11))
+    assert history.frame() is df
+    assert fork.frame()['ATM_ID'].tolist() == list(range(12))
+
+def test_append_starts_from_the_memoized_frame():
+    history = History.from_frame(block(0, 8)).append(block(8, 2)).append(block(10, 1))
+    df = history.frame()
+    nxt = history.append(block(11, 1))
+    assert nxt.blocks[0] is df
+    assert len(nxt) == 12 and nxt.frame()['ATM_ID'].tolist() == list(range(12))
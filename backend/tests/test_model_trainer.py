@@ -0,0 +1,30 @@
+import pytest
+import xgboost as xgb
+from src.data_generator import generate_fleet_data
+from src.features import MODEL_FEATURES, add_advanced_features
+from src.model_trainer import (
+    continue_training, learning_rate_of, load_model, model_from_bytes, model_to_bytes, save_model
+)
+
+HISTORY = add_advanced_features(generate_fleet_data(n_days=60, n_atms=4))
+
+@pytest.fixture(scope='module')
+def model():
+    return xgb.XGBRegressor(n_estimators=10, learning_rate=0.2, max_depth=3).fit(
+        HISTORY[MODEL_FEATURES], HISTORY['Net_Cash_Flow'])
+
+def test_learning_rate_survives_serialization(model, tmp_path):
+    assert learning_rate_of(model) == pytest.approx(0.2)
+    assert learning_rate_of(model_from_bytes(model_to_bytes(model))) == pytest.approx(0.2)
+    save_model(model, str(tmp_path / 'model.json'))
+    assert learning_rate_of(load_model(str(tmp_path / 'model.json'))) == pytest.approx(0.2)
+
+def test_continue_training_derives_its_rate_from_the_model(model):
+    loaded = model_from_bytes(model_to_bytes(model))
+    once = continue_training(loaded, HISTORY.tail(40), n_rounds=2)
+    assert once.get_params()['learning_rate'] == pytest.approx(0.1)
+    assert learning_rate_of(once) == pytest.approx(0.2)
+    twice = continue_training(model_from_bytes(model_to_bytes(once)), HISTORY.tail(40), n_rounds=2)
+    assert twice.get_params()['learning_rate'] == pytest.approx(0.1) # Not compounded
+    explicit = continue_training(loaded, HISTORY.tail(40), n_rounds=2, learning_rate=0.01)
+    assert explicit.get_params()['learning_rate'] == 0.01
@@ -0,0 +1,41 @@
+import json
+from src.push_feed import diff_payload, encode_event
+
+def payload(date, flows, chart_dates, error=False):
+    """A dashboard payload ({"status", "forecast"}) with one row per ATM in `flows`."""
+    forecast = {"error": "Model is still loading or training"} if error else {
+        "network_status": [{"atm_id": atm_id, "net_flow": flow, "status": "STABLE"} for atm_id, flow in flows.items()],
+        "rebalancing_schedule": [],
+    }
+    return {
+        "status": {"date": date, "total_cash_flow": sum(flows.values()),
+                   "chart_data": [{"date": d, "net_flow": 1} for d in chart_dates], "config": {"risk": "moderate"}},
+        "forecast": forecast,
+    }
+
+def test_delta_has_only_changes():
+    old = payload('2026-01-07', {0: 10, 1: 20}, ['2026-01-06', '2026-01-07'])
+    new = payload('2026-01-08', {0: 10, 1: 25}, ['2026-01-07', '2026-01-08'])
+    delta = diff_payload(old, new)
+    assert delta['status'] == {"date": '2026-01-08', "total_cash_flow": 35}
+    assert delta['chart_append'] == [{"date": '2026-01-08', "net_flow": 1}]
+    assert delta['network_status'] == [{"atm_id": 1, "net_flow": 25, "status": "STABLE"}]
+    assert delta['forecast'] == {}
+
+def test_unchanged_payload_gives_empty_delta():
+    old = payload('2026-01-07', {0: 10}, ['2026-01-07'])
+    delta = diff_payload(old, payload('2026-01-07', {0: 10}, ['2026-01-07']))
+    assert delta == {"status": {}, "chart_append": [], "forecast": {}, "network_status": []}
+
+def test_snapshot_needed():
+    base = payload('2026-01-07', {0: 10, 1: 20}, ['2026-01-07'])
+    assert diff_payload(base, payload('2025-01-01', {0: 10, 1: 20}, ['2025-01-01'])) is None # Reset
+    assert diff_payload(base, payload('2026-01-08', {0: 10}, ['2026-01-08'])) is None        # ATM removed
+    assert diff_payload(base, payload('2026-01-08', {0: 10, 2: 20}, ['2026-01-08'])) is None # ATM replaced
+    assert diff_payload(base, payload('2026-01-08', {}, [], error=True)) is None              # Model unloaded
+    assert diff_payload(payload('2026-01-07', {}, [], error=True), base) is None              # Model loaded
+
+def test_encode_event():
+    message = encode_event('delta', 7, {"a": 1})
+    assert message == b'id: 7\nevent: delta\ndata: {"a":1}\n\n'
+    assert json.loads(message.split(b'data: ')[1]) == {"a": 1}
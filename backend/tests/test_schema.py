@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+from src.data_generator import generate_fleet_data
+from src.features import add_advanced_features, build_feature_tail
+from src.history_store import ColumnLogStore
+from src.model_trainer import train_model
+from src.optimizer import forecast_horizon
+from src.schema import COMPACT_DTYPES, LOCATION_TYPES, compact_frame
+
+WIDE = add_advanced_features(generate_fleet_data(n_days=90, n_atms=6, compact=False), compact=False)
+
+def assert_compact(df):
+    for col, dtype in COMPACT_DTYPES.items():
+        assert str(df[col].dtype) == dtype, col
+    assert list(df['Location_Type'].cat.categories[:len(LOCATION_TYPES)]) == LOCATION_TYPES
+
+def test_compact_frame_round_trips_dtypes():
+    compact = compact_frame(WIDE)
+    assert_compact(compact)
+    assert compact_frame(compact) is compact # Already compact: unchanged
+    assert compact['Location_Type'].astype(str).tolist() == WIDE['Location_Type'].tolist()
+    numeric = [col for col in COMPACT_DTYPES if col != 'Location_Type']
+    np.testing.assert_allclose(compact[numeric].to_numpy(np.float64), WIDE[numeric].to_numpy(np.float64), rtol=1e-6)
+    wide_again = compact.astype({col: WIDE[col].dtype for col in COMPACT_DTYPES})
+    pd.testing.assert_frame_equal(wide_again, WIDE, check_exact=False, rtol=1e-6)
+
+def test_compact_frame_keeps_forecasts():
+    forecasts = []
+    for df in (WIDE, compact_frame(WIDE)):
+        model, _ = train_model(df)
+        forecasts.append(forecast_horizon(model, build_feature_tail(df), 7)[2])
+    assert np.abs(forecasts[0] - forecasts[1]).max() <= 1.0 # Rupees
+
+def test_store_reload_keeps_compact_dtypes(tmp_path):
+    store = ColumnLogStore(str(tmp_path / 'history'))
+    compact = compact_frame(WIDE)
+    store.write(compact.iloc[:300])
+    store.append(compact.iloc[300:])
+    loaded = store.load()
+    assert_compact(loaded)
+    pd.testing.assert_frame_equal(loaded, compact.reset_index(drop=True))
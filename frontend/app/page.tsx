@@ -30,6 +30,8 @@ const COLORS = {
 
 const PIE_COLORS = ['#00d09c', '#5367ff', '#ffb33e'];
 
+const API_URL = process.env.NEXT_PUBLIC_API_URL ?? 'http://localhost:8000';
+
 // Types
 interface Config {
   risk_tolerance: string;
@@ -73,38 +75,54 @@ export default function Home() {
   const [isPlaying, setIsPlaying] = useState(false);
   const [activeTab, setActiveTab] = useState<'overview' | 'logistics' | 'network'>('overview');
   const [error, setError] = useState('');
+  const [streamKey, setStreamKey] = useState(0); // Bumped to reconnect the live stream
+  // A dashboard opened with ?session=<id> follows that simulation session (see /sessions)
+  const [session] = useState(() => typeof window === 'undefined' ? null : new URLSearchParams(window.location.search).get('session'));
 
-  const fetchData = async () => {
-    try {
-      const statusRes = await fetch('http://localhost:8000/network-status');
-      if (!statusRes.ok) throw new Error('Backend Offline');
-      const statusData = await statusRes.json();
-      setStatus(statusData);
-
-      const predictRes = await fetch('http://localhost:8000/predict', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({})
-      });
-      const predictData = await predictRes.json();
-      setOptimization(predictData);
+  const api = (path: string, init: RequestInit = {}) => fetch(`${API_URL}${path}`, {
+    ...init,
+    headers: { ...(init.headers as Record<string, string>), ...(session ? { 'X-Session-ID': session } : {}) }
+  });
+
+  // Live updates: the backend pushes a snapshot, then a compact delta after every change
+  useEffect(() => {
+    // EventSource cannot send headers: the session goes in the query string
+    const source = new EventSource(`${API_URL}/stream${session ? `?session=${encodeURIComponent(session)}` : ''}`);
+    source.addEventListener('snapshot', (e) => {
+      const { status, forecast } = JSON.parse((e as MessageEvent).data);
+      setStatus(status);
+      setOptimization(forecast.error ? null : forecast);
       setError('');
-    } catch (err) {
-      setError('System Connection Lost');
-    } finally {
       setLoading(false);
-    }
-  };
-
-  useEffect(() => { fetchData(); }, []);
+    });
+    source.addEventListener('delta', (e) => {
+      const delta = JSON.parse((e as MessageEvent).data);
+      setStatus((prev) => prev && {
+        ...prev,
+        ...delta.status,
+        chart_data: [...prev.chart_data, ...delta.chart_append].slice(-30)
+      });
+      setOptimization((prev: any) => {
+        if (!prev) return prev;
+        const changed = new Map(delta.network_status.map((row: any) => [row.atm_id, row]));
+        return {
+          ...prev,
+          ...delta.forecast,
+          network_status: prev.network_status.map((row: any) => changed.get(row.atm_id) ?? row)
+        };
+      });
+    });
+    source.onerror = () => setError('System Connection Lost'); // EventSource reconnects by itself
+    source.onopen = () => setError('');
+    return () => source.close();
+  }, [session, streamKey]);
 
   useEffect(() => {
     let interval: NodeJS.Timeout;
     if (isPlaying && !processing) {
       interval = setInterval(async () => {
         setProcessing(true);
-        await fetch('http://localhost:8000/simulate/advance', { method: 'POST' });
-        await fetchData();
+        await api('/simulate/advance', { method: 'POST' });
         setProcessing(false);
       }, 1500);
     }
@@ -116,7 +134,7 @@ export default function Home() {
     setLoadingDetail(true);
     setModalTab('liquidity');
     try {
-      const res = await fetch(`http://localhost:8000/atm/${id}`);
+      const res = await api(`/atm/${id}`);
       const data = await res.json();
       setATMDetail(data);
     } finally { setLoadingDetail(false); }
@@ -257,12 +275,11 @@ export default function Home() {
                           key={l}
                           onClick={async () => {
                             setProcessing(true);
-                            await fetch('http://localhost:8000/config', {
+                            await api('/config', {
                               method: 'POST',
                               headers: { 'Content-Type': 'application/json' },
                               body: JSON.stringify({ risk_tolerance: l })
                             });
-                            await fetchData();
                             setProcessing(false);
                           }}
                           className={`w-full flex items-center justify-between px-4 py-4 rounded-xl border transition-all ${status?.config.risk_tolerance === l ? 'bg-[#00d09c0a] border-[#00d09c40] text-white shadow-[0_0_30px_#00d09c05]' : 'bg-[#0b0d10] border-[#ffffff08] text-[#8b949e]'}`}
@@ -305,7 +322,7 @@ export default function Home() {
                     <button
                       key={evt.id}
                       onClick={async () => {
-                        await fetch('http://localhost:8000/simulate/event', {
+                        await api('/simulate/event', {
                           method: 'POST',
                           headers: { 'Content-Type': 'application/json' },
                           body: JSON.stringify({ type: evt.id })
@@ -335,7 +352,7 @@ export default function Home() {
                     <h3 className="text-xl font-black mb-1">Logistics & Rebalancing</h3>
                     <p className="text-xs text-[#8b949e]">Recommended actions to prevent stockouts and minimize costs</p>
                   </div>
-                  <button onClick={fetchData} className="p-3 bg-[#1c222b] hover:bg-[#252c38] rounded-2xl transition-all"><History size={20} /></button>
+                  <button onClick={() => setStreamKey((k) => k + 1)} title="Reconnect (fresh snapshot)" className="p-3 bg-[#1c222b] hover:bg-[#252c38] rounded-2xl transition-all"><History size={20} /></button>
                 </div>
 
                 {!optimization?.rebalancing_schedule.length ? (